@@ -1,128 +1,205 @@
 import streamlit as st
-import json
+import math
 import os
 import re
-import time
-from datetime import datetime
+import uuid
+from datetime import datetime, time as dt_time, timedelta
+import metrics
+from archive import get_archive, maybe_archive
+from backpressure import WriteQueueFull, allow_message, get_write_queue
+from live_updates import list_changed, live_fragment, load_older, rerun, synced_messages, versioned
+from models import Message, Role, Ticket, format_ts
+from ticket_store import get_ticket_store
 
 # --------------------------
 # CONFIG
 # --------------------------
-CHAT_FILE = "support_chat.json"
-REFRESH_INTERVAL = 2  # seconds
+CHAT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "support_chat.json")
+REFRESH_INTERVAL = 2  # seconds between live-update checks
+MESSAGE_PAGE_SIZE = 30  # messages shown per conversation page
+TICKET_PAGE_SIZE = 20  # tickets listed per page
+STATS_DAYS = 7  # days shown in the sidebar ticket counts
+SEARCH_RESULTS = 20  # message hits shown per search
 ADMIN_KEY = "pranay@8503"
 
 TICKET_REGEX = re.compile(r"^TCKT-\d{8}-[A-Z0-9]{6}$")
 
+ticket_store = get_ticket_store(CHAT_FILE)
+# Writes go through the process-wide bounded queue (see backpressure.py)
+write_queue = get_write_queue(ticket_store)
+# Closed tickets older than ARCHIVE_AFTER_DAYS live here (see archive.py)
+ticket_archive = get_archive(CHAT_FILE)
+
 st.set_page_config(page_title="💬 Live Tech Support", page_icon="💬", layout="wide")
 
+# Per-rerun timings (see metrics.py). cProfile is on with METRICS_PROFILE=1,
+# or for an admin session opened with ?profile=1 (set below, once the admin
+# key has been entered, so it applies from the next rerun)
+rerun_metrics = metrics.Rerun(
+    "admin",
+    st.session_state.setdefault("metrics_session", uuid.uuid4().hex[:8]),
+    profile=st.session_state.get("metrics_profile", False),
+)
+
 
 # --------------------------
 # Helpers: load/save
 # --------------------------
-def load_raw():
-    if not os.path.exists(CHAT_FILE):
-        return {}
+# The store is migrated to the current schema once (see migrations.py), so
+# reads here are read-only and need no normalization.
+def load_ticket_meta(ticket_id):
+    # Status/created_at only; messages are read page by page below
+    return versioned(ticket_store, ticket_id, f"ticket_meta_{ticket_id}", lambda: ticket_store.get_ticket_meta(ticket_id))
+
+
+def load_message_window(ticket_id):
+    # Newest MESSAGE_PAGE_SIZE messages plus whatever "Load older" added;
+    # refreshes fetch only messages after the last seen seq
+    return synced_messages(ticket_store, ticket_id, f"msg_window_{ticket_id}", tail=MESSAGE_PAGE_SIZE)
+
+
+def save_chat_message(ticket_id, message):
+    # False (with a warning shown) when the write queue is full
     try:
-        with open(CHAT_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        write_queue.append_message(ticket_id, message)
+    except WriteQueueFull:
+        st.warning("⏳ The ticket store is busy. Please send again in a few seconds.")
+        return False
     except Exception:
-        return {}
-
-
-def normalize_data(raw):
-    if raw is None:
-        return {}
-    if isinstance(raw, list):
-        new_ticket = f"TCKT-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        return {
-            new_ticket: {
-                "messages": [
-                    m if isinstance(m, dict) else {"role": "user", "text": str(m), "time": ""}
-                    for m in raw
-                ],
-                "closed": False,
-                "created_at": str(datetime.now()),
-            }
-        }
-
-    if isinstance(raw, dict):
-        normalized = {}
-        for k, v in raw.items():
-            if isinstance(v, list):
-                messages = []
-                for m in v:
-                    if isinstance(m, dict):
-                        role = m.get("role", "user")
-                        text = m.get("text", m.get("message", str(m)))
-                        time_str = m.get("time", m.get("timestamp", ""))
-                        messages.append({"role": role, "text": text, "time": time_str})
-                    else:
-                        messages.append({"role": "user", "text": str(m), "time": ""})
-                normalized[k] = {
-                    "messages": messages,
-                    "closed": False,
-                    "created_at": str(datetime.now()),
-                }
-                continue
-
-            if isinstance(v, dict):
-                if "messages" in v:
-                    messages_raw = v.get("messages", [])
-                    messages = []
-                    for m in messages_raw:
-                        if isinstance(m, dict):
-                            role = m.get("role", "user")
-                            text = m.get("text", m.get("message", str(m)))
-                            time_str = m.get("time", m.get("timestamp", ""))
-                            messages.append({"role": role, "text": text, "time": time_str})
-                        else:
-                            messages.append({"role": "user", "text": str(m), "time": ""})
-                    closed = bool(v.get("closed", False))
-                    created_at = v.get("created_at", str(datetime.now()))
-                    normalized[k] = {
-                        "messages": messages,
-                        "closed": closed,
-                        "created_at": created_at,
-                    }
-                    continue
-                else:
-                    maybe_list = []
-                    for _, sub_v in v.items():
-                        if isinstance(sub_v, dict):
-                            role = sub_v.get("role", "user")
-                            text = sub_v.get("text", sub_v.get("message", str(sub_v)))
-                            time_str = sub_v.get("time", sub_v.get("timestamp", ""))
-                            maybe_list.append({"role": role, "text": text, "time": time_str})
-                        else:
-                            maybe_list.append({"role": "user", "text": str(sub_v), "time": ""})
-                    if maybe_list:
-                        normalized[k] = {
-                            "messages": maybe_list,
-                            "closed": False,
-                            "created_at": str(datetime.now()),
-                        }
-                        continue
+        st.error("⚠️ The message could not be saved. Please send it again.")
+        return False
+    return True
+
+
+def close_chat(ticket_id):
+    try:
+        write_queue.close_ticket(ticket_id)
+    except WriteQueueFull:
+        st.warning("⏳ The ticket store is busy. Please try again in a few seconds.")
+        return False
+    except Exception:
+        st.error("⚠️ The ticket could not be closed. Please try again.")
+        return False
+    return True
+
+
+def render_messages(messages, user_label):
+    for msg in messages:
+        sender = user_label if msg.role is Role.USER else "👨‍💻 Admin"
+        bg = "#f0f2f6" if sender.startswith("🧑") else "#e8f5e9"
+        st.markdown(
+            f"<div style='background:{bg};padding:10px;border-radius:8px;margin:6px 0;'>"
+            f"<b>{sender}:</b> {msg.text}"
+            f"<div style='font-size:11px;color:#666;margin-top:6px;'>{format_ts(msg.ts)}</div></div>",
+            unsafe_allow_html=True,
+        )
+
 
-            normalized[k] = {
-                "messages": [{"role": "user", "text": str(v), "time": ""}],
-                "closed": False,
-                "created_at": str(datetime.now()),
-            }
-        return normalized
-    return {}
+def render_conversation(ticket_id, user_label):
+    with metrics.phase("admin", "load_messages"):
+        window = load_message_window(ticket_id)
+    if window["has_older"] and st.button("⬆️ Load older messages", key=f"older_{ticket_id}"):
+        load_older(ticket_store, ticket_id, f"msg_window_{ticket_id}", MESSAGE_PAGE_SIZE)
+    with metrics.phase("admin", "render_messages"):
+        render_messages(window["messages"], user_label)
+
+
+def ticket_picker(closed, key, source=None):
+    # One page of ticket ids, filtered by the search box, with prev/next.
+    # source defaults to the hot store; pass ticket_archive for archived tickets.
+    # Open tickets come most recently active first, straight off the store's
+    # activity index, so a page costs the same however many tickets exist
+    source = source or ticket_store
+    query = st.text_input("🔎 Search ticket ID", key=f"{key}_query").strip()
+    cursors_key = f"{key}_cursors"
+    if st.session_state.get(f"{key}_last_query") != query:
+        st.session_state[f"{key}_last_query"] = query
+        st.session_state[cursors_key] = [None]
+    cursors = st.session_state.setdefault(cursors_key, [None])
+    if source is ticket_store and not closed:
+        page = ticket_store.list_active_page(after=cursors[-1], limit=TICKET_PAGE_SIZE, query=query or None)
+    elif source is ticket_store:
+        page = ticket_store.list_tickets_page(closed=closed, after=cursors[-1], limit=TICKET_PAGE_SIZE, query=query or None)
+    else:
+        page = source.list_tickets_page(after=cursors[-1], limit=TICKET_PAGE_SIZE, query=query or None)
+
+    prev_col, next_col = st.columns(2)
+    with prev_col:
+        if len(cursors) > 1 and st.button("◀ Prev", key=f"{key}_prev"):
+            cursors.pop()
+            rerun()
+    with next_col:
+        if page.next_cursor is not None and st.button("Next ▶", key=f"{key}_next"):
+            cursors.append(page.next_cursor)
+            rerun()
+    return page.ticket_ids
 
 
-def load_chat():
-    raw = load_raw()
-    normalized = normalize_data(raw)
-    save_chat(normalized)
-    return normalized
+# --------------------------
+# Live updates
+# --------------------------
+@live_fragment(REFRESH_INTERVAL)
+def live_conversation(ticket_id, user_label, was_closed):
+    ticket_info = load_ticket_meta(ticket_id) or Ticket(ticket_id)
+    if ticket_info.closed != was_closed:
+        # Status changed elsewhere; the reply controls need a full rerun
+        rerun()
+    render_conversation(ticket_id, user_label)
+
+
+def render_ticket_stats():
+    # Maintained counters only: O(STATS_DAYS), not O(tickets)
+    counts = ticket_store.ticket_counts()
+    st.sidebar.markdown("### 📊 Tickets")
+    st.sidebar.markdown(f"**Open:** {counts['open']} &nbsp; **Closed:** {counts['closed']} &nbsp; "
+                        f"**Archived:** {len(ticket_archive)}")
+    days = ticket_store.daily_counts(STATS_DAYS)
+    if days:
+        st.sidebar.table([{"Day": d.day, "Opened": d.opened, "Closed": d.closed} for d in days])
+
+
+def render_search():
+    # Full-text search over every message (see ticket_search.py)
+    with st.expander("🔎 Search conversations", expanded=bool(st.session_state.get("search_query"))):
+        query_col, status_col, dates_col = st.columns([2.4, 1.2, 1.6])
+        with query_col:
+            query = st.text_input("Message text", key="search_query").strip()
+        with status_col:
+            status = st.radio("Status", ["All", "Open", "Closed"], horizontal=True, key="search_status")
+        with dates_col:
+            dates = st.date_input("Date range", value=(), key="search_dates")
+        if not query:
+            return
+        since = until = None
+        if len(dates) >= 1:
+            since = datetime.combine(dates[0], dt_time.min).timestamp()
+        if len(dates) == 2:
+            until = datetime.combine(dates[1] + timedelta(days=1), dt_time.min).timestamp()
+        closed = {"All": None, "Open": False, "Closed": True}[status]
+        with metrics.phase("admin", "search"):
+            hits = ticket_store.search_messages(query, closed, since, until, SEARCH_RESULTS)
+        if not hits:
+            st.info("No messages match.")
+            return
+        for hit in hits:
+            who = "🧑 User" if hit.role == "user" else "👨‍💻 Admin"
+            state = "Closed" if hit.closed else "Open"
+            st.markdown(
+                f"<div style='padding:6px 0;border-bottom:1px solid #eee;'>"
+                f"<code>{hit.ticket_id}</code> — {state} · {who} · "
+                f"<span style='color:#666;font-size:12px;'>{format_ts(hit.ts)}</span><br>{hit.snippet}</div>",
+                unsafe_allow_html=True,
+            )
+        ticket_ids = list(dict.fromkeys(hit.ticket_id for hit in hits))
+        picked = st.selectbox("Open conversation", ["-- select --"] + ticket_ids, key="search_pick")
+        if picked != "-- select --":
+            render_conversation(picked, "🧑 User")
 
 
-def save_chat(data):
-    with open(CHAT_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+@live_fragment(REFRESH_INTERVAL)
+def watch_ticket_list():
+    if list_changed(ticket_store, "admin_list_version"):
+        rerun()
 
 
 # --------------------------
@@ -132,35 +209,35 @@ st.title("💬 Live Tech Support")
 ticket_or_key = st.text_input("🔑 Enter Ticket ID ")
 
 if not ticket_or_key:
+    rerun_metrics.finish()
     st.stop()
 
 ticket_or_key = ticket_or_key.strip()
 is_admin = ticket_or_key == ADMIN_KEY
-data = load_chat()
+st.session_state.metrics_profile = is_admin and st.query_params.get("profile") == "1"
 
 if not is_admin and not TICKET_REGEX.match(ticket_or_key):
     st.error("Please enter a correct Ticket ID")
+    rerun_metrics.finish()
     st.stop()
 
-if not is_admin:
-    if ticket_or_key not in data:
-        data[ticket_or_key] = {"messages": [], "closed": False, "created_at": str(datetime.now())}
-        save_chat(data)
-
-open_tickets = [tid for tid, info in data.items() if not info.get("closed")]
-closed_tickets = [tid for tid, info in data.items() if info.get("closed")]
-
 # --------------------------
 # Admin Mode
 # --------------------------
 if is_admin:
-    if "admin_selected_ticket" not in st.session_state or st.session_state.admin_selected_ticket not in open_tickets:
-        st.session_state.admin_selected_ticket = open_tickets[0] if open_tickets else None
-
+    with metrics.phase("admin", "ticket_stats"):
+        render_ticket_stats()
+    render_search()
     left_col, mid_col, right_col = st.columns([1.2, 2.6, 1.2])
 
     with left_col:
         st.markdown("### 📂 Open Tickets")
+        with metrics.phase("admin", "open_list"):
+            open_tickets = ticket_picker(closed=False, key="open_page")
+
+        if "admin_selected_ticket" not in st.session_state or st.session_state.admin_selected_ticket not in open_tickets:
+            st.session_state.admin_selected_ticket = open_tickets[0] if open_tickets else None
+
         if not open_tickets:
             st.info("No open tickets.")
         else:
@@ -176,45 +253,46 @@ if is_admin:
 
     with right_col:
         st.markdown("### 📦 Closed Tickets")
+        # Hourly at most, off the render path: move old closed tickets to the
+        # cold archive
+        maybe_archive(ticket_store, CHAT_FILE)
+        tier = st.radio("Show", ["Recent", "Archived"], horizontal=True, key="closed_tier")
+        archived_view = tier == "Archived"
+        with metrics.phase("admin", "closed_list"):
+            if archived_view:
+                closed_tickets = ticket_picker(closed=True, key="archived_page", source=ticket_archive)
+            else:
+                closed_tickets = ticket_picker(closed=True, key="closed_page")
         if not closed_tickets:
-            st.info("No closed tickets.")
+            st.info("No archived tickets." if archived_view else "No closed tickets.")
         else:
             sel_closed = st.selectbox(
-                "View closed ticket (read-only):", options=["-- select --"] + closed_tickets, index=0, key="closed_select"
+                "View closed ticket (read-only):",
+                options=["-- select --"] + closed_tickets,
+                index=0,
+                key="archived_select" if archived_view else "closed_select",
             )
             if sel_closed and sel_closed != "-- select --":
                 st.markdown(f"#### Viewing Closed Ticket `{sel_closed}`")
-                tinfo = data.get(sel_closed, {"messages": [], "closed": True, "created_at": ""})
-                for msg in tinfo.get("messages", []):
-                    sender = "🧑 User" if msg.get("role") == "user" else "👨‍💻 Admin"
-                    bg = "#f0f2f6" if sender.startswith("🧑") else "#e8f5e9"
-                    st.markdown(
-                        f"<div style='background:{bg};padding:10px;border-radius:8px;margin:6px 0;'>"
-                        f"<b>{sender}:</b> {msg.get('text')}"
-                        f"<div style='font-size:11px;color:#666;margin-top:6px;'>{msg.get('time','')}</div></div>",
-                        unsafe_allow_html=True,
-                    )
+                if archived_view:
+                    # One seek + decompress of this ticket's archive record
+                    archived = ticket_archive.get_ticket(sel_closed)
+                    render_messages(archived.messages if archived else [], "🧑 User")
+                else:
+                    render_conversation(sel_closed, "🧑 User")
 
     with mid_col:
         selected = st.session_state.admin_selected_ticket
         if not selected:
             st.info("No open ticket selected.")
         else:
-            ticket_info = data.get(selected, {"messages": [], "closed": False, "created_at": ""})
-            status = "Closed" if ticket_info.get("closed") else "Open"
+            ticket_info = load_ticket_meta(selected) or Ticket(selected)
+            status = "Closed" if ticket_info.closed else "Open"
             st.markdown(f"### 💬 Ticket: `{selected}` — **{status}**")
 
-            for msg in ticket_info.get("messages", []):
-                sender = "🧑 User" if msg.get("role") == "user" else "👨‍💻 Admin"
-                bg = "#f0f2f6" if sender.startswith("🧑") else "#e8f5e9"
-                st.markdown(
-                    f"<div style='background:{bg};padding:10px;border-radius:8px;margin:6px 0;'>"
-                    f"<b>{sender}:</b> {msg.get('text')}"
-                    f"<div style='font-size:11px;color:#666;margin-top:6px;'>{msg.get('time','')}</div></div>",
-                    unsafe_allow_html=True,
-                )
-
-            if ticket_info.get("closed"):
+            live_conversation(selected, "🧑 User", ticket_info.closed)
+
+            if ticket_info.closed:
                 st.warning("This ticket has been closed. New messages are disabled.")
             else:
                 reply_key = f"admin_reply_{selected}"
@@ -226,25 +304,17 @@ if is_admin:
                     if st.button("Send Reply", key=f"send_{selected}"):
                         reply_text = st.session_state.get(reply_key, "").strip()
                         if reply_text:
-                            ticket_info.setdefault("messages", []).append(
-                                {"role": "admin", "text": reply_text, "time": str(datetime.now())}
-                            )
-                            data[selected] = ticket_info
-                            save_chat(data)
-                            st.success(f"Reply sent to `{selected}`.")
-                            st.session_state.pop(reply_key, None)
-                            st.query_params.update({"refresh": str(time.time())})
-                            st.stop()
+                            with metrics.phase("admin", "save_message"):
+                                saved = save_chat_message(selected, Message(Role.ADMIN, reply_text))
+                            if saved:
+                                st.session_state.pop(reply_key, None)
+                                rerun()
                         else:
                             st.warning("Reply cannot be empty.")
                 with col_b:
                     if st.button("Close Ticket", key=f"close_{selected}"):
-                        ticket_info["closed"] = True
-                        data[selected] = ticket_info
-                        save_chat(data)
-                        st.warning(f"🎟️ Ticket `{selected}` marked closed.")
-                        st.query_params.update({"refresh": str(time.time())})
-                        st.stop()
+                        if close_chat(selected):
+                            rerun()
 
 # --------------------------
 # User Mode
@@ -252,21 +322,18 @@ if is_admin:
 else:
     st.markdown("### 💬 Live Chat")
     ticket_id = ticket_or_key
-    ticket_info = data.get(ticket_id, {"messages": [], "closed": False, "created_at": str(datetime.now())})
-    status = "Closed" if ticket_info.get("closed") else "Open"
+    ticket_info = load_ticket_meta(ticket_id)
+    archived = ticket_archive.get_ticket(ticket_id) if ticket_info is None else None
+    ticket_info = ticket_info or archived or Ticket(ticket_id)
+    status = "Closed" if ticket_info.closed else "Open"
     st.markdown(f"#### Ticket: `{ticket_id}` — **{status}**")
 
-    for msg in ticket_info.get("messages", []):
-        sender = "🧑 You" if msg.get("role") == "user" else "👨‍💻 Admin"
-        bg = "#f0f2f6" if sender.startswith("🧑") else "#e8f5e9"
-        st.markdown(
-            f"<div style='background:{bg};padding:10px;border-radius:8px;margin:6px 0;'>"
-            f"<b>{sender}:</b> {msg.get('text')}"
-            f"<div style='font-size:11px;color:#666;margin-top:6px;'>{msg.get('time','')}</div></div>",
-            unsafe_allow_html=True,
-        )
+    if archived is not None:
+        render_messages(archived.messages, "🧑 You")
+    else:
+        live_conversation(ticket_id, "🧑 You", ticket_info.closed)
 
-    if ticket_info.get("closed"):
+    if ticket_info.closed:
         st.warning("This ticket has been closed by admin. New messages are disabled.")
     else:
         user_key = f"user_msg_{ticket_id}"
@@ -275,16 +342,16 @@ else:
         st.text_area("Type your message:", key=user_key, height=120)
         if st.button("Send Message", key=f"send_user_{ticket_id}"):
             msg_text = st.session_state.get(user_key, "").strip()
-            if msg_text:
-                ticket_info.setdefault("messages", []).append(
-                    {"role": "user", "text": msg_text, "time": str(datetime.now())}
-                )
-                data[ticket_id] = ticket_info
-                save_chat(data)
-                st.success("✅ Message sent!")
-                st.session_state.pop(user_key, None)
-                st.query_params.update({"refresh": str(time.time())})
-                st.stop()
+            wait = allow_message(ticket_id, st.session_state.metrics_session) if msg_text else 0.0
+            if wait:
+                # The text stays in the box for the next try
+                st.warning(f"⏳ You're sending messages too quickly. Please wait {math.ceil(wait)}s and send again.")
+            elif msg_text:
+                with metrics.phase("admin", "save_message"):
+                    saved = save_chat_message(ticket_id, Message(Role.USER, msg_text))
+                if saved:
+                    st.session_state.pop(user_key, None)
+                    rerun()
             else:
                 st.warning("Message cannot be empty.")
 
@@ -292,14 +359,11 @@ else:
 # Auto-refresh
 # --------------------------
 st.markdown(
-    f"<p style='color:gray;font-size:12px;text-align:center;'>Auto-refresh every {REFRESH_INTERVAL} seconds</p>",
+    f"<p style='color:gray;font-size:12px;text-align:center;'>Live updates: checked every {REFRESH_INTERVAL} seconds</p>",
     unsafe_allow_html=True,
 )
 
-if "last_refresh" not in st.session_state:
-    st.session_state["last_refresh"] = time.time()
-else:
-    if time.time() - st.session_state["last_refresh"] > REFRESH_INTERVAL:
-        st.session_state["last_refresh"] = time.time()
-        st.query_params.update({"refresh": str(time.time())})
-        st.stop()
+if is_admin:
+    watch_ticket_list()
+
+rerun_metrics.finish()
@@ -0,0 +1,245 @@
+import asyncio
+import hmac
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+import metrics
+from archive import get_archive
+from backpressure import WriteQueueFull, allow_message, get_write_queue
+from kb_cache import load_knowledge_base
+from models import Message, Role, dumps
+from qa_engine import NO_ANSWER, get_bot_response
+from ticket_store import get_ticket_store
+
+# ------------------------------
+# Async HTTP API
+# ------------------------------
+# Bot answers and ticket operations without a Streamlit rerun, on the same
+# retrieval (kb_cache/qa_engine) and ticket store as app.py/admin.py:
+#   GET  /answer?q=...&category=                 -> {"answer", "hit"}
+#   GET  /suggest?q=...&category=                -> {"suggestions"}
+#   GET  /tickets/{id}/messages?since=SEQ&limit= -> {"messages", "next"}
+#   POST /tickets/{id}/messages  {"text", "role"}
+#   POST /tickets/{id}/close
+#   GET  /metrics                               (Prometheus text, see metrics.py)
+# Connections are kept alive between requests. Writes go through the
+# process's backpressure.WriteQueue (as app.py's and admin.py's do), which
+# coalesces concurrent ones into one store transaction; requests wait for
+# it on WRITE_THREADS executor threads, so reads keep the default executor.
+# Posting is rate limited per ticket and per client address (429), and a
+# full or stalled write queue answers 503; both carry Retry-After (see
+# backpressure.py).
+# Run with `python api_server.py` (API_HOST / API_PORT). Closing tickets and
+# posting as admin need an X-Admin-Key matching API_ADMIN_KEY; without
+# API_ADMIN_KEY both are refused. Browsers on any origin may call the read
+# routes; ticket writes are only open cross-origin to API_CORS_ORIGIN.
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+CHAT_FILE = os.path.join(BASE_PATH, "support_chat.json")
+CSV_PATH = os.path.join(BASE_PATH, "multi_recruit_ai_full_qa.csv")
+
+TICKET_REGEX = re.compile(r"^TCKT-\d{8}-[A-Z0-9]{6}$")
+MAX_MESSAGE_CHARS = 4000
+MAX_PAGE = 200
+WRITE_THREADS = 32  # requests waiting on the write queue at once
+KEEPALIVE_TIMEOUT = 75
+
+
+def json_response(data, status=200):
+    return web.Response(body=dumps(data), status=status, content_type="application/json")
+
+
+def _retry_later(error_class, retry_after, text):
+    return error_class(text=text, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+def _ticket_id(request):
+    ticket_id = request.match_info["ticket_id"]
+    if not TICKET_REGEX.match(ticket_id):
+        raise web.HTTPBadRequest(text="invalid ticket id")
+    return ticket_id
+
+
+async def _json_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="invalid JSON body")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="expected a JSON object")
+    return body
+
+
+def _is_admin(request):
+    # No configured key means no admin access at all, never open access
+    admin_key = os.getenv("API_ADMIN_KEY")
+    if not admin_key:
+        return False
+    return hmac.compare_digest(request.headers.get("X-Admin-Key", "").encode(), admin_key.encode())
+
+
+async def answer(request):
+    if request.method == "POST":
+        body = await _json_body(request)
+        query = str(body.get("q", ""))
+        category = str(body.get("category") or "")
+    else:
+        query = request.query.get("q", "")
+        category = request.query.get("category", "")
+    if not query.strip():
+        raise web.HTTPBadRequest(text="missing q")
+    # A cold (or changed) KB is parsed by load_knowledge_base(): off the loop
+    with metrics.phase("api", "answer"):
+        response = await asyncio.get_running_loop().run_in_executor(None, _answer, query, category)
+    return json_response({"answer": response, "hit": response != NO_ANSWER})
+
+
+def _answer(query, category):
+    kb = load_knowledge_base(CSV_PATH)
+    return get_bot_response(query, kb.index, kb.category_index(category))
+
+
+async def suggest(request):
+    query = request.query.get("q", "")
+    category = request.query.get("category", "")
+    with metrics.phase("api", "suggest"):
+        found = await asyncio.get_running_loop().run_in_executor(None, _suggest, query, category)
+    return json_response({"suggestions": found})
+
+
+def _suggest(query, category):
+    kb = load_knowledge_base(CSV_PATH)
+    category_index = kb.category_index(category)
+    found = category_index.suggest(query) if category_index else []
+    return found or kb.index.suggest(query)
+
+
+async def get_messages(request):
+    ticket_id = _ticket_id(request)
+    try:
+        since = max(0, int(request.query.get("since", 0)))
+        limit = min(MAX_PAGE, max(1, int(request.query.get("limit", MAX_PAGE))))
+    except ValueError:
+        raise web.HTTPBadRequest(text="since/limit must be integers")
+    store = request.app["store"]
+    with metrics.phase("api", "get_messages"):
+        messages, next_since = await asyncio.get_running_loop().run_in_executor(
+            None, store.messages_since, ticket_id, since, limit
+        )
+    return json_response({"messages": [m.to_dict() for m in messages], "next": next_since})
+
+
+async def _write(app, submit, *args):
+    # WriteQueue.submit() blocks until the write is stored (or refused)
+    return await asyncio.get_running_loop().run_in_executor(app["write_executor"], submit, *args)
+
+
+def _is_closed(app, ticket_id):
+    # Archived tickets are closed ones moved out of the store (archive.py)
+    meta = app["store"].get_ticket_meta(ticket_id)
+    return (meta is not None and meta.closed) or (meta is None and ticket_id in app["archive"])
+
+
+async def post_message(request):
+    ticket_id = _ticket_id(request)
+    body = await _json_body(request)
+    text = str(body.get("text", "")).strip()
+    if not text or len(text) > MAX_MESSAGE_CHARS:
+        raise web.HTTPBadRequest(text="text must be 1-%d characters" % MAX_MESSAGE_CHARS)
+    role = Role.parse(body.get("role", "user"))
+    if role is Role.ADMIN and not _is_admin(request):
+        raise web.HTTPForbidden()
+    if await asyncio.get_running_loop().run_in_executor(None, _is_closed, request.app, ticket_id):
+        raise web.HTTPConflict(text="ticket is closed")
+    # Admin replies are not rate limited
+    wait = allow_message(ticket_id, request.remote) if role is Role.USER else 0.0
+    if wait:
+        raise _retry_later(web.HTTPTooManyRequests, wait, "slow down")
+    message = Message(role, text)
+    try:
+        with metrics.phase("api", "post_message"):
+            await _write(request.app, request.app["writer"].append_message, ticket_id, message)
+    except WriteQueueFull as e:
+        raise _retry_later(web.HTTPServiceUnavailable, e.retry_after, "busy, retry later")
+    return json_response({"ok": True, "message": message.to_dict()}, status=201)
+
+
+async def close_ticket(request):
+    ticket_id = _ticket_id(request)
+    if not _is_admin(request):
+        raise web.HTTPForbidden()
+    try:
+        with metrics.phase("api", "close_ticket"):
+            await _write(request.app, request.app["writer"].close_ticket, ticket_id)
+    except WriteQueueFull as e:
+        raise _retry_later(web.HTTPServiceUnavailable, e.retry_after, "busy, retry later")
+    return json_response({"ok": True})
+
+
+async def metrics_text(request):
+    return web.Response(text=metrics.prometheus_text(), content_type="text/plain")
+
+
+def _is_ticket_write(request):
+    method = request.method
+    if method == "OPTIONS":
+        method = request.headers.get("Access-Control-Request-Method", "")
+    return method == "POST" and request.path.startswith("/tickets/")
+
+
+@web.middleware
+async def cors(request, handler):
+    # Lets the widget call the API from the browser; preflight requests are
+    # answered here, before routing. Ticket writes (admin replies, closes)
+    # are only opened to an explicitly configured origin.
+    if request.method == "OPTIONS":
+        response = web.Response()
+    else:
+        response = await handler(request)
+    origin = os.getenv("API_CORS_ORIGIN")
+    if origin:
+        response.headers["Access-Control-Allow-Origin"] = origin
+        response.headers["Access-Control-Allow-Headers"] = "Content-Type, X-Admin-Key"
+        response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+    elif not _is_ticket_write(request):
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        response.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+    return response
+
+
+def create_app(chat_file=CHAT_FILE):
+    app = web.Application(middlewares=[cors])
+    app["store"] = get_ticket_store(chat_file)
+    app["archive"] = get_archive(chat_file)
+
+    app["writer"] = get_write_queue(app["store"])
+    app["write_executor"] = ThreadPoolExecutor(WRITE_THREADS, thread_name_prefix="api-write")
+
+    async def stop_writes(app):
+        app["write_executor"].shutdown(wait=False)
+
+    app.on_cleanup.append(stop_writes)
+    app.router.add_get("/answer", answer)
+    app.router.add_post("/answer", answer)
+    app.router.add_get("/suggest", suggest)
+    app.router.add_get("/tickets/{ticket_id}/messages", get_messages)
+    app.router.add_post("/tickets/{ticket_id}/messages", post_message)
+    app.router.add_post("/tickets/{ticket_id}/close", close_ticket)
+    app.router.add_get("/metrics", metrics_text)
+    return app
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    web.run_app(
+        create_app(),
+        host=os.getenv("API_HOST", "127.0.0.1"),
+        port=int(os.getenv("API_PORT", "8080")),
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
@@ -1,24 +1,20 @@
 import streamlit as st
-from PIL import Image
-import pandas as pd
-import json
+import math
 import os
 from dotenv import load_dotenv
 import streamlit.components.v1 as components
-import base64
 from pathlib import Path
 import time
 import uuid
-import webbrowser
-import requests
 
-# Try to import streamlit_lottie but don't crash if it's missing
-try:
-    from streamlit_lottie import st_lottie
-except Exception:
-    # Fallback no-op function so app continues to run without the package
-    def st_lottie(*args, **kwargs):
-        return None
+from archive import get_archive
+from assets import WIDGET_STATIC_PREFIX, build_widget, static_asset_url
+from backpressure import RATE_BURST, SESSION_RATE_PER_MINUTE, WriteQueueFull, allow_message, get_write_queue
+from kb_cache import load_knowledge_base
+from live_updates import live_fragment, synced_messages
+import metrics
+from models import Message, Role
+from ticket_store import get_ticket_store
 
 # ------------------------------
 # Setup
@@ -27,78 +23,55 @@ load_dotenv()
 base_path = os.path.dirname(os.path.abspath(__file__))
 chat_file = os.path.join(base_path, "support_chat.json")
 
-# Ensure chat file exists and uses the tickets structure
-if not os.path.exists(chat_file):
-    with open(chat_file, "w", encoding="utf-8") as f:
-        json.dump({"tickets": {}}, f, indent=2)
-
-# ------------------------------
-# Helper: Bot response logic
-# ------------------------------
-def get_bot_response(user_message: str, qa_records: list):
-    if not user_message:
-        return None
-    q = user_message.strip().lower()
-    for rec in qa_records:
-        if rec.get("question", "").strip().lower() == q:
-            return rec.get("answer", "")
-    for rec in qa_records:
-        if q in rec.get("question", "").strip().lower():
-            return rec.get("answer", "")
-    return "Sorry, I don’t have an answer for this."
+# Ticket store (SQLite by default, see ticket_store.py)
+ticket_store = get_ticket_store(chat_file)
+# Support messages are rate limited and written through a bounded queue
+# shared by every session in this process (see backpressure.py)
+write_queue = get_write_queue(ticket_store)
+# Closed tickets moved out of the store (see archive.py); they take no new messages
+ticket_archive = get_archive(chat_file)
 
 # ------------------------------
 # Page Config and Background
 # ------------------------------
 st.set_page_config(page_title="MultiRecruit AI", page_icon="🤖", layout="wide")
 
+# Per-rerun timings (see metrics.py); cProfile only with METRICS_PROFILE=1
+rerun_metrics = metrics.Rerun("app", st.session_state.setdefault("metrics_session", uuid.uuid4().hex[:8]))
+
 local_bg_path = Path(base_path) / "MR logo BG for Local host (1).png"
 github_bg_url = "https://raw.githubusercontent.com/pranaymultirecruit-source/multi-recruit-ai-app/main/MR%20logo%20BG%20for%20Local%20host%20(1).png"
 
 def set_background():
     if local_bg_path.exists():
-        # Local background (localhost)
-        with open(local_bg_path, "rb") as img_file:
-            encoded = base64.b64encode(img_file.read()).decode()
-        bg_ext = local_bg_path.suffix.replace(".", "")
-        st.markdown(
-            f"""
-            <style>
-            [data-testid="stAppViewContainer"] {{
-                background-image: url("data:image/{bg_ext};base64,{encoded}");
-                background-size: cover;
-                background-position: center;
-                background-repeat: no-repeat;
-                background-attachment: fixed;
-            }}
-            [data-testid="stHeader"], [data-testid="stToolbar"] {{
-                background: rgba(255, 255, 255, 0.2);
-            }}
-            </style>
-            """,
-            unsafe_allow_html=True
-        )
+        # Local background, recompressed once and served from app/static
+        try:
+            bg_url = static_asset_url(local_bg_path, "background")
+        except OSError:
+            bg_url = github_bg_url
     else:
         # Fallback for Streamlit Cloud (load from GitHub)
-        st.markdown(
-            f"""
-            <style>
-            [data-testid="stAppViewContainer"] {{
-                background-image: url("{github_bg_url}");
-                background-size: cover;
-                background-position: center;
-                background-repeat: no-repeat;
-                background-attachment: fixed;
-            }}
-            [data-testid="stHeader"], [data-testid="stToolbar"] {{
-                background: rgba(255, 255, 255, 0.2);
-            }}
-            </style>
-            """,
-            unsafe_allow_html=True
-        )
-
-set_background()
+        bg_url = github_bg_url
+    st.markdown(
+        f"""
+        <style>
+        [data-testid="stAppViewContainer"] {{
+            background-image: url("{bg_url}");
+            background-size: cover;
+            background-position: center;
+            background-repeat: no-repeat;
+            background-attachment: fixed;
+        }}
+        [data-testid="stHeader"], [data-testid="stToolbar"] {{
+            background: rgba(255, 255, 255, 0.2);
+        }}
+        </style>
+        """,
+        unsafe_allow_html=True
+    )
+
+with metrics.phase("app", "set_background"):
+    set_background()
 
 # ------------------------------
 # Title and Sidebar
@@ -106,302 +79,59 @@ set_background()
 st.title("MultiRecruit AI Assistant")
 st.write("Click the 🤖 bot (top-right) or one of the quick buttons to get instant help.")
 
-st.sidebar.radio(
-    "Select Category:",
-    ["🖥️ IT Helpdesk", "👨‍💼 Employee FAQ", "💼 Client FAQ", "🧑‍🎓 Job Seeker FAQ", "📚 Library"]
-)
+# Sidebar label -> KB category column value; "Library" searches everything
+CATEGORIES = {
+    "🖥️ IT Helpdesk": "it_helpdesk",
+    "👨‍💼 Employee FAQ": "employee_faq",
+    "💼 Client FAQ": "client_faq",
+    "🧑‍🎓 Job Seeker FAQ": "job_seeker_faq",
+    "📚 Library": None,
+}
+category = CATEGORIES[st.sidebar.radio("Select Category:", list(CATEGORIES))]
 
 # ------------------------------
 # Load CSV Q&A
 # ------------------------------
+# Parsed once per process and cached on the file's mtime/size (see kb_cache.py)
 csv_path = os.path.join(base_path, "multi_recruit_ai_full_qa.csv")
-qa_records = []
-if os.path.exists(csv_path):
-    try:
-        df = pd.read_csv(csv_path, encoding="utf-8", keep_default_na=False, on_bad_lines="skip")
-        if "question" in df.columns and "answer" in df.columns:
-            qa_records = df[["question", "answer"]].astype(str).to_dict(orient="records")
-        else:
-            st.error("CSV must have 'question' and 'answer' columns.")
-    except Exception as e:
-        st.error(f"Error reading CSV: {e}")
-else:
-    qa_records = [
-        {"question": "Forgot Password", "answer": "Go to your password reset page."},
-        {"question": "Laptop Not Turning On", "answer": "Hold the power button for 10 seconds."},
-        {"question": "Outlook Issue", "answer": "Restart Outlook and check your internet connection."},
-    ]
-
-qa_json_str = json.dumps(qa_records)
-
-# ------------------------------
-# Bot + Tech Support (HTML + JS) with waving robot emoji
-# ------------------------------
-# This HTML includes a CSS-based wave animation applied to the emoji.
-# It triggers once on load (a short hello wave) and also when the user clicks the bot.
-html_template = f"""
-<!doctype html>
-<html>
-<head>
-<meta charset="utf-8"/>
-<style>
-#bot-container {{
-  display: flex;
-  flex-direction: column;
-  align-items: center;
-  margin-top: 25px;
-}}
-#bot-button {{
-  width: 130px;
-  height: 130px;
-  border-radius: 50%;
-  background: radial-gradient(circle at 30% 30%, #00bcd4, #01579b);
-  box-shadow: 0 0 30px rgba(0,0,0,0.4);
-  cursor: pointer;
-  font-size: 70px;
-  display: flex;
-  justify-content: center;
-  align-items: center;
-  transition: transform 0.3s ease, box-shadow 0.3s ease;
-  position: relative;
-}}
-#bot-button:hover {{
-  transform: scale(1.15);
-  box-shadow: 0 0 40px rgba(0,0,0,0.6);
-}}
-#chat-box, #support-box {{
-  width: 400px;
-  height: 340px;
-  background: rgba(255,255,255,0.95);
-  border-radius: 15px;
-  box-shadow: 0 0 15px rgba(0,0,0,0.4);
-  padding: 12px;
-  margin-top: 20px;
-  display: none;
-  flex-direction: column;
-  font-family: sans-serif;
-}}
-#chat-log, #support-log {{
-  flex: 1;
-  overflow-y: auto;
-  margin-bottom: 8px;
-  font-size: 15px;
-}}
-.chat-message {{
-  background: #e3f2fd;
-  padding: 8px;
-  margin: 6px 0;
-  border-radius: 10px;
-}}
-.chat-message.bot {{
-  background: #e8f5e9;
-}}
-#controls, #support-controls {{
-  display: flex;
-  gap: 4px;
-}}
-input[type=text] {{
-  flex: 1;
-  padding: 10px;
-  border-radius: 6px;
-  border: 1px solid #ccc;
-  font-size: 15px;
-}}
-button {{
-  padding: 10px;
-  border-radius: 6px;
-  background: #0288d1;
-  color: #fff;
-  border: none;
-  cursor: pointer;
-}}
-#tech-btn {{
-  background: #43a047;
-  margin-top: 5px;
-  display: none;
-}}
-#back-btn {{
-  background: #f57c00;
-  margin-top: 5px;
-}}
-
-/* WAVE ANIMATION */
-.wave-emoji {{
-  display: inline-block;
-  transform-origin: 70% 70%;
-}}
-@keyframes wave {{
-  0% {{ transform: rotate(0deg); }}
-  10% {{ transform: rotate(-18deg); }}
-  20% {{ transform: rotate(14deg); }}
-  30% {{ transform: rotate(-12deg); }}
-  40% {{ transform: rotate(9deg); }}
-  50% {{ transform: rotate(-6deg); }}
-  60% {{ transform: rotate(4deg); }}
-  100% {{ transform: rotate(0deg); }}
-}}
-.wave-once {{
-  animation: wave 1.2s ease-in-out 3;
-}}
-/* keep subtle hover wave */
-#bot-button:hover .wave-emoji {{
-  animation: wave 0.9s ease-in-out 1;
-}}
-/* greeting bubble */
-#greeting {{
-  position: absolute;
-  botttom: -40px;
-  right: -10px;
-  background: rgba(255,255,255,0.95);
-  padding: 6px 8px;
-  border-radius: 12px;
-  font-size: 14px;
-  box-shadow: 0 4px 10px rgba(0,0,0,0.15);
-  display: none;
-}}
-</style>
-</head>
-<body>
-<div id="bot-container">
-  <div id="bot-button" role="button" aria-label="Open chat">
-    <span id="greeting">Hello!</span>
-    <span id="robot" class="wave-emoji">🤖</span>
-  </div>
-
-  <div id="chat-box">
-    <div id="chat-log"></div>
-    <div id="controls">
-      <input id="chat-input" type="text" placeholder="Type your question..." />
-      <button id="chat-send">Send</button>
-    </div>
-    <button id="tech-btn" onclick="window.open('https://multi-recruit-ai-app-bxsykziqvchzn4qxzb6q6v.streamlit.app');">
-      💬 Contact Live Tech Support
-    </button>
-  </div>
-
-  <div id="support-box">
-    <div id="support-log">
-      <div class="chat-message bot"><b>bot:</b> Hi, this is MR Assistant. How can I help you today?</div>
-    </div>
-    <div id="support-controls">
-      <input id="support-input" type="text" placeholder="Type your message..." />
-      <button id="support-send">Send</button>
-    </div>
-    <button id="back-btn">🔙 Back to Bot Chat</button>
-  </div>
-</div>
-
-<script>
-const QA = {qa_json_str};
-const botBtn = document.getElementById('bot-button');
-const chatBox = document.getElementById('chat-box');
-const supportBox = document.getElementById('support-box');
-const chatLog = document.getElementById('chat-log');
-const chatInput = document.getElementById('chat-input');
-const chatSend = document.getElementById('chat-send');
-const techBtn = document.getElementById('tech-btn');
-const supportLog = document.getElementById('support-log');
-const supportInput = document.getElementById('support-input');
-const supportSend = document.getElementById('support-send');
-const backBtn = document.getElementById('back-btn');
-const robot = document.getElementById('robot');
-const greeting = document.getElementById('greeting');
-
-function findAnswer(query) {{
-  query = query.trim().toLowerCase();
-  for (let i = 0; i < QA.length; i++) {{
-    if (QA[i].question.trim().toLowerCase() === query) return QA[i].answer;
-  }}
-  for (let i = 0; i < QA.length; i++) {{
-    if (QA[i].question.trim().toLowerCase().includes(query)) return QA[i].answer;
-  }}
-  return null;
-}}
-
-function showGreetingOnce() {{
-  // show greeting bubble briefly
-  greeting.style.display = 'block';
-  setTimeout(() => {{ greeting.style.display = 'none'; }}, 1800);
-}}
-
-function doWaveOnce() {{
-  // add class that triggers the animation once, then remove it
-  robot.classList.add('wave-once');
-  // ensure it'll be removable after animation ends
-  setTimeout(() => {{ robot.classList.remove('wave-once'); }}, 1400);
-}}
-
-// initial friendly wave + greeting when the page loads
-window.addEventListener('load', () => {{
-  // short delay so animation is noticeable
-  setTimeout(() => {{
-    showGreetingOnce();
-    doWaveOnce();
-  }}, 700);
-}});
-
-botBtn.addEventListener('click', () => {{
-  // wave on click and toggle chat
-  doWaveOnce();
-  if (chatBox.style.display === 'none' || chatBox.style.display === '') {{
-    chatBox.style.display = 'flex';
-    chatLog.innerHTML = '<div class="chat-message bot"><b>Bot:</b> Hi, how can I help you?</div>';
-  }} else {{
-    chatBox.style.display = 'none';
-  }}
-}});
-
-function handleSend() {{
-  const text = chatInput.value.trim();
-  if (!text) return;
-  chatLog.innerHTML += '<div class="chat-message"><b>You:</b> ' + text + '</div>';
-  chatInput.value = '';
-  const answer = findAnswer(text);
-  const reply = answer ? answer : "Sorry, I don’t have an answer for this.";
-  chatLog.innerHTML += '<div class="chat-message bot"><b>Bot:</b> ' + reply + '</div>';
-  chatLog.scrollTop = chatLog.scrollHeight;
-  if (reply.includes("Sorry")) {{
-    techBtn.style.display = 'block';
-  }}
-}}
-
-chatSend.addEventListener('click', handleSend);
-chatInput.addEventListener('keydown', e => {{ if (e.key === 'Enter') handleSend(); }});
-
-techBtn.addEventListener('click', () => {{
-  chatBox.style.display = 'none';
-  supportBox.style.display = 'flex';
-}});
-
-backBtn.addEventListener('click', () => {{
-  supportBox.style.display = 'none';
-  chatBox.style.display = 'flex';
-}});
-
-function handleSupportSend() {{
-  const text = supportInput.value.trim();
-  if (!text) return;
-  supportLog.innerHTML += '<div class="chat-message"><b>You:</b> ' + text + '</div>';
-  supportInput.value = '';
-  supportLog.scrollTop = supportLog.scrollHeight;
-  window.parent.postMessage({{
-    "isStreamlitMessage": true,
-    "type": "streamlit:setComponentValue",
-    "value": "support:" + text
-  }}, "*");
-}}
-
-supportSend.addEventListener('click', handleSupportSend);
-supportInput.addEventListener('keydown', e => {{ if (e.key === 'Enter') handleSupportSend(); }});
-</script>
-</body>
-</html>
-"""
+with metrics.phase("app", "load_kb"):
+    knowledge_base = load_knowledge_base(csv_path)
+if knowledge_base.error:
+    st.error(knowledge_base.error)
+# Searched first; the full knowledge base is the fallback on a miss (None for Library)
+category_index = knowledge_base.category_index(category)
+
+# ------------------------------
+# Bot + Tech Support widget with waving robot emoji
+# ------------------------------
+# The widget (widget/) is built once per process into a content-hashed bundle
+# in its component directory, so the browser caches it. Each rerun only sends
+# this small config; the knowledge base is fetched from its own
+# content-hashed file in ./static and re-downloaded only when the CSV changes.
+with metrics.phase("app", "build_widget"):
+    chat_widget = components.declare_component("mr_chat_widget", path=build_widget())
+    # With a category selected the widget loads only that category's index
+    # and fetches the global one the first time a question misses
+    kb_file = knowledge_base.payload_file_for(category)
+    fallback_file = knowledge_base.payload_file if category_index is not None else ""
+    widget_config = {
+        "kb_url": f"{WIDGET_STATIC_PREFIX}/{kb_file}",
+        "kb_gz_url": f"{WIDGET_STATIC_PREFIX}/{kb_file}.gz",
+        "fallback_kb_url": f"{WIDGET_STATIC_PREFIX}/{fallback_file}" if fallback_file else "",
+        "fallback_kb_gz_url": f"{WIDGET_STATIC_PREFIX}/{fallback_file}.gz" if fallback_file else "",
+        "category": category or "",
+        "support_url": "https://multi-recruit-ai-app-bxsykziqvchzn4qxzb6q6v.streamlit.app",
+        # Optional: answer via api_server.py instead of the in-browser index
+        "api_url": os.getenv("ANSWER_API_URL", ""),
+        # Lets the widget tell a too-fast sender to slow down before sending
+        "support_rate": {"per_minute": SESSION_RATE_PER_MINUTE, "burst": RATE_BURST},
+    }
 
 # ------------------------------
 # Render Chat Interface
 # ------------------------------
-user_input = components.html(html_template, height=700)
+with metrics.phase("app", "render_widget"):
+    user_input = chat_widget(**widget_config, key="chat_widget", default=None)
 
 # ------------------------------
 # Save Tech Support Messages + Show Replies
@@ -415,77 +145,67 @@ ticket_id = st.session_state.ticket_id
 st.markdown(f"**🎟️ Your Ticket ID:** `{ticket_id}` — Use this if Tech Support contacts you.")
 
 # ---- Load & Save Chat Helper ----
-def load_all_tickets():
-    try:
-        with open(chat_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, dict):
-                # ensure a tickets dict exists
-                if "tickets" not in data:
-                    data["tickets"] = {}
-                return data
-            else:
-                return {"tickets": {}}
-    except:
-        return {"tickets": {}}
-
-def save_all_tickets(data):
-    with open(chat_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+def load_messages(ticket_id):
+    # Last 20 messages; after the first read only new ones are fetched
+    return synced_messages(ticket_store, ticket_id, "live_chat_window", tail=20, keep=20)["messages"]
 
-tickets_data = load_all_tickets()
+def save_ticket_message(ticket_id, message):
+    write_queue.append_message(ticket_id, message)
 
 # ---- Save user message (compatible with admin dashboard) ----
-if isinstance(user_input, str) and user_input.startswith("support:"):
-    message = user_input.replace("support:", "").strip()
+# The widget keeps returning its last value on later reruns; the nonce makes
+# sure each support message is saved exactly once
+if isinstance(user_input, dict) and user_input.get("kind") == "support" \
+        and user_input.get("nonce") != st.session_state.get("last_support_nonce"):
+    st.session_state.last_support_nonce = user_input.get("nonce")
+    message = str(user_input.get("text", "")).strip()
     if message:
         # Use the session ticket id so messages are tied to the user session
         ticket_id = st.session_state.ticket_id
 
-        # Ensure tickets dict exists
-        if "tickets" not in tickets_data:
-            tickets_data["tickets"] = {}
-
-        if ticket_id not in tickets_data["tickets"]:
-            tickets_data["tickets"][ticket_id] = {"messages": []}
-
-        # Append user message
-        tickets_data["tickets"][ticket_id]["messages"].append({
-            "sender": "user",
-            "text": message,
-            "timestamp": int(time.time())
-        })
-
-        # Save back
-        save_all_tickets(tickets_data)
-
-        st.success("📨 Message sent to Tech Support!")
+        # Closed (or archived) tickets take no new messages, as in api_server.post_message
+        meta = ticket_store.get_ticket_meta(ticket_id)
+        closed = (meta is not None and meta.closed) or (meta is None and ticket_id in ticket_archive)
+        wait = 0.0 if closed else allow_message(ticket_id, st.session_state.metrics_session)
+        if closed:
+            st.warning("🔒 This ticket is closed. Reload the page to open a new ticket.")
+        elif wait:
+            st.warning(f"⏳ You're sending messages too quickly. Please wait {math.ceil(wait)}s and send it again.")
+        else:
+            try:
+                with metrics.phase("app", "save_message"):
+                    save_ticket_message(ticket_id, Message(Role.USER, message))
+                st.success("📨 Message sent to Tech Support!")
+            except WriteQueueFull:
+                st.warning("⏳ Tech Support is busy right now. Please send your message again in a few seconds.")
+            except Exception:
+                st.error("⚠️ Your message could not be saved. Please send it again.")
 
 # ---- Display replies ----
-try:
-    with open(chat_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        tickets = data.get("tickets", {})
-        messages = tickets.get(ticket_id, {}).get("messages", [])
-except (FileNotFoundError, json.JSONDecodeError):
-    messages = []
-
-if messages:
-    st.markdown("---")
-    st.subheader("💬 Live Tech Support Chat")
-
-    for msg in messages[-20:]:
-        if msg.get("sender") == "user":
+# Only this fragment refreshes, and it reads only messages newer than the
+# last one it has seen (see live_updates.py)
+@live_fragment()
+def live_chat():
+    with metrics.phase("app", "load_messages"):
+        messages = load_messages(ticket_id)
+
+    started = time.perf_counter()
+    for msg in messages:
+        if msg.role is Role.USER:
             st.markdown(
-                f"<div style='background:#e3f2fd;padding:8px;border-radius:8px;margin:5px;max-width:80%'>🧑 <b>You:</b> {msg.get('text')}</div>",
+                f"<div style='background:#e3f2fd;padding:8px;border-radius:8px;margin:5px;max-width:80%'>🧑 <b>You:</b> {msg.text}</div>",
                 unsafe_allow_html=True
             )
         else:
             st.markdown(
-                f"<div style='background:#e8f5e9;padding:8px;border-radius:8px;margin:5px;max-width:80%;margin-left:auto'>💬 <b>Pranay:</b> {msg.get('text')}</div>",
+                f"<div style='background:#e8f5e9;padding:8px;border-radius:8px;margin:5px;max-width:80%;margin-left:auto'>💬 <b>Pranay:</b> {msg.text}</div>",
                 unsafe_allow_html=True
             )
+    metrics.observe("phase_seconds", time.perf_counter() - started, script="app", phase="render_messages")
+
+if ticket_store.ticket_version(ticket_id):
+    st.markdown("---")
+    st.subheader("💬 Live Tech Support Chat")
+    live_chat()
 
-    # short pause then rerun so the UI updates for active sessions
-    time.sleep(3)
-    st.experimental_rerun()
+rerun_metrics.finish()
@@ -0,0 +1,202 @@
+import argparse
+import gzip
+import os
+import threading
+import time
+from datetime import datetime
+
+from models import Ticket, dumps, loads, now_ts
+from ticket_log import _file_lock
+from ticket_store import TicketPage
+
+# ------------------------------
+# Cold archive for closed tickets
+# ------------------------------
+# Tickets closed for ARCHIVE_AFTER_DAYS are moved out of the hot store into
+# date-partitioned, gzip-compressed segments next to it:
+#   support_chat.archive/2026-10/2026-10-18.seg.gz
+# A segment is a series of independent gzip members, one per ticket, so a
+# single ticket is read back with one seek + one decompress. index.jsonl maps
+# each ticket to (segment, offset, length) and is the only thing read to list
+# archived tickets. Order of operations: segment (fsync) -> index (fsync) ->
+# delete from the hot store, so a crash can at worst leave a ticket in both
+# places; the next run finds the archived copy identical and only deletes it
+# (a copy that differs is archived again, and the newer index line wins).
+# The delete is conditional on the ticket version read before archiving: a
+# message that slipped in meanwhile keeps the ticket in the hot store, and
+# the next run archives it again.
+# Candidates come from the store's closed_at metadata
+# (list_closed_before), so only tickets that are due are loaded. Runs come
+# from `python archive.py` (cron) or maybe_archive(), which starts a
+# background thread at most once per ARCHIVE_INTERVAL_SECONDS.
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_INTERVAL_SECONDS = 3600
+
+
+class TicketArchive:
+    def __init__(self, chat_file):
+        self.root = os.path.splitext(os.path.abspath(chat_file))[0] + ".archive"
+        self.index_path = os.path.join(self.root, "index.jsonl")
+        self.lock_path = os.path.join(self.root, "archive.lock")
+        self._index_key = None
+        self._index = {}
+        self._index_lock = threading.Lock()
+        self._ticket_cache = {}
+
+    # ---- index ----
+    def _entries(self):
+        # ticket_id -> entry, re-read only when index.jsonl changes
+        try:
+            st = os.stat(self.index_path)
+            key = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return {}
+        with self._index_lock:
+            if key != self._index_key:
+                index = {}
+                with open(self.index_path, "rb") as f:
+                    for line in f:
+                        try:
+                            entry = loads(line)
+                        except ValueError:
+                            continue
+                        index[entry["ticket_id"]] = entry
+                self._index, self._index_key = index, key
+            return self._index
+
+    def __contains__(self, ticket_id):
+        return ticket_id in self._entries()
+
+    def __len__(self):
+        return len(self._entries())
+
+    def list_tickets_page(self, after=None, limit=20, query=None):
+        # Same contract as TicketStore.list_tickets_page
+        rows = sorted(
+            (e.get("created_at", 0), tid) for tid, e in self._entries().items()
+            if not query or query.upper() in tid.upper()
+        )
+        if after is not None:
+            rows = [row for row in rows if row > tuple(after)]
+        page = rows[:limit]
+        next_cursor = page[-1] if len(rows) > limit else None
+        return TicketPage([tid for _, tid in page], next_cursor)
+
+    # ---- single-ticket reads ----
+    def get_ticket(self, ticket_id):
+        entry = self._entries().get(ticket_id)
+        if entry is None:
+            return None
+        location = (entry["segment"], entry["offset"], entry["length"])
+        info = self._ticket_cache.get(location)
+        if info is None:
+            with open(os.path.join(self.root, entry["segment"]), "rb") as f:
+                f.seek(entry["offset"])
+                info = loads(gzip.decompress(f.read(entry["length"])))
+            if len(self._ticket_cache) > 256:
+                self._ticket_cache.clear()
+            self._ticket_cache[location] = info
+        return Ticket.from_dict(ticket_id, info)
+
+    # ---- archiving ----
+    def _write(self, ticket, last_ts):
+        day = datetime.fromtimestamp(last_ts or ticket.created_at or now_ts())
+        segment = f"{day:%Y-%m}/{day:%Y-%m-%d}.seg.gz"
+        path = os.path.join(self.root, segment)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        blob = gzip.compress(dumps(ticket.to_dict()))
+        with open(path, "ab") as f:
+            offset = f.tell()
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        return {
+            "ticket_id": ticket.ticket_id,
+            "segment": segment,
+            "offset": offset,
+            "length": len(blob),
+            "created_at": ticket.created_at,
+            "last_ts": last_ts,
+            "archived_at": now_ts(),
+        }
+
+    def archive_closed(self, store, max_age_days=ARCHIVE_AFTER_DAYS, now=None):
+        """Move tickets closed at least max_age_days ago into cold segments.
+        Returns the archived ticket ids."""
+        cutoff = (now or time.time()) - max_age_days * 86400
+        os.makedirs(self.root, exist_ok=True)
+        archived = []
+        with _file_lock(self.lock_path):
+            indexed = self._entries()
+            entries, due = [], []
+            for ticket_id in store.list_closed_before(cutoff):
+                # Read the version first: a change after it fails the delete
+                version = store.ticket_version(ticket_id)
+                ticket = store.get_ticket(ticket_id)
+                if ticket is None or not ticket.closed:
+                    continue
+                if ticket_id not in indexed or self.get_ticket(ticket_id).to_dict() != ticket.to_dict():
+                    last_ts = max([m.ts for m in ticket.messages] + [ticket.created_at or 0])
+                    entries.append(self._write(ticket, last_ts))
+                due.append((ticket_id, version))
+            if entries:
+                with open(self.index_path, "ab") as f:
+                    f.write(b"".join(dumps(e) + b"\n" for e in entries))
+                    f.flush()
+                    os.fsync(f.fileno())
+            for ticket_id, version in due:
+                if store.delete_ticket(ticket_id, version=version):
+                    archived.append(ticket_id)
+        return archived
+
+
+_archives = {}
+_last_run = {}
+_running = set()
+_archives_lock = threading.Lock()
+
+
+def get_archive(chat_file):
+    path = os.path.abspath(chat_file)
+    with _archives_lock:
+        archive = _archives.get(path)
+        if archive is None:
+            archive = _archives[path] = TicketArchive(path)
+        return archive
+
+
+def _archive_in_background(store, path):
+    try:
+        get_archive(path).archive_closed(store)
+    finally:
+        with _archives_lock:
+            _running.discard(path)
+
+
+def maybe_archive(store, chat_file, interval=ARCHIVE_INTERVAL_SECONDS):
+    """Start an archival pass in a background thread, at most one per process
+    per interval; returns whether one was started."""
+    path = os.path.abspath(chat_file)
+    now = time.monotonic()
+    with _archives_lock:
+        last = _last_run.get(path)
+        if path in _running or (last is not None and now - last < interval):
+            return False
+        _last_run[path] = now
+        _running.add(path)
+    threading.Thread(target=_archive_in_background, args=(store, path), name="ticket-archive", daemon=True).start()
+    return True
+
+
+if __name__ == "__main__":
+    from ticket_store import get_ticket_store
+
+    parser = argparse.ArgumentParser(description="Move old closed tickets into the cold archive.")
+    parser.add_argument("chat_file", nargs="?", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "support_chat.json"
+    ))
+    parser.add_argument("--days", type=float, default=ARCHIVE_AFTER_DAYS, help="minimum idle age in days")
+    args = parser.parse_args()
+    moved = get_archive(args.chat_file).archive_closed(get_ticket_store(args.chat_file), args.days)
+    print(f"archived {len(moved)} ticket(s)")
@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+import io
+import os
+import re
+import threading
+
+# ------------------------------
+# Static asset pipeline
+# ------------------------------
+# Images are resized/recompressed once per process and written to ./static
+# under a content-hashed name. Streamlit serves that folder at app/static/
+# (server.enableStaticServing in .streamlit/config.toml), so pages reference
+# the image by URL and browsers cache it instead of receiving a base64 copy
+# inside every rerun.
+#
+# The chat widget is built the same way: widget/ holds its source, and
+# build_widget() writes a minified, content-hashed JS/CSS bundle plus a tiny
+# index.html loader to build/widget, which Streamlit serves as a component.
+# The bundle lives next to the loader rather than in ./static because the
+# static route serves anything but images as text/plain with nosniff, and
+# browsers refuse such scripts and stylesheets. Reruns only send the
+# component a small config; the knowledge base is a separate content-hashed
+# JSON file (with a .gz twin) in ./static that the browser fetches once per
+# KB version.
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL = "app/static"
+MAX_BACKGROUND_WIDTH = 1920
+WIDGET_SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "widget")
+WIDGET_BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build", "widget")
+# The component iframe is served from <base>/component/<name>/index.html
+WIDGET_STATIC_PREFIX = "../../" + STATIC_URL
+
+_built = {}
+_lock = threading.Lock()
+
+
+def _encode_image(src_path, max_width):
+    # Pillow is only needed for images; widget/KB bundling works without it
+    from PIL import Image
+
+    with Image.open(src_path) as img:
+        img.load()
+        if img.width > max_width:
+            height = round(img.height * max_width / img.width)
+            img = img.resize((max_width, height), Image.LANCZOS)
+        buf = io.BytesIO()
+        try:
+            img.save(buf, format="WEBP", quality=82, method=6)
+            return buf.getvalue(), "webp"
+        except (KeyError, OSError):
+            # Pillow built without WebP support
+            buf = io.BytesIO()
+            img.save(buf, format="PNG", optimize=True)
+            return buf.getvalue(), "png"
+
+
+def _write_atomic(target, data):
+    if os.path.exists(target):
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, target)
+
+
+def write_static(name, data, ext, gzipped=False, directory=STATIC_DIR):
+    """Write data to <directory>/<name>.<sha16>.<ext> (./static by default) and
+    return that file name. With gzipped=True a pre-compressed <file>.gz is
+    written next to it."""
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    filename = f"{name}.{digest}.{ext}"
+    _write_atomic(os.path.join(directory, filename), data)
+    if gzipped:
+        _write_atomic(os.path.join(directory, filename + ".gz"), gzip.compress(data, 9, mtime=0))
+    return filename
+
+
+def static_asset_url(src_path, name, max_width=MAX_BACKGROUND_WIDTH):
+    st = os.stat(src_path)
+    key = (os.path.abspath(src_path), st.st_mtime_ns, st.st_size, max_width)
+    with _lock:
+        url = _built.get(key)
+        if url is not None:
+            return url
+        data, ext = _encode_image(src_path, max_width)
+        url = f"{STATIC_URL}/{write_static(name, data, ext)}"
+        _built[key] = url
+        return url
+
+
+# ---- chat widget bundle ----
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_SPACE = re.compile(r"\s*([{}:;,>])\s*")
+
+
+def _minify_css(css):
+    css = _CSS_COMMENT.sub("", css)
+    return _CSS_SPACE.sub(r"\1", " ".join(css.split())).replace(";}", "}")
+
+
+def _minify_js(js):
+    # Conservative: trims indentation, blank lines and whole-line // comments
+    # but keeps line breaks, so automatic semicolon insertion is unaffected
+    lines = (line.strip() for line in js.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//"))
+
+
+def build_widget():
+    """Build the widget bundle once per source version; returns the component dir."""
+    from qa_engine import SEARCH_JS
+
+    sources = [os.path.join(WIDGET_SRC_DIR, f) for f in ("index.html", "widget.css", "widget.js")]
+    key = ("widget",) + tuple((os.stat(p).st_mtime_ns, os.stat(p).st_size) for p in sources) + (SEARCH_JS,)
+    with _lock:
+        if key in _built:
+            return _built[key]
+        html, css, js = (open(p, encoding="utf-8").read() for p in sources)
+        # Served by the component route with real MIME types, relative to index.html
+        css_name = write_static("widget", _minify_css(css).encode("utf-8"), "css", directory=WIDGET_BUILD_DIR)
+        js_name = write_static(
+            "widget", _minify_js(SEARCH_JS + "\n" + js).encode("utf-8"), "js", directory=WIDGET_BUILD_DIR
+        )
+        html = html.replace("__WIDGET_CSS__", css_name).replace("__WIDGET_JS__", js_name)
+        os.makedirs(WIDGET_BUILD_DIR, exist_ok=True)
+        target = os.path.join(WIDGET_BUILD_DIR, "index.html")
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(html)
+        os.replace(tmp, target)
+        _built[key] = WIDGET_BUILD_DIR
+        return WIDGET_BUILD_DIR
@@ -0,0 +1,232 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import metrics
+
+# ------------------------------
+# Rate limits and write backpressure
+# ------------------------------
+# Support messages come from the chat widget, admin.py's "Send Message" and
+# api_server.py, so one noisy client (or a retry storm) could otherwise keep
+# the ticket store busy for every other session.
+#   allow_message(ticket_id, session_id) -> 0.0, or seconds until a message
+#       would be accepted; token buckets per ticket and per session
+#   WriteQueue  bounded queue in front of the store: writes from concurrent
+#       sessions are applied by one thread, consecutive appends as one
+#       append_messages() call, and a full queue refuses work (WriteQueueFull)
+#       instead of growing. A write not stored within WRITE_RESULT_TIMEOUT is
+#       withdrawn and refused the same way, so no caller hangs on a stuck store
+# Callers turn a refusal into a "slow down" message (app.py/admin.py) or a
+# 429/503 with Retry-After (api_server.py, which submits from its executor).
+
+TICKET_RATE_PER_MINUTE = float(os.getenv("TICKET_RATE_PER_MINUTE", "20"))
+SESSION_RATE_PER_MINUTE = float(os.getenv("SESSION_RATE_PER_MINUTE", "30"))
+RATE_BURST = int(os.getenv("RATE_BURST", "5"))  # messages allowed back to back
+RATE_MAX_KEYS = 10000  # buckets kept per limiter; the least recently used go first
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "1000"))
+WRITE_QUEUE_TIMEOUT = 2.0  # seconds a writer waits for room before giving up
+WRITE_RESULT_TIMEOUT = float(os.getenv("WRITE_RESULT_TIMEOUT", "10"))  # seconds it waits for the store
+WRITE_BATCH_MAX = 200
+
+
+class WriteQueueFull(Exception):
+    """The store is behind; retry_after is a suggested wait in seconds."""
+
+    def __init__(self, retry_after=WRITE_QUEUE_TIMEOUT):
+        super().__init__("write queue is full")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, now):
+        """Seconds until a token is available (0.0 if one is now)."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """One token bucket per key (ticket id, session id, client address)."""
+
+    def __init__(self, name, per_minute, burst=RATE_BURST, max_keys=RATE_MAX_KEYS):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def wait(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return self._bucket(key, now).wait(now)
+
+    def take(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._bucket(key, now).take(now)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+ticket_limiter = RateLimiter("ticket", TICKET_RATE_PER_MINUTE)
+session_limiter = RateLimiter("session", SESSION_RATE_PER_MINUTE)
+
+
+def allow_message(ticket_id, session_id=None):
+    """0.0 if the message may be written (and counts it), else seconds to wait."""
+    now = time.monotonic()
+    limits = [(ticket_limiter, ticket_id)] + ([(session_limiter, session_id)] if session_id else [])
+    for limiter, key in limits:
+        wait = limiter.wait(key, now)
+        if wait:
+            metrics.inc("rate_limited_total", scope=limiter.name)
+            return wait
+    for limiter, key in limits:
+        limiter.take(key, now)
+    return 0.0
+
+
+def write_groups(batch):
+    """Split [(op, ticket_id, message, ...)] into the store calls that apply
+    it in order: runs of consecutive appends, and each close on its own."""
+    group = []
+    for item in batch:
+        if item[0] == "append":
+            group.append(item)
+            continue
+        if group:
+            yield group
+            group = []
+        yield [item]
+    if group:
+        yield group
+
+
+def apply_group(store, group):
+    if group[0][0] == "append":
+        store.append_messages([(item[1], item[2]) for item in group])
+    else:
+        store.close_ticket(group[0][1])
+
+
+class WriteQueue:
+    """Bounded queue of ticket writes, applied in batches by one thread."""
+
+    def __init__(self, store, max_size=WRITE_QUEUE_SIZE, batch_max=WRITE_BATCH_MAX):
+        self.store = store
+        self.batch_max = batch_max
+        self.queue = queue.Queue(max_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        metrics.gauge("write_queue_depth", self.queue.qsize)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ticket-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, op, ticket_id, message=None, timeout=WRITE_QUEUE_TIMEOUT, result_timeout=WRITE_RESULT_TIMEOUT):
+        """Queue a write and wait until it is stored. WriteQueueFull if there
+        is no room, or if the store has not got to it within result_timeout."""
+        self._start()
+        future = Future()
+        try:
+            self.queue.put((op, ticket_id, message, future), timeout=timeout)
+        except queue.Full:
+            metrics.inc("write_queue_rejected_total")
+            raise WriteQueueFull()
+        try:
+            return future.result(result_timeout)
+        except FutureTimeout:
+            metrics.inc("write_queue_timeouts_total")
+            if future.cancel():
+                # Withdrawn before the writer took it, so a retry cannot
+                # store it twice
+                raise WriteQueueFull()
+        # The writer is storing it right now: wait for that store call
+        try:
+            return future.result(result_timeout)
+        except FutureTimeout:
+            raise WriteQueueFull()
+
+    def append_message(self, ticket_id, message, timeout=WRITE_QUEUE_TIMEOUT):
+        return self.submit("append", ticket_id, message, timeout)
+
+    def close_ticket(self, ticket_id, timeout=WRITE_QUEUE_TIMEOUT):
+        return self.submit("close", ticket_id, None, timeout)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            metrics.inc("write_queue_batches_total")
+            metrics.inc("write_queue_writes_total", len(batch))
+            # Each group is one store call and settles only its own futures:
+            # a failed close must not report appends that committed as failed
+            # (their senders would retry and store them twice)
+            for group in write_groups(batch):
+                # Skips writes whose sender timed out and withdrew them
+                group = [item for item in group if item[3].set_running_or_notify_cancel()]
+                if not group:
+                    continue
+                try:
+                    apply_group(self.store, group)
+                except Exception as e:
+                    metrics.inc("write_queue_errors_total")
+                    for *_, future in group:
+                        future.set_exception(e)
+                    continue
+                for *_, future in group:
+                    future.set_result(True)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(store):
+    # One queue (and writer thread) per store per process
+    with _queues_lock:
+        write_queue = _queues.get(id(store))
+        if write_queue is None:
+            write_queue = _queues[id(store)] = WriteQueue(store)
+        return write_queue
@@ -0,0 +1,142 @@
+"""Cold-start benchmark: what a fresh app.py process pays before its first render.
+
+Each run starts a new interpreter under `python -X importtime`, imports the
+modules app.py imports at the top, then loads the knowledge base the way the
+first rerun does. Reports wall-time percentiles for both steps and an
+importtime-style table of the slowest imports (median over runs):
+
+    python -m benchmarks.cold_start --runs 10
+    python -m benchmarks.cold_start --fresh-pyc --top 40
+    python -m benchmarks.cold_start --modules kb_cache,qa_engine
+
+--fresh-pyc gives every run an empty bytecode cache, like a new container.
+Modules that are not installed here are reported as skipped.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.load_test import CSV_PATH, RESULTS_DIR, percentiles  # noqa: E402
+
+# Top-level imports of app.py, in order
+APP_MODULES = [
+    "streamlit", "dotenv", "streamlit.components.v1", "assets", "backpressure",
+    "kb_cache", "live_updates", "metrics", "models", "qa_engine", "ticket_store",
+]
+
+CHILD = """
+import sys, time
+started = time.perf_counter()
+skipped = []
+for name in sys.argv[1].split(","):
+    try:
+        __import__(name)
+    except ImportError:
+        skipped.append(name)
+imported = time.perf_counter()
+kb_s = None
+if sys.argv[2]:
+    from kb_cache import load_knowledge_base
+    load_knowledge_base(sys.argv[2])
+    kb_s = time.perf_counter() - imported
+import json
+print(json.dumps({"import_s": imported - started, "kb_s": kb_s, "skipped": skipped}))
+"""
+
+# "import time:       self [us] |  cumulative | imported package"
+_IMPORTTIME = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|( *)(\S+)")
+
+
+def run_once(modules, csv_path, fresh_pyc):
+    env = dict(os.environ)
+    with tempfile.TemporaryDirectory() as pyc_dir:
+        if fresh_pyc:
+            env["PYTHONPYCACHEPREFIX"] = pyc_dir
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", CHILD, ",".join(modules), csv_path or ""],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+        )
+    imports = {}
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return json.loads(proc.stdout.splitlines()[-1]), imports
+
+
+def import_report(runs, top):
+    # Median self/cumulative time per module over the runs it appeared in
+    names = {name for imports in runs for name in imports}
+    rows = []
+    for name in names:
+        seen = [imports[name] for imports in runs if name in imports]
+        rows.append({
+            "module": name,
+            "self_ms": statistics.median(s for s, _, _ in seen) / 1000,
+            "cumulative_ms": statistics.median(c for _, c, _ in seen) / 1000,
+            "depth": seen[0][2],
+        })
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to start")
+    parser.add_argument("--modules", help="comma-separated modules to import (default: app.py's imports)")
+    parser.add_argument("--csv", default=CSV_PATH, help="knowledge base to load after the imports ('' to skip)")
+    parser.add_argument("--fresh-pyc", action="store_true", help="empty bytecode cache for every run")
+    parser.add_argument("--top", type=int, default=25, help="slowest imports to list")
+    parser.add_argument("--out", help="report path (default: benchmarks/results/cold-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    modules = args.modules.split(",") if args.modules else APP_MODULES
+    results, imports = [], []
+    for _ in range(args.runs):
+        result, run_imports = run_once(modules, args.csv, args.fresh_pyc)
+        results.append(result)
+        imports.append(run_imports)
+
+    import_s = percentiles([r["import_s"] for r in results])
+    kb_s = percentiles([r["kb_s"] for r in results if r["kb_s"] is not None])
+    skipped = sorted({name for r in results for name in r["skipped"]})
+    slowest = import_report(imports, args.top)
+
+    print(f"{'self ms':>9} | {'cumul ms':>9} | module")
+    for row in slowest:
+        print(f"{row['self_ms']:9.2f} | {row['cumulative_ms']:9.2f} | {'  ' * row['depth']}{row['module']}")
+    print(
+        f"imports p50 {import_s.get('p50_ms', 0):7.1f}ms max {import_s.get('max_ms', 0):7.1f}ms | "
+        f"first KB load p50 {kb_s.get('p50_ms', 0):7.1f}ms max {kb_s.get('max_ms', 0):7.1f}ms"
+    )
+    if skipped:
+        print(f"skipped (not installed): {', '.join(skipped)}")
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {**vars(args), "modules": modules},
+        "imports": import_s,
+        "first_kb_load": kb_s,
+        "skipped": skipped,
+        "slowest_imports": slowest,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"cold-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {out}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Concurrent-load benchmark for the ticket stores and the bot lookup.
+
+Simulates N support sessions hitting the same code paths as app.py/admin.py:
+each session opens a TCKT-YYYYMMDD-XXXXXX ticket, sends user messages and
+admin replies, and fires questions at qa_engine.get_bot_response. Messages
+take app.py's write path: backpressure.allow_message (user messages only,
+like api_server.py) and then the process's shared WriteQueue. Refusals are
+reported apart from errors: rate_limited is what api_server.py answers with
+429 and queue_full with 503. Runs entirely locally against a scratch copy of
+the store and writes a JSON report so backends/engines can be compared:
+
+    python -m benchmarks.load_test --sessions 50 --messages 20
+    python -m benchmarks.load_test --backend log --engine linear --mode process
+    python -m benchmarks.load_test --backend segments --no-rate-limit
+
+--no-rate-limit skips the token buckets (the queue still applies), to
+measure write throughput rather than the limits.
+
+Engines: "index" is get_bot_response (answer cache + BM25 index), "nocache"
+the bare index lookup, "linear" the original scan.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backpressure import WriteQueueFull, allow_message, get_write_queue  # noqa: E402
+from kb_cache import load_knowledge_base  # noqa: E402
+from models import Message, Role  # noqa: E402
+from qa_engine import NO_ANSWER, get_bot_response  # noqa: E402
+from ticket_store import get_ticket_store  # noqa: E402
+
+CSV_PATH = os.path.join(ROOT, "multi_recruit_ai_full_qa.csv")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def linear_scan_response(user_message, records):
+    # The original app.py lookup, kept as the baseline engine
+    if not user_message:
+        return None
+    q = user_message.strip().lower()
+    for rec in records:
+        if rec.get("question", "").strip().lower() == q:
+            return rec.get("answer", "")
+    for rec in records:
+        if q in rec.get("question", "").strip().lower():
+            return rec.get("answer", "")
+    return NO_ANSWER
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "p50_ms": pick(50) * 1000,
+        "p95_ms": pick(95) * 1000,
+        "p99_ms": pick(99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def new_ticket_id():
+    return f"TCKT-{time.strftime('%Y%m%d')}-{str(uuid.uuid4())[:6].upper()}"
+
+
+def run_session(chat_file, backend, engine, messages, queries, seed, rate_limit=True):
+    # One simulated user: a ticket, its messages, an admin reply now and
+    # then, and a stream of bot questions
+    rng = random.Random(seed)
+    store = get_ticket_store(chat_file, backend)
+    write_queue = get_write_queue(store)
+    kb = load_knowledge_base(CSV_PATH)
+    questions = [r["question"] for r in kb.records] or ["hello"]
+
+    ticket_id = new_ticket_id()
+    session_id = uuid.uuid4().hex
+    write_lat, query_lat = [], []
+    errors = sent = rate_limited = queue_full = 0
+    for i in range(max(messages, queries)):
+        if i < messages:
+            role = Role.ADMIN if i % 4 == 3 else Role.USER
+            start = time.perf_counter()
+            if rate_limit and role is Role.USER and allow_message(ticket_id, session_id):
+                rate_limited += 1
+            else:
+                try:
+                    write_queue.append_message(ticket_id, Message(role, f"load-test message {i}"))
+                    sent += 1
+                    write_lat.append(time.perf_counter() - start)
+                except WriteQueueFull:
+                    queue_full += 1
+                except Exception:
+                    errors += 1
+        if i < queries:
+            q = rng.choice(questions)
+            if rng.random() < 0.3:
+                # Partial / reworded questions exercise the ranked path
+                q = " ".join(q.split()[1:]) or q
+            start = time.perf_counter()
+            if engine == "linear":
+                linear_scan_response(q, kb.records)
+            elif engine == "nocache":
+                kb.index.lookup(q)
+            else:
+                get_bot_response(q, kb.index)
+            query_lat.append(time.perf_counter() - start)
+    return {
+        "ticket_id": ticket_id, "sent": sent, "errors": errors, "rate_limited": rate_limited,
+        "queue_full": queue_full, "write_lat": write_lat, "query_lat": query_lat,
+    }
+
+
+def run_benchmark(backend, engine, sessions, messages, queries, mode, rate_limit=True):
+    workdir = tempfile.mkdtemp(prefix="mr-load-")
+    chat_file = os.path.join(workdir, "support_chat.json")
+    try:
+        # Create/migrate the store once before the workers start
+        get_ticket_store(chat_file, backend)
+        pool_cls = ProcessPoolExecutor if mode == "process" else ThreadPoolExecutor
+        started = time.perf_counter()
+        with pool_cls(max_workers=sessions) as pool:
+            futures = [
+                pool.submit(run_session, chat_file, backend, engine, messages, queries, seed, rate_limit)
+                for seed in range(sessions)
+            ]
+            outcomes = [f.result() for f in futures]
+        elapsed = time.perf_counter() - started
+
+        store = get_ticket_store(chat_file, backend)
+        lost = 0
+        for outcome in outcomes:
+            ticket = store.get_ticket(outcome["ticket_id"])
+            stored = len(ticket.messages) if ticket else 0
+            lost += max(0, outcome["sent"] - stored)
+
+        write_lat = [x for o in outcomes for x in o["write_lat"]]
+        query_lat = [x for o in outcomes for x in o["query_lat"]]
+        return {
+            "backend": backend,
+            "engine": engine,
+            "elapsed_s": elapsed,
+            # Latencies and throughput are for accepted writes
+            "writes": {
+                **percentiles(write_lat),
+                "throughput_per_s": len(write_lat) / elapsed if elapsed else 0.0,
+                "errors": sum(o["errors"] for o in outcomes),
+                "rate_limited": sum(o["rate_limited"] for o in outcomes),
+                "queue_full": sum(o["queue_full"] for o in outcomes),
+                "lost_updates": lost,
+            },
+            "queries": {
+                **percentiles(query_lat),
+                "throughput_per_s": len(query_lat) / elapsed if elapsed else 0.0,
+            },
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent simulated sessions")
+    parser.add_argument("--messages", type=int, default=20, help="support messages per session")
+    parser.add_argument("--queries", type=int, default=50, help="bot questions per session")
+    parser.add_argument("--backend", choices=["sqlite", "log", "segments", "all"], default="all")
+    parser.add_argument("--engine", choices=["index", "nocache", "linear", "all"], default="index")
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread",
+                        help="thread: sessions share a process like Streamlit; process: one process each")
+    parser.add_argument("--no-rate-limit", dest="rate_limit", action="store_false",
+                        help="skip the per-ticket/per-session token buckets")
+    parser.add_argument("--out", help="report path (default: benchmarks/results/load-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    backends = ["sqlite", "log", "segments"] if args.backend == "all" else [args.backend]
+    engines = ["index", "nocache", "linear"] if args.engine == "all" else [args.engine]
+    results = []
+    for backend in backends:
+        for engine in engines:
+            result = run_benchmark(
+                backend, engine, args.sessions, args.messages, args.queries, args.mode, args.rate_limit
+            )
+            results.append(result)
+            w, q = result["writes"], result["queries"]
+            print(
+                f"{backend:>8}/{engine:<7} writes {w['throughput_per_s']:8.1f}/s "
+                f"p50 {w.get('p50_ms', 0):7.2f}ms p95 {w.get('p95_ms', 0):7.2f}ms p99 {w.get('p99_ms', 0):7.2f}ms "
+                f"lost {w['lost_updates']} 429 {w['rate_limited']} 503 {w['queue_full']} | queries {q['throughput_per_s']:9.1f}/s "
+                f"p50 {q.get('p50_ms', 0):6.3f}ms p99 {q.get('p99_ms', 0):6.3f}ms"
+            )
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "results": results,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"load-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {out}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import csv
+import json
+import os
+import threading
+
+from assets import STATIC_URL, write_static
+from kb_index import DEFAULT_INDEX_PATH, MappedQAIndex, category_index_paths
+from qa_engine import QAIndex, category_slug
+
+# ------------------------------
+# Process-wide Q&A knowledge base cache
+# ------------------------------
+# Streamlit re-executes app.py on every rerun, but imported modules live for
+# the whole process. The parsed records, the search index and the serialized
+# widget payload are kept here, keyed on the CSV's (path, mtime, size), so the
+# CSV is parsed once per process and again only when the file changes.
+# The CSV is read with the stdlib csv module, since importing pandas would cost
+# more than the whole parse. When kb_ingest.py has built kb_index.bin and it
+# is at least as new as the CSV, that file is memory-mapped instead and the
+# CSV is not parsed at all.
+# The widget payload is written once per KB version as a content-hashed
+# static file (static/kb.<hash>.json + .gz) that browsers fetch and cache.
+# Records with a category also get a per-category index (and payload), which
+# app.py searches first for the category picked in the sidebar.
+
+DEFAULT_RECORDS = [
+    {"question": "Forgot Password", "answer": "Go to your password reset page."},
+    {"question": "Laptop Not Turning On", "answer": "Hold the power button for 10 seconds."},
+    {"question": "Outlook Issue", "answer": "Restart Outlook and check your internet connection."},
+]
+
+
+class _RecordDicts:
+    # {"question", "answer"} view over a mapped index's records
+    def __init__(self, index):
+        self._records = index.records
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, i):
+        question, answer = self._records[i]
+        return {"question": question, "answer": answer}
+
+
+def _partition(records):
+    groups = {}
+    for record in records:
+        category = category_slug(record.get("category", ""))
+        if category:
+            groups.setdefault(category, []).append(record)
+    return {category: QAIndex(group) for category, group in groups.items()}
+
+
+class KnowledgeBase:
+    def __init__(self, key, records, error=None, index=None, categories=None):
+        self.key = key
+        self.error = error
+        self.index = index if index is not None else QAIndex(records)
+        self.records = records if index is None else _RecordDicts(index)
+        self.categories = categories if categories is not None else _partition(records or [])
+        self._payload_files = {}
+
+    def category_index(self, category):
+        # None for no/unknown category, meaning "search everything"
+        return self.categories.get(category_slug(category)) if category else None
+
+    def payload_file_for(self, category=None):
+        # Written on first use, so non-widget users never touch ./static
+        index = self.category_index(category) or self.index
+        name = self._payload_files.get(id(index))
+        if name is None:
+            data = json.dumps(index.to_payload(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            name = self._payload_files[id(index)] = write_static("kb", data, "json", gzipped=True)
+        return name
+
+    @property
+    def payload_file(self):
+        return self.payload_file_for(None)
+
+    @property
+    def payload_url(self):
+        return f"{STATIC_URL}/{self.payload_file}"
+
+
+_cache = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _file_key(csv_path):
+    path = os.path.abspath(csv_path)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return (path, None, None)
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+def _read_records(csv_path):
+    # Same rows as pandas.read_csv(keep_default_na=False, on_bad_lines="skip"):
+    # blank lines and rows with more fields than the header are skipped, short
+    # rows are padded with ""
+    try:
+        with open(csv_path, encoding="utf-8-sig", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            if "question" not in header or "answer" not in header:
+                return [], "CSV must have 'question' and 'answer' columns."
+            columns = ["question", "answer"] + (["category"] if "category" in header else [])
+            positions = [header.index(column) for column in columns]
+            width = len(header)
+            records = []
+            for row in reader:
+                if not row or len(row) > width:
+                    continue
+                row += [""] * (width - len(row))
+                records.append({column: row[i] for column, i in zip(columns, positions)})
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        return [], f"Error reading CSV: {e}"
+    return records, None
+
+
+def _load_mapped(csv_key, index_key):
+    if index_key[1] is None or (csv_key[1] is not None and index_key[1] < csv_key[1]):
+        # Missing, or older than the CSV it was built from
+        return None
+    try:
+        index = MappedQAIndex(index_key[0])
+        categories = {
+            category: MappedQAIndex(path) for category, path in category_index_paths(index_key[0]).items()
+        }
+    except (OSError, ValueError):
+        return None
+    return index, categories
+
+
+def load_knowledge_base(csv_path, index_path=DEFAULT_INDEX_PATH):
+    csv_key = _file_key(csv_path)
+    index_key = _file_key(index_path)
+    key = csv_key + index_key
+    with _lock:
+        kb = _cache.get(key[0])
+        if kb is not None and kb.key == key:
+            _stats["hits"] += 1
+            return kb
+        _stats["misses"] += 1
+        mapped = _load_mapped(csv_key, index_key)
+        if mapped is not None:
+            kb = KnowledgeBase(key, None, None, *mapped)
+        else:
+            if csv_key[1] is None:
+                records, error = DEFAULT_RECORDS, None
+            else:
+                records, error = _read_records(key[0])
+            kb = KnowledgeBase(key, records, error)
+        # Replaces (and so invalidates) any entry for an older version of the file
+        _cache[key[0]] = kb
+        return kb
+
+
+def cache_stats():
+    with _lock:
+        return {**_stats, "entries": len(_cache)}
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,356 @@
+import bisect
+import glob
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+from qa_engine import QAIndex, normalize, tokenize
+
+# ------------------------------
+# Compact, memory-mapped KB index
+# ------------------------------
+# kb_ingest.py streams Q&A rows into an IndexBuilder, which spools records to
+# disk and keeps only the postings in compact arrays. finish() writes a single
+# file (native-endian arrays, 8-byte aligned sections) that MappedQAIndex
+# opens with mmap, so startup cost is independent of KB size and pages are
+# loaded only when a lookup touches them:
+#
+#   header    MAGIC, version, n_docs, n_terms, n_suggest, avgdl, section offsets
+#   records   u64[n_docs + 1] offsets -> "question\0answer" UTF-8 blobs
+#   doc_len   u32[n_docs]
+#   exact     u64[n_docs] sorted hashes of normalized questions, u32[n_docs] docs
+#   terms     u64[n_terms + 1] offsets -> sorted UTF-8 terms
+#   postings  u64[n_terms + 1] offsets -> u32 [doc, tf, doc, tf, ...]
+#   suggest   u64[n_suggest + 1] offsets -> sorted distinct normalized
+#             questions (UTF-8), u32[n_suggest] doc of each
+#
+# MappedQAIndex presents these sections through the same attributes QAIndex
+# uses, so search()/lookup()/suggest() run unchanged on top of the mapped
+# file. Files of an older FORMAT_VERSION are rejected (kb_cache.py then parses
+# the CSV) until kb_ingest.py rebuilds them.
+#
+# Each KB category gets its own index file in the same format next to the
+# global one (kb_index.it_helpdesk.bin, ...; see category_index_path), so a
+# category lookup only touches that category's postings.
+
+DEFAULT_INDEX_PATH = os.getenv("KB_INDEX", os.path.join(os.path.dirname(os.path.abspath(__file__)), "kb_index.bin"))
+MAGIC = b"MRKB"
+FORMAT_VERSION = 2
+_HEADER = struct.Struct("<4sIIIId13Q")
+
+
+def _align(f):
+    # Every section starts 8-byte aligned so it can be cast in place
+    pad = -f.tell() % 8
+    if pad:
+        f.write(b"\0" * pad)
+    return f.tell()
+
+
+def category_index_path(path, category):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{category}{ext}"
+
+
+def category_index_paths(path):
+    """category -> path of the per-category index files written next to path."""
+    root, ext = os.path.splitext(path)
+    paths = {}
+    for candidate in glob.glob(glob.escape(root) + ".*" + ext):
+        category = candidate[len(root) + 1:len(candidate) - len(ext)]
+        if category and "." not in category:
+            paths[category] = candidate
+    return paths
+
+
+def question_hash(normalized):
+    return int.from_bytes(hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class IndexBuilder:
+    """Incremental builder: add() rows one at a time, then finish(path)."""
+
+    def __init__(self, spool_dir=None):
+        self._spool = tempfile.TemporaryFile(dir=spool_dir)
+        self._record_offsets = array("Q", [0])
+        self._doc_len = array("I")
+        self._hashes = array("Q")
+        self._postings = {}
+        self._total_len = 0
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def add(self, question, answer):
+        doc = len(self._doc_len)
+        blob = question.encode("utf-8") + b"\0" + answer.encode("utf-8")
+        self._spool.write(blob)
+        self._record_offsets.append(self._record_offsets[-1] + len(blob))
+        tokens = tokenize(question)
+        self._doc_len.append(len(tokens))
+        self._total_len += len(tokens)
+        self._hashes.append(question_hash(normalize(question)))
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            plist = self._postings.get(token)
+            if plist is None:
+                plist = self._postings[token] = array("I")
+            plist.extend((doc, tf))
+        return doc
+
+    def _suggest_order(self):
+        # QAIndex.suggest_order() at build time, reading the questions back
+        # from the spool
+        offsets = self._record_offsets
+        self._spool.seek(0)
+        pairs = []
+        for doc in range(len(self._doc_len)):
+            question = self._spool.read(offsets[doc + 1] - offsets[doc]).partition(b"\0")[0]
+            key = normalize(question.decode("utf-8"))
+            if key:
+                pairs.append((key, doc))
+        pairs.sort()
+        keys, docs = [], array("I")
+        for key, doc in pairs:
+            if not keys or keys[-1] != key:
+                keys.append(key)
+                docs.append(doc)
+        return keys, docs
+
+    def finish(self, path):
+        n_docs = len(self._doc_len)
+        suggest_keys, suggest_docs = self._suggest_order()
+        terms = sorted(self._postings)
+        avgdl = self._total_len / n_docs if n_docs else 0.0
+        # sorted() is stable, so duplicate hashes keep the first doc first,
+        # matching QAIndex.exact.setdefault
+        exact = array("I", sorted(range(n_docs), key=self._hashes.__getitem__))
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"\0" * _HEADER.size)
+            offsets = []
+
+            offsets.append(_align(f))
+            self._record_offsets.tofile(f)
+            offsets.append(_align(f))
+            self._spool.seek(0)
+            while True:
+                chunk = self._spool.read(1 << 20)
+                if not chunk:
+                    break
+                f.write(chunk)
+
+            offsets.append(_align(f))
+            self._doc_len.tofile(f)
+            offsets.append(_align(f))
+            array("Q", (self._hashes[doc] for doc in exact)).tofile(f)
+            offsets.append(_align(f))
+            exact.tofile(f)
+
+            term_blobs = [t.encode("utf-8") for t in terms]
+            term_offsets = array("Q", [0])
+            for blob in term_blobs:
+                term_offsets.append(term_offsets[-1] + len(blob))
+            offsets.append(_align(f))
+            term_offsets.tofile(f)
+            offsets.append(_align(f))
+            f.write(b"".join(term_blobs))
+
+            posting_offsets = array("Q", [0])
+            for term in terms:
+                posting_offsets.append(posting_offsets[-1] + len(self._postings[term]))
+            offsets.append(_align(f))
+            posting_offsets.tofile(f)
+            offsets.append(_align(f))
+            for term in terms:
+                self._postings[term].tofile(f)
+
+            key_blobs = [key.encode("utf-8") for key in suggest_keys]
+            key_offsets = array("Q", [0])
+            for blob in key_blobs:
+                key_offsets.append(key_offsets[-1] + len(blob))
+            offsets.append(_align(f))
+            key_offsets.tofile(f)
+            offsets.append(_align(f))
+            f.write(b"".join(key_blobs))
+            offsets.append(_align(f))
+            suggest_docs.tofile(f)
+            offsets.append(_align(f))
+
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, n_docs, len(terms), len(suggest_keys), avgdl, *offsets))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._spool.close()
+        return n_docs
+
+
+# ---- read side ----
+class _Records:
+    # Sequence of (question, answer), decoded on access
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return self._index.n_docs
+
+    def __getitem__(self, doc):
+        if doc < 0:
+            doc += len(self)
+        if not 0 <= doc < len(self):
+            raise IndexError(doc)
+        ix = self._index
+        start = ix.records_base + ix.record_offsets[doc]
+        end = ix.records_base + ix.record_offsets[doc + 1]
+        question, _, answer = ix.data[start:end].decode("utf-8").partition("\0")
+        return question, answer
+
+
+class _Exact:
+    # normalized question -> doc, via binary search over the sorted hashes
+    def __init__(self, index):
+        self._index = index
+
+    def get(self, normalized, default=None):
+        ix = self._index
+        h = question_hash(normalized)
+        i = bisect.bisect_left(ix.exact_hashes, h)
+        while i < len(ix.exact_hashes) and ix.exact_hashes[i] == h:
+            doc = ix.exact_docs[i]
+            if normalize(ix.records[doc][0]) == normalized:
+                return doc
+            i += 1
+        return default
+
+    def to_dict(self):
+        exact = {}
+        for doc in range(self._index.n_docs):
+            exact.setdefault(normalize(self._index.records[doc][0]), doc)
+        return exact
+
+
+class _Postings:
+    # term -> flat [doc, tf, ...] u32 view straight out of the mapping
+    def __init__(self, index):
+        self._index = index
+
+    def _find(self, term):
+        ix = self._index
+        key = term.encode("utf-8")
+        lo, hi = 0, ix.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = ix.terms_base + ix.term_offsets[mid]
+            end = ix.terms_base + ix.term_offsets[mid + 1]
+            if ix.data[start:end] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < ix.n_terms:
+            start = ix.terms_base + ix.term_offsets[lo]
+            if ix.data[start:ix.terms_base + ix.term_offsets[lo + 1]] == key:
+                return lo
+        return None
+
+    def __contains__(self, term):
+        return self._find(term) is not None
+
+    def __getitem__(self, term):
+        i = self._find(term)
+        if i is None:
+            raise KeyError(term)
+        ix = self._index
+        start = ix.postings_base + 4 * ix.posting_offsets[i]
+        end = ix.postings_base + 4 * ix.posting_offsets[i + 1]
+        return ix.buf[start:end].cast("I")
+
+    def items(self):
+        ix = self._index
+        for i in range(ix.n_terms):
+            start = ix.terms_base + ix.term_offsets[i]
+            term = ix.data[start:ix.terms_base + ix.term_offsets[i + 1]].decode("utf-8")
+            yield term, self[term]
+
+
+class _SuggestKeys:
+    # Sequence of the sorted normalized questions, decoded on access, so
+    # QAIndex.suggest() bisects it in place
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return self._index.n_suggest
+
+    def __getitem__(self, i):
+        ix = self._index
+        if not 0 <= i < ix.n_suggest:
+            raise IndexError(i)
+        start = ix.suggest_base + ix.suggest_offsets[i]
+        return ix.data[start:ix.suggest_base + ix.suggest_offsets[i + 1]].decode("utf-8")
+
+
+class _Idf:
+    def __init__(self, index):
+        self._index = index
+
+    def __getitem__(self, term):
+        df = len(self._index.postings[term]) // 2
+        n_docs = self._index.n_docs
+        return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+
+class MappedQAIndex(QAIndex):
+    """QAIndex over a file written by IndexBuilder.finish()."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise ValueError(f"{path}: not a KB index")
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # data slices give bytes (terms, records); buf casts give number arrays
+        buf = self.buf = memoryview(self.data)
+        magic, version, self.n_docs, self.n_terms, self.n_suggest, self.avgdl, *offsets = _HEADER.unpack_from(buf)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported KB index format")
+        (rec_off, rec_blob, doc_len, ex_hash, ex_doc, term_off, term_blob, post_off, post_blob,
+         sug_off, sug_blob, sug_doc, end) = offsets
+        self.record_offsets = buf[rec_off:rec_blob].cast("Q")
+        self.records_base = rec_blob
+        self.doc_len = buf[doc_len:ex_hash].cast("I")
+        self.exact_hashes = buf[ex_hash:ex_doc].cast("Q")
+        self.exact_docs = buf[ex_doc:term_off].cast("I")
+        self.term_offsets = buf[term_off:term_blob].cast("Q")
+        self.terms_base = term_blob
+        self.posting_offsets = buf[post_off:post_blob].cast("Q")
+        self.postings_base = post_blob
+        self.suggest_offsets = buf[sug_off:sug_blob].cast("Q")
+        self.suggest_base = sug_blob
+        self.suggest_docs = buf[sug_doc:sug_doc + 4 * self.n_suggest].cast("I")
+        self.records = _Records(self)
+        self.exact = _Exact(self)
+        self.postings = _Postings(self)
+        self.idf = _Idf(self)
+        self._suggest = (_SuggestKeys(self), self.suggest_docs)
+
+    def to_payload(self):
+        # Materializes the whole index for the browser widget; very large
+        # KBs should answer through api_server.py instead
+        payload = super().to_payload()
+        payload.update(
+            exact=self.exact.to_dict(),
+            postings={term: list(plist) for term, plist in self.postings.items()},
+            idf={term: self.idf[term] for term, _ in self.postings.items()},
+            doc_len=list(self.doc_len),
+            suggest=list(self.suggest_docs),
+        )
+        return payload
@@ -0,0 +1,151 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from itertools import islice
+
+from kb_index import DEFAULT_INDEX_PATH, IndexBuilder, category_index_path, category_index_paths, question_hash
+from qa_engine import category_slug, normalize
+
+# ------------------------------
+# Knowledge base ingestion
+# ------------------------------
+# Streams one or more CSV sources (question/answer and an optional category
+# column, any order, extra columns ignored) in chunks into a
+# kb_index.IndexBuilder and writes the memory-mapped index that kb_cache.py
+# loads at startup, plus one index per category next to it. Rows are never all
+# in memory: records are spooled to disk and only postings plus one 8-byte
+# hash per accepted question are kept for deduplication.
+#
+#   python kb_ingest.py                         # the two bundled sources
+#   python kb_ingest.py faq1.csv faq2.csv -o kb_index.bin --rejects rejects.csv
+#
+# Questions are whitespace-collapsed and deduplicated on qa_engine.normalize();
+# the first source wins. Every skipped row is written to the rejects CSV with
+# its source, line and reason instead of being dropped silently.
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCES = [
+    os.path.join(BASE_PATH, "multi_recruit_ai_full_qa.csv"),
+    os.path.join(BASE_PATH, "UTF-8.txt"),
+]
+CHUNK_ROWS = 10000
+MAX_QUESTION_CHARS = 1000
+MAX_ANSWER_CHARS = 20000
+
+
+def _columns(header):
+    names = [h.strip().lower() for h in header]
+    if "question" not in names or "answer" not in names:
+        return None
+    c_col = names.index("category") if "category" in names else None
+    return names.index("question"), names.index("answer"), c_col, len(names)
+
+
+def _check(row, columns):
+    q_col, a_col, c_col, width = columns
+    if not any(field.strip() for field in row):
+        return None, None, None, "blank line"
+    if len(row) != width:
+        return None, None, None, f"expected {width} fields, got {len(row)}"
+    question = " ".join(row[q_col].split())
+    answer = row[a_col].strip()
+    category = category_slug(row[c_col]) if c_col is not None else ""
+    if "\ufffd" in question or "\ufffd" in answer:
+        return None, None, None, "invalid UTF-8"
+    if not question:
+        return None, None, None, "empty question"
+    if not answer:
+        return None, None, None, "empty answer"
+    if len(question) > MAX_QUESTION_CHARS or len(answer) > MAX_ANSWER_CHARS:
+        return None, None, None, "field too long"
+    return question, answer, category, None
+
+
+def ingest(sources, output, rejects_path=None, chunk_rows=CHUNK_ROWS, log=sys.stderr):
+    """Build the index at output from sources; returns a per-source report."""
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+    spool_dir = os.path.dirname(os.path.abspath(output))
+    builder = IndexBuilder(spool_dir=spool_dir)
+    category_builders = {}
+    seen = set()
+    report = []
+    rejects_file = open(rejects_path, "w", encoding="utf-8", newline="") if rejects_path else None
+    rejects = csv.writer(rejects_file) if rejects_file else None
+    if rejects:
+        rejects.writerow(["source", "line", "reason", "row"])
+    started = time.perf_counter()
+    try:
+        for source in sources:
+            stats = {"source": source, "accepted": 0, "duplicates": 0, "rejected": 0, "error": None}
+            report.append(stats)
+            try:
+                f = open(source, "r", encoding="utf-8-sig", errors="replace", newline="")
+            except OSError as e:
+                stats["error"] = str(e)
+                continue
+            with f:
+                reader = csv.reader(f)
+                columns = _columns(next(reader, []))
+                if columns is None:
+                    stats["error"] = "missing 'question'/'answer' header"
+                    continue
+                while True:
+                    chunk = list(islice(reader, chunk_rows))
+                    if not chunk:
+                        break
+                    for row in chunk:
+                        question, answer, category, reason = _check(row, columns)
+                        if reason is None:
+                            key = question_hash(normalize(question))
+                            if key in seen:
+                                stats["duplicates"] += 1
+                                reason = "duplicate question"
+                            else:
+                                seen.add(key)
+                                builder.add(question, answer)
+                                if category:
+                                    if category not in category_builders:
+                                        category_builders[category] = IndexBuilder(spool_dir=spool_dir)
+                                    category_builders[category].add(question, answer)
+                                stats["accepted"] += 1
+                                continue
+                        else:
+                            stats["rejected"] += 1
+                        if rejects:
+                            rejects.writerow([source, reader.line_num, reason, "|".join(row)[:200]])
+                    print(f"{os.path.basename(source)}: {reader.line_num} lines, {len(builder)} docs", file=log)
+        # Category files first and the global index last: kb_cache keys its
+        # cache on the global file, so readers switch over only once all are written
+        for category, category_builder in sorted(category_builders.items()):
+            n = category_builder.finish(category_index_path(output, category))
+            print(f"wrote {n} docs to category {category}", file=log)
+        for category, path in category_index_paths(output).items():
+            if category not in category_builders:
+                os.remove(path)
+        n_docs = builder.finish(output)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+    print(f"wrote {n_docs} docs to {output} in {time.perf_counter() - started:.1f}s", file=log)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the memory-mapped Q&A index from CSV sources.")
+    parser.add_argument("sources", nargs="*", default=DEFAULT_SOURCES)
+    parser.add_argument("-o", "--output", default=DEFAULT_INDEX_PATH)
+    parser.add_argument("--rejects", help="CSV file listing skipped rows (default: <output>.rejects.csv)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    report = ingest(args.sources, args.output, args.rejects or args.output + ".rejects.csv", args.chunk_rows)
+    for stats in report:
+        line = f"{stats['source']}: {stats['accepted']} accepted, {stats['duplicates']} duplicates, {stats['rejected']} rejected"
+        print(line + (f" (error: {stats['error']})" if stats["error"] else ""))
+    return 0 if all(stats["error"] is None for stats in report) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import time
+
+import streamlit as st
+
+import metrics
+
+# ------------------------------
+# Live chat refresh helpers
+# ------------------------------
+# The chat areas are rendered inside Streamlit fragments that tick every
+# LIVE_POLL_SECONDS. Each tick costs one ticket_version() lookup. When that
+# version moved, only the messages after the last seen sequence number are
+# read (synced_messages), and only the fragment reruns, not the whole script.
+# Streamlit versions without fragments fall back to full-page polling.
+
+LIVE_POLL_SECONDS = 2
+
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+
+def rerun(fragment_only=False):
+    if fragment_only and _fragment is not None:
+        try:
+            st.rerun(scope="fragment")
+            return
+        except TypeError:
+            pass
+    # st.rerun() ends the script here: record (and stop profiling) this run first
+    metrics.finish_current()
+    if hasattr(st, "rerun"):
+        st.rerun()
+    else:
+        st.experimental_rerun()
+
+
+def live_fragment(run_every=LIVE_POLL_SECONDS):
+    def decorator(fn):
+        if _fragment is not None:
+            return _fragment(run_every=run_every)(fn)
+
+        def polled(*args, **kwargs):
+            fn(*args, **kwargs)
+            time.sleep(run_every)
+            rerun()
+
+        return polled
+
+    return decorator
+
+
+def versioned(store, ticket_id, cache_key, load):
+    """Return load() for the ticket, re-running it only when the ticket's
+    version in the store has changed since the cached copy was taken."""
+    version = store.ticket_version(ticket_id)
+    cached = st.session_state.get(cache_key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    value = load()
+    st.session_state[cache_key] = (version, value)
+    return value
+
+
+def list_changed(store, cache_key):
+    """True when tickets were created or closed since the last call."""
+    version = store.list_version()
+    previous = st.session_state.get(cache_key)
+    st.session_state[cache_key] = version
+    return previous is not None and previous != version
+
+
+def synced_messages(store, ticket_id, cache_key, tail=20, keep=None):
+    """The ticket's newest messages, kept in session_state and brought up to
+    date with store.messages_since(): a refresh reads only messages newer than
+    the last seq this session has seen, and nothing at all when the ticket's
+    version is unchanged. keep caps how many messages are held.
+
+    Returns the cached window: {"messages", "cursor" (last seq seen),
+    "has_older", "version"}."""
+    version = store.ticket_version(ticket_id)
+    window = st.session_state.get(cache_key)
+    if window is None:
+        page = store.get_messages(ticket_id, limit=tail)
+        window = {
+            "messages": page.messages,
+            "cursor": page.messages[-1].seq if page.messages else 0,
+            "has_older": page.has_older,
+            "version": version,
+        }
+    elif window["version"] != version:
+        while True:
+            new, cursor = store.messages_since(ticket_id, window["cursor"])
+            window["messages"] = window["messages"] + new
+            window["cursor"] = cursor
+            if len(new) < 100:
+                break
+        window["version"] = version
+    if keep is not None and len(window["messages"]) > keep:
+        window["messages"] = window["messages"][-keep:]
+        window["has_older"] = True
+    st.session_state[cache_key] = window
+    return window
+
+
+def load_older(store, ticket_id, cache_key, limit):
+    """Prepend the page before the oldest message held by synced_messages()."""
+    window = st.session_state.get(cache_key)
+    if not window or not window["messages"]:
+        return
+    page = store.get_messages(ticket_id, limit=limit, before=window["messages"][0].seq)
+    window["messages"] = page.messages + window["messages"]
+    window["has_older"] = page.has_older
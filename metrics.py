@@ -0,0 +1,315 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# ------------------------------
+# Lightweight process-wide metrics
+# ------------------------------
+# Counters and histograms live in this module, so every rerun and session of
+# a Streamlit process feeds the same aggregates. app.py and admin.py wrap
+# each phase of a rerun in phase(); the stores and the bot count bytes and
+# hits with inc(); point-in-time values (cache sizes) are gauge()s, which may
+# be callables evaluated only when exported.
+# Aggregates are exported as:
+#   - Prometheus text: prometheus_text(), served on METRICS_PORT if set
+#   - JSONL: a snapshot line every METRICS_FLUSH_SECONDS appended to
+#     METRICS_DIR/metrics.jsonl (rotated at METRICS_JSONL_MAX_BYTES)
+# cProfile capture is opt-in: METRICS_PROFILE=1 profiles every session, and
+# an admin can profile their own admin.py session with ?profile=1. Each
+# profiled rerun writes METRICS_DIR/profiles/<script>-<session>-<time>.prof;
+# only the newest METRICS_PROFILE_MAX_FILES dumps are kept.
+
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0") or 0)
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "60"))
+METRICS_JSONL_MAX_BYTES = 5 * 1024 * 1024
+METRICS_JSONL_BACKUPS = 5
+METRICS_PROFILE = os.getenv("METRICS_PROFILE", "") == "1"
+METRICS_PROFILE_MAX_FILES = int(os.getenv("METRICS_PROFILE_MAX_FILES", "200"))
+
+# Upper bounds in seconds; phases range from sub-millisecond lookups to
+# multi-second cold CSV loads
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def to_dict(self):
+        return {"buckets": list(self.buckets), "counts": list(self.counts), "sum": self.total, "count": self.count}
+
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> float
+_histograms = {}  # (name, labels) -> Histogram
+_gauges = {}      # (name, labels) -> float or zero-argument callable
+_last_flush = [time.monotonic()]
+_current = threading.local()  # the Rerun of the script run on this thread
+_jsonl_logger = None
+_server = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram()
+        hist.observe(value)
+
+
+def gauge(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def _gauge_items():
+    with _lock:
+        items = sorted(_gauges.items())
+    # Callables run outside the lock; they may take locks of their own
+    return [(key, value() if callable(value) else value) for key, value in items]
+
+
+@contextmanager
+def phase(script, name):
+    """Time one phase of a rerun into phase_seconds{script, phase}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("phase_seconds", time.perf_counter() - start, script=script, phase=name)
+
+
+def snapshot():
+    gauges = _gauge_items()
+    with _lock:
+        return {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(_counters.items())
+            ],
+            "gauges": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in gauges
+            ],
+            "histograms": [
+                {"name": name, "labels": dict(labels), **hist.to_dict()}
+                for (name, labels), hist in sorted(_histograms.items(), key=lambda item: item[0])
+            ],
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _gauges.clear()
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def prometheus_text():
+    lines, typed = [], set()
+    gauges = _gauge_items()
+    with _lock:
+        for (name, labels), value in sorted(_counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            if name not in typed:
+                lines.append(f"# TYPE {name} gauge")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), hist in sorted(_histograms.items(), key=lambda item: item[0]):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist.total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+    return "\n".join(lines) + "\n"
+
+
+# ---- exports ----
+def _jsonl():
+    global _jsonl_logger
+    if _jsonl_logger is None:
+        import logging
+        from logging.handlers import RotatingFileHandler
+
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        logger = logging.getLogger("multirecruit.metrics")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = RotatingFileHandler(
+            os.path.join(METRICS_DIR, "metrics.jsonl"),
+            maxBytes=METRICS_JSONL_MAX_BYTES,
+            backupCount=METRICS_JSONL_BACKUPS,
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        _jsonl_logger = logger
+    return _jsonl_logger
+
+
+def flush_jsonl():
+    record = {"time": datetime.now().isoformat(timespec="seconds"), "pid": os.getpid(), **snapshot()}
+    _jsonl().info(json.dumps(record, separators=(",", ":")))
+
+
+def maybe_flush():
+    # Called at the end of every rerun; writes at most one line per interval
+    now = time.monotonic()
+    with _lock:
+        if now - _last_flush[0] < METRICS_FLUSH_SECONDS:
+            return
+        _last_flush[0] = now
+    try:
+        flush_jsonl()
+    except OSError:
+        pass
+
+
+def _handler_class():
+    # http.server (and the ssl/email modules behind it) is only imported when
+    # the exporter is enabled
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return MetricsHandler
+
+
+def start_exporter(port=None):
+    """Serve /metrics once per process; a no-op unless a port is configured."""
+    global _server
+    port = METRICS_PORT if port is None else port
+    with _lock:
+        if _server is not None or not port:
+            return _server
+        from http.server import ThreadingHTTPServer
+
+        try:
+            _server = ThreadingHTTPServer(("127.0.0.1", port), _handler_class())
+        except OSError:
+            # Another Streamlit process (app.py vs admin.py) already owns it
+            return None
+    threading.Thread(target=_server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return _server
+
+
+# ---- per-rerun bookkeeping ----
+class Rerun:
+    """Tracks one script run: counts it, times it and optionally profiles it."""
+
+    def __init__(self, script, session_id=None, profile=False):
+        self.script = script
+        self.session_id = session_id or "anon"
+        self.start = time.perf_counter()
+        self.profiler = None
+        inc("reruns_total", script=script)
+        start_exporter()
+        self.finished = False
+        _current.rerun = self
+        if profile or METRICS_PROFILE:
+            import cProfile
+
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self.profiler = profiler
+            except ValueError:
+                # Only one profiler can be active; another session holds it
+                pass
+
+    def finish(self):
+        # Call before st.stop() and at the end of the script;
+        # live_updates.rerun() calls it (finish_current) before st.rerun()
+        if self.finished:
+            return
+        self.finished = True
+        observe("rerun_seconds", time.perf_counter() - self.start, script=self.script)
+        if self.profiler is not None:
+            self.profiler.disable()
+            path = os.path.join(
+                METRICS_DIR, "profiles", f"{self.script}-{self.session_id}-{datetime.now():%Y%m%d-%H%M%S-%f}.prof"
+            )
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self.profiler.dump_stats(path)
+                _prune_profiles(os.path.dirname(path))
+            except OSError:
+                pass
+            self.profiler = None
+        maybe_flush()
+
+
+def finish_current():
+    """Finish the Rerun started on this thread, if any (idempotent)."""
+    rerun = getattr(_current, "rerun", None)
+    if rerun is not None:
+        rerun.finish()
+
+
+def _prune_profiles(directory, keep=METRICS_PROFILE_MAX_FILES):
+    # Oldest dumps go first; names end in a sortable timestamp, so go by mtime
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".prof")]
+    if len(paths) <= keep:
+        return
+    paths.sort(key=os.path.getmtime)
+    for path in paths[:len(paths) - keep]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
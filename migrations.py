@@ -0,0 +1,208 @@
+import json
+import os
+import sys
+from datetime import datetime
+
+# ------------------------------
+# On-disk schema versions
+# ------------------------------
+# 0  legacy: whatever older app.py/admin.py versions left in support_chat.json
+#    (a {"tickets": ...} wrapper, a flat {id: ticket} dict, both mixed, bare
+#    message lists, "sender"/"timestamp" or "role"/"time" message keys, ...)
+# 1  normalized: {id: {"messages": [{"role", "text", "time"}], "closed", "created_at"}}
+# 2  models.py: {id: {"messages": [{"role", "text", "ts"}], "closed", "created_at"}}
+#    with integer epoch "ts"/"created_at"
+# 3  every message carries its per-ticket sequence number "seq" (1, 2, ...)
+# 4  closed tickets carry "closed_at" (epoch); SQLite also fills the
+#    last_activity/closed_at columns and the daily_counts table
+# 5  the stores keep a full-text index of message text (ticket_search.py);
+#    ticket data is unchanged, the rewrite fills the SQLite search tables
+#
+# Stores record their schema version. get_ticket_store() runs migrate() once
+# when a store is behind SCHEMA_VERSION; after that every read is a plain,
+# read-only fetch with no normalization. Run `python migrations.py` to
+# migrate explicitly (e.g. before rolling out a new version).
+
+SCHEMA_VERSION = 5
+
+
+def normalize_message(m):
+    if not isinstance(m, dict):
+        return {"role": "user", "text": str(m), "time": ""}
+    role = m.get("role", m.get("sender", "user"))
+    text = m.get("text", m.get("message", str(m)))
+    time_value = m.get("time", m.get("timestamp", ""))
+    if isinstance(time_value, (int, float)):
+        time_value = str(datetime.fromtimestamp(time_value))
+    return {"role": role, "text": text, "time": time_value}
+
+
+# Fields of the pseudo-ticket older admin.py made out of app.py's "tickets" key
+PSEUDO_TICKET_FIELDS = ("messages", "closed", "created_at")
+
+
+def normalize_legacy(raw, created_at):
+    # created_at is stamped onto legacy tickets that never recorded one
+    if isinstance(raw, dict) and isinstance(raw.get("tickets"), dict):
+        return _merge_wrapped(raw, created_at)
+    return _normalize_flat(raw, created_at)
+
+
+def _merge_wrapped(raw, created_at):
+    # Older app.py kept its tickets under "tickets". Older admin.py read that
+    # key as a ticket named "tickets" (its messages are stringified copies of
+    # the tickets it held) and saved it back next to its own flat tickets,
+    # after which app.py went on adding tickets inside it. Lift the nested
+    # tickets to the top level, merge them with flat tickets of the same id and
+    # drop the pseudo-ticket itself.
+    wrapped = raw["tickets"]
+    if "messages" in wrapped:
+        wrapped = {k: v for k, v in wrapped.items() if k not in PSEUDO_TICKET_FIELDS}
+    normalized = _normalize_flat({k: v for k, v in raw.items() if k != "tickets"}, created_at)
+    for ticket_id, ticket in _normalize_flat(wrapped, created_at).items():
+        existing = normalized.get(ticket_id)
+        if existing is None:
+            normalized[ticket_id] = ticket
+        else:
+            existing["messages"] = sorted(existing["messages"] + ticket["messages"], key=lambda m: str(m["time"]))
+    return normalized
+
+
+def _normalize_flat(raw, created_at):
+    if raw is None:
+        return {}
+    if isinstance(raw, list):
+        ticket_id = f"TCKT-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        return {
+            ticket_id: {
+                "messages": [normalize_message(m) for m in raw],
+                "closed": False,
+                "created_at": created_at,
+            }
+        }
+    if not isinstance(raw, dict):
+        return {}
+
+    normalized = {}
+    for k, v in raw.items():
+        if isinstance(v, (list, dict)) and not v:
+            # Empty leftovers such as {"messages": []} are not tickets
+            continue
+        if isinstance(v, list):
+            messages = [normalize_message(m) for m in v]
+            closed = False
+        elif isinstance(v, dict) and "messages" in v:
+            messages = [normalize_message(m) for m in v.get("messages", [])]
+            closed = bool(v.get("closed", False))
+            normalized[k] = {
+                "messages": messages,
+                "closed": closed,
+                "created_at": v.get("created_at") or created_at,
+            }
+            continue
+        elif isinstance(v, dict):
+            messages = [normalize_message(sub_v) for sub_v in v.values()]
+            closed = False
+        else:
+            messages = [normalize_message(str(v))]
+            closed = False
+        normalized[k] = {"messages": messages, "closed": closed, "created_at": created_at}
+    return normalized
+
+
+def _to_epoch(value):
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(str(value)).timestamp())
+    except ValueError:
+        return 0
+
+
+def upgrade_to_epoch(tickets):
+    return {
+        ticket_id: {
+            "messages": [
+                {"role": m.get("role", "user"), "text": m.get("text", ""), "ts": _to_epoch(m.get("time", ""))}
+                for m in info.get("messages", [])
+            ],
+            "closed": bool(info.get("closed", False)),
+            "created_at": _to_epoch(info.get("created_at", "")),
+        }
+        for ticket_id, info in tickets.items()
+    }
+
+
+def upgrade_to_seq(tickets):
+    for info in tickets.values():
+        for seq, m in enumerate(info.get("messages", []), 1):
+            m["seq"] = seq
+    return tickets
+
+
+def upgrade_to_activity(tickets):
+    # Tickets closed before closed_at was recorded count as closed at their
+    # last activity
+    for info in tickets.values():
+        if info.get("closed") and not info.get("closed_at"):
+            messages = info.get("messages", [])
+            info["closed_at"] = max([info.get("created_at", 0)] + [m.get("ts", 0) for m in messages[-1:]])
+    return tickets
+
+
+def upgrade_to_search(tickets):
+    return tickets
+
+
+def _legacy_created_at(chat_file):
+    try:
+        return str(datetime.fromtimestamp(os.path.getmtime(chat_file)))
+    except OSError:
+        return str(datetime.now())
+
+
+def _legacy_list_tickets(chat_file, created_at):
+    # Very old files were a bare list of messages; the snapshot reader
+    # ignores those, so fold them in here
+    try:
+        with open(chat_file, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return normalize_legacy(raw, created_at) if isinstance(raw, list) else {}
+
+
+def migrate(store, chat_file):
+    """Bring store up to SCHEMA_VERSION. Returns True if anything was rewritten."""
+    current = store.schema_version()
+    if current >= SCHEMA_VERSION:
+        return False
+    created_at = _legacy_created_at(chat_file)
+
+    def upgrade_to_normalized(tickets):
+        upgraded = normalize_legacy(tickets, created_at)
+        for ticket_id, ticket in _legacy_list_tickets(chat_file, created_at).items():
+            upgraded.setdefault(ticket_id, ticket)
+        return upgraded
+
+    # steps[n] upgrades version n to n + 1
+    steps = [upgrade_to_normalized, upgrade_to_epoch, upgrade_to_seq, upgrade_to_activity, upgrade_to_search]
+
+    def upgrade(tickets):
+        for step in steps[current:]:
+            tickets = step(tickets)
+        return tickets
+
+    return store.migrate(upgrade, SCHEMA_VERSION)
+
+
+if __name__ == "__main__":
+    from ticket_store import get_ticket_store
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "support_chat.json"
+    )
+    store = get_ticket_store(path, auto_migrate=False)
+    before = store.schema_version()
+    changed = migrate(store, path)
+    print(f"schema version {before} -> {store.schema_version()}" + ("" if changed else " (already current)"))
@@ -0,0 +1,107 @@
+import json
+import time
+from datetime import datetime
+from enum import Enum
+
+# orjson is optional; the stdlib codec produces the same JSON, just slower
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ------------------------------
+# Shared ticket/message model
+# ------------------------------
+# The one data model used by app.py, admin.py and every ticket store.
+# Timestamps are integer epoch seconds; roles are enum singletons, so a
+# message costs three slot references instead of a dict.
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Role(str, Enum):
+    USER = "user"
+    ADMIN = "admin"
+
+    @classmethod
+    def parse(cls, value):
+        # Anything that is not the user is support staff
+        return cls.USER if value == "user" else cls.ADMIN
+
+
+def now_ts() -> int:
+    return int(time.time())
+
+
+def format_ts(ts: int) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else ""
+
+
+def format_day(ts: int) -> str:
+    # Local calendar day, the bucket for per-day ticket counts
+    return datetime.fromtimestamp(ts or 0).strftime("%Y-%m-%d")
+
+
+class Message:
+    # seq is the message's 1-based position in its ticket, assigned by the
+    # store on append; it is None on a message that has not been stored yet
+    __slots__ = ("role", "text", "ts", "seq")
+
+    def __init__(self, role: Role, text: str, ts: int = None, seq: int = None):
+        self.role = role
+        self.text = text
+        self.ts = now_ts() if ts is None else ts
+        self.seq = seq
+
+    def to_dict(self):
+        d = {"role": self.role.value, "text": self.text, "ts": self.ts}
+        if self.seq is not None:
+            d["seq"] = self.seq
+        return d
+
+    @classmethod
+    def from_dict(cls, d, seq=None):
+        seq = d.get("seq") if seq is None else seq
+        return cls(Role.parse(d.get("role")), d.get("text", ""), int(d.get("ts", 0)), seq)
+
+    def __repr__(self):
+        return f"Message({self.role.value!r}, {self.text!r}, {self.ts}, seq={self.seq})"
+
+
+class Ticket:
+    __slots__ = ("ticket_id", "messages", "closed", "created_at")
+
+    def __init__(self, ticket_id: str, messages=None, closed: bool = False, created_at: int = None):
+        self.ticket_id = ticket_id
+        self.messages = messages if messages is not None else []
+        self.closed = closed
+        self.created_at = now_ts() if created_at is None else created_at
+
+    def to_dict(self):
+        return {
+            "messages": [m.to_dict() for m in self.messages],
+            "closed": self.closed,
+            "created_at": self.created_at,
+        }
+
+    @classmethod
+    def from_dict(cls, ticket_id, d):
+        return cls(
+            ticket_id,
+            [Message.from_dict(m, seq) for seq, m in enumerate(d.get("messages", []), 1)],
+            bool(d.get("closed", False)),
+            int(d.get("created_at", 0)),
+        )
+
+    def __repr__(self):
+        return f"Ticket({self.ticket_id!r}, {len(self.messages)} messages, closed={self.closed})"
@@ -0,0 +1,364 @@
+import bisect
+import heapq
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import metrics
+
+# ------------------------------
+# Q&A retrieval engine
+# ------------------------------
+# Built once from the knowledge base records:
+#   exact     normalized question -> doc id          (O(1) exact hit)
+#   postings  token -> [doc, tf, doc, tf, ...]        (inverted index)
+#   idf/doc_len/avgdl for BM25 ranking over the postings of the query tokens
+# The same payload is shipped to the chat widget, where SEARCH_JS runs the
+# identical normalization and scoring, so both sides answer the same way.
+# Server-side answers go through a process-wide AnswerCache, since support
+# traffic repeats the same few questions across sessions.
+
+NO_ANSWER = "Sorry, I don’t have an answer for this."
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Posting lists longer than this are only probed for docs that rarer query
+# terms already matched, which keeps lookups flat as the KB grows.
+MAX_POSTINGS_SCAN = 1000
+
+SUGGEST_LIMIT = 8  # type-ahead suggestions per keystroke
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds
+
+STOPWORDS = frozenset(
+    "a an and are can do does for how i in is it me my of on or the this to what when where which who why with "
+    "you your".split()
+)
+
+_NON_WORD = re.compile(r"[^0-9a-z\u00c0-\uffff]+")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    return _NON_WORD.sub(" ", text).strip()
+
+
+def category_slug(text):
+    # "IT Helpdesk" / "it_helpdesk" -> "it_helpdesk"; "" means uncategorized
+    return "_".join(normalize(text).split())
+
+
+def _posting_tf(plist, doc):
+    # Binary search over the doc ids of a flat [doc, tf, doc, tf, ...] list
+    lo, hi = 0, len(plist) // 2
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if plist[2 * mid] < doc:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < len(plist) // 2 and plist[2 * lo] == doc:
+        return plist[2 * lo + 1]
+    return 0
+
+
+def tokenize(text):
+    tokens = [t for t in normalize(text).split(" ") if t and t not in STOPWORDS]
+    if not tokens:
+        # Queries made only of stopwords ("hi", "how are you") still need terms
+        tokens = [t for t in normalize(text).split(" ") if t]
+    return tokens
+
+
+class QAIndex:
+    def __init__(self, records):
+        self.records = [(str(r.get("question", "")), str(r.get("answer", ""))) for r in records]
+        self.exact = {}
+        postings = {}
+        self.doc_len = []
+        for doc, (question, _) in enumerate(self.records):
+            self.exact.setdefault(normalize(question), doc)
+            tokens = tokenize(question)
+            self.doc_len.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).extend((doc, tf))
+        self.postings = postings
+        n_docs = len(self.records)
+        self.avgdl = (sum(self.doc_len) / n_docs) if n_docs else 0.0
+        self.idf = {}
+        for token, plist in postings.items():
+            df = len(plist) // 2
+            self.idf[token] = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        self._suggest = None
+        self.suggest_order()
+
+    def __len__(self):
+        return len(self.records)
+
+    def search(self, query, limit=5):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.records:
+            return []
+        scores, matched = {}, {}
+        avgdl = self.avgdl or 1.0
+        present = sorted((t for t in terms if t in self.postings), key=lambda t: (len(self.postings[t]), t))
+        for term in present:
+            plist = self.postings[term]
+            idf = self.idf[term]
+            if scores and len(plist) // 2 > MAX_POSTINGS_SCAN:
+                pairs = [(doc, _posting_tf(plist, doc)) for doc in sorted(scores)]
+            else:
+                pairs = [(plist[i], plist[i + 1]) for i in range(0, len(plist), 2)]
+            for doc, tf in pairs:
+                if not tf:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[doc] / avgdl)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+                matched[doc] = matched.get(doc, 0) + 1
+        # Require at least half of the query terms to appear in the question
+        min_match = (len(terms) + 1) // 2
+        ranked = heapq.nlargest(
+            limit,
+            ((score, -doc) for doc, score in scores.items() if matched[doc] >= min_match),
+        )
+        return [(-neg_doc, score) for score, neg_doc in ranked]
+
+    def suggest_order(self):
+        """(sorted distinct normalized questions, doc of each) for prefix lookups."""
+        if getattr(self, "_suggest", None) is None:
+            keys, docs = [], []
+            for key, doc in sorted((normalize(question), doc) for doc, (question, _) in enumerate(self.records)):
+                if key and (not keys or keys[-1] != key):
+                    keys.append(key)
+                    docs.append(doc)
+            self._suggest = (keys, docs)
+        return self._suggest
+
+    def suggest(self, text, limit=SUGGEST_LIMIT):
+        """Questions whose normalized form starts with the normalized text, A-Z."""
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        if text[-1:].isspace():
+            # "how do " should not match "how does ..."
+            prefix += " "
+        keys, docs = self.suggest_order()
+        out = []
+        i = bisect.bisect_left(keys, prefix)
+        while i < len(keys) and len(out) < limit and keys[i].startswith(prefix):
+            out.append(self.records[docs[i]][0])
+            i += 1
+        return out
+
+    def lookup(self, query):
+        doc = self.exact.get(normalize(query))
+        if doc is None:
+            hits = self.search(query, limit=1)
+            if not hits:
+                return None
+            doc = hits[0][0]
+        return self.records[doc][1]
+
+    def to_payload(self):
+        return {
+            "version": 1,
+            "records": [list(r) for r in self.records],
+            "exact": self.exact,
+            "postings": self.postings,
+            "idf": self.idf,
+            "doc_len": self.doc_len,
+            "avgdl": self.avgdl,
+            "k1": BM25_K1,
+            "b": BM25_B,
+            "max_scan": MAX_POSTINGS_SCAN,
+            "stopwords": sorted(STOPWORDS),
+            # Doc ids in normalized-question order, for qaSuggest()
+            "suggest": self.suggest_order()[1],
+        }
+
+
+class AnswerCache:
+    """Bounded LRU of lookup results with a TTL, shared by every session.
+
+    Keys are (category index, normalized query): lookup() depends on the
+    query only through normalize(), so "How do I apply?" and "how do i
+    apply" share an entry. Entries belong to one global QAIndex; a call with a
+    different one (kb_cache builds a new index per KB version) clears them.
+    Hits, misses, evictions, size and hit ratio go to metrics.py.
+    """
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires, answer)
+        self._index = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        metrics.gauge("answer_cache_size", self.__len__)
+        metrics.gauge("answer_cache_hit_ratio", self.hit_ratio)
+
+    def _check_index(self, qa_index):
+        if qa_index is not self._index:
+            if self._index is not None:
+                metrics.inc("answer_cache_invalidations_total")
+            self._entries.clear()
+            self._index = qa_index
+
+    def get(self, qa_index, key):
+        """(True, answer) on a hit, (False, None) on a miss."""
+        with self._lock:
+            self._check_index(qa_index)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                metrics.inc("answer_cache_evictions_total", reason="ttl")
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        metrics.inc("answer_cache_requests_total", result="hit" if entry is not None else "miss")
+        return (True, entry[1]) if entry is not None else (False, None)
+
+    def put(self, qa_index, key, answer):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._check_index(qa_index)
+            self._entries[key] = (time.monotonic() + self.ttl, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                metrics.inc("answer_cache_evictions_total", reason="lru")
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index = None
+
+    def __len__(self):
+        return len(self._entries)
+
+
+answer_cache = AnswerCache()
+
+
+def _lookup(user_message, qa_index, category_index):
+    # With a category index, that smaller index is searched first and the
+    # global one only on a miss
+    answer = None
+    if category_index is not None:
+        answer = category_index.lookup(user_message)
+        if answer is None:
+            metrics.inc("bot_category_fallbacks_total")
+    if answer is None:
+        answer = qa_index.lookup(user_message)
+    return answer
+
+
+def get_bot_response(user_message: str, qa_index: QAIndex, category_index: QAIndex = None):
+    if not user_message:
+        return None
+    key = (id(category_index) if category_index is not None else None, normalize(user_message))
+    found, answer = answer_cache.get(qa_index, key)
+    if not found:
+        answer = _lookup(user_message, qa_index, category_index)
+        answer_cache.put(qa_index, key, answer)
+    metrics.inc("bot_lookups_total", result="hit" if answer is not None else "miss")
+    return answer if answer is not None else NO_ANSWER
+
+
+# Browser-side twins of QAIndex.lookup and QAIndex.suggest, operating on
+# QAIndex.to_payload().
+SEARCH_JS = r"""
+function qaNormalize(text) {
+  return String(text).normalize('NFKC').toLowerCase()
+    .replace(/[^0-9a-z\u00c0-\uffff]+/g, ' ').trim();
+}
+function qaOwn(obj, key) {
+  return Object.prototype.hasOwnProperty.call(obj, key) ? obj[key] : undefined;
+}
+function qaPostingTf(plist, doc) {
+  let lo = 0, hi = plist.length >> 1;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    if (plist[2 * mid] < doc) lo = mid + 1; else hi = mid;
+  }
+  return (lo < plist.length >> 1 && plist[2 * lo] === doc) ? plist[2 * lo + 1] : 0;
+}
+function qaTokenize(index, text) {
+  const stop = index._stop || (index._stop = new Set(index.stopwords));
+  const all = qaNormalize(text).split(' ').filter(t => t);
+  const tokens = all.filter(t => !stop.has(t));
+  return tokens.length ? tokens : all;
+}
+function qaSearch(index, query) {
+  const terms = Array.from(new Set(qaTokenize(index, query)));
+  if (!terms.length || !index.records.length) return -1;
+  const scores = new Map(), matched = new Map();
+  const avgdl = index.avgdl || 1, k1 = index.k1, b = index.b;
+  const present = terms.filter(t => qaOwn(index.postings, t))
+    .sort((x, y) => (index.postings[x].length - index.postings[y].length) || (x < y ? -1 : x > y ? 1 : 0));
+  for (const term of present) {
+    const plist = index.postings[term];
+    const idf = index.idf[term];
+    let pairs = [];
+    if (scores.size && (plist.length >> 1) > index.max_scan) {
+      for (const doc of Array.from(scores.keys()).sort((x, y) => x - y)) pairs.push([doc, qaPostingTf(plist, doc)]);
+    } else {
+      for (let i = 0; i < plist.length; i += 2) pairs.push([plist[i], plist[i + 1]]);
+    }
+    for (const [doc, tf] of pairs) {
+      if (!tf) continue;
+      const norm = k1 * (1 - b + b * index.doc_len[doc] / avgdl);
+      scores.set(doc, (scores.get(doc) || 0) + idf * tf * (k1 + 1) / (tf + norm));
+      matched.set(doc, (matched.get(doc) || 0) + 1);
+    }
+  }
+  const minMatch = Math.floor((terms.length + 1) / 2);
+  let best = -1, bestScore = -Infinity;
+  for (const [doc, score] of scores) {
+    if (matched.get(doc) < minMatch) continue;
+    if (score > bestScore || (score === bestScore && doc < best)) { best = doc; bestScore = score; }
+  }
+  return best;
+}
+function qaSuggest(index, text, limit) {
+  // Binary search over index.suggest (docs sorted by normalized question);
+  // only the questions the search probes get normalized, once each
+  let prefix = qaNormalize(text);
+  if (!prefix) return [];
+  if (/\s$/.test(text)) prefix += ' ';
+  const docs = index.suggest || [];
+  const keys = index._suggestKeys || (index._suggestKeys = new Array(docs.length));
+  const key = i => keys[i] !== undefined ? keys[i] : (keys[i] = qaNormalize(index.records[docs[i]][0]));
+  let lo = 0, hi = docs.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    if (key(mid) < prefix) lo = mid + 1; else hi = mid;
+  }
+  const out = [];
+  for (let i = lo; i < docs.length && out.length < limit && key(i).startsWith(prefix); i++) {
+    out.push(index.records[docs[i]][0]);
+  }
+  return out;
+}
+function qaLookup(index, query) {
+  let doc = qaOwn(index.exact, qaNormalize(query));
+  if (doc === undefined) doc = qaSearch(index, query);
+  return doc >= 0 ? index.records[doc][1] : null;
+}
+"""
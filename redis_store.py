@@ -0,0 +1,571 @@
+import math
+import os
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+import metrics
+import ticket_search
+from models import Message, Ticket, dumps, format_day, loads, now_ts
+from ticket_index import DayCount, TicketIndex, ticket_summary
+from ticket_log import TicketLog
+from ticket_store import MessagePage, TicketPage, TicketStore, _seq_window
+
+# ------------------------------
+# Redis ticket store (shared by every replica)
+# ------------------------------
+# TICKET_STORE=redis keeps tickets in Redis (REDIS_URL, keys under
+# REDIS_PREFIX), so any number of app.py/admin.py replicas behind a load
+# balancer see the same tickets. Any server speaking the Redis protocol works;
+# fakeredis.FakeRedis() can be passed in directly for local runs.
+#   {p}ticket:{id}     hash: created_at, closed, closed_at (once closed), version
+#   {p}messages:{id}   list of message JSON; a message's seq is its position,
+#                      so RPUSH's reply is the new message's seq
+#   {p}open / {p}closed   sorted sets scored by created_at (ticket pages)
+#   {p}active             open tickets scored by last activity (ZADD XX GT,
+#                         so Redis >= 6.2)
+#   {p}daily              hash "YYYY-MM-DD:opened|closed" -> count
+#   {p}list_version, {p}schema_version
+#   {p}search:term:{term} sorted set "<ticket_id>:<seq>" -> times the term
+#                         occurs in that message (ticket_search.terms())
+#   {p}search:terms       every indexed term (score 0), for prefix lookups
+#   {p}search:docs        number of indexed messages
+# The search index is shared like everything else: each append adds its
+# message, a delete removes the ticket's messages, and a migration rebuilds
+# it, so no replica ever has to read every ticket to search.
+# Every write publishes "<version> <ticket_id>" on {p}changes (version 0 for
+# a deleted ticket, "list <n>" for list changes, "reset 0" after a
+# migration rewrote everything). Each process keeps one
+# subscriber thread that caches ticket/list versions from these messages, so
+# the 2-second live-update polls are answered without a round trip.
+# While a replica migrates (holding {p}migrate_lock) every other replica's
+# writes wait: each write transaction WATCHes the lock, so one that raced the
+# lock's SET is retried after the migration instead of being overwritten.
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "mr:")
+MIGRATE_LOCK_SECONDS = 300
+MIGRATE_POLL_SECONDS = 0.5
+VERSION_CACHE_SIZE = int(os.getenv("REDIS_VERSION_CACHE_SIZE", "10000"))  # tickets whose version is cached
+SEARCH_PREFIX_EXPANSIONS = 200  # indexed terms a partly typed last word may stand for
+SEARCH_TMP_SECONDS = 60
+# migrations.SCHEMA_VERSION that added search; stores migrated to it before
+# the index lived in Redis report one less so migrate() builds it
+SEARCH_SCHEMA_VERSION = 5
+
+
+class RedisTicketStore(TicketStore):
+    def __init__(self, client, prefix=REDIS_PREFIX, legacy_chat_file=None, listen=True,
+                 max_versions=VERSION_CACHE_SIZE):
+        self.redis = client
+        self.prefix = prefix
+        self.legacy_chat_file = legacy_chat_file
+        self.channel = prefix + "changes"
+        # Populated from pub/sub; trusted only while the subscriber is up.
+        # Least recently used entries go first, as in backpressure.RateLimiter
+        self._versions = OrderedDict()
+        self.max_versions = max_versions
+        self._list_version = None
+        self._cache_lock = threading.Lock()
+        self._listening = False
+        if listen:
+            self._listen()
+
+    @classmethod
+    def from_url(cls, url=REDIS_URL, **kwargs):
+        import redis
+
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    # ---- keys ----
+    def _ticket_key(self, ticket_id):
+        return f"{self.prefix}ticket:{ticket_id}"
+
+    def _messages_key(self, ticket_id):
+        return f"{self.prefix}messages:{ticket_id}"
+
+    def _key(self, name):
+        return self.prefix + name
+
+    def _term_key(self, term):
+        return f"{self.prefix}search:term:{term}"
+
+    # ---- change feed ----
+    def _listen(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: self._on_change})
+        self._listening = True
+        self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=self._on_listener_error)
+
+    def _on_listener_error(self, error, pubsub, thread):
+        # Notifications may have been missed: stop trusting the caches
+        metrics.inc("redis_listener_errors_total")
+        with self._cache_lock:
+            self._listening = False
+            self._versions.clear()
+            self._list_version = None
+        thread.stop()
+
+    def _on_change(self, message):
+        version, _, ticket_id = message["data"].decode("utf-8").partition(" ")
+        with self._cache_lock:
+            if version == "reset":
+                self._versions.clear()
+                self._list_version = None
+                return
+            if version == "list":
+                self._list_version = max(self._list_version or 0, int(ticket_id))
+                return
+            self._remember(ticket_id, int(version), from_feed=True)
+
+    def _remember(self, ticket_id, version, from_feed=False):
+        # Versions only grow, so out-of-order updates keep the newest one.
+        # 0 (deleted) is a tombstone: versions read or published before the
+        # delete may arrive after it and must not revive the ticket. Only the
+        # feed's "1 <id>" clears it: it is published in the same MULTI that
+        # recreates the ticket, so it is ordered after the delete's "0 <id>"
+        current = self._versions.get(ticket_id)
+        if version == 0 or (current == 0 and from_feed and version == 1):
+            self._versions[ticket_id] = version
+        elif current != 0:
+            self._versions[ticket_id] = max(current or 0, version)
+        self._versions.move_to_end(ticket_id)
+        while len(self._versions) > self.max_versions:
+            self._versions.popitem(last=False)
+
+    def _publish(self, pipe, ticket_id, version):
+        pipe.publish(self.channel, f"{version} {ticket_id}")
+
+    def _bump_list(self, pipe):
+        pipe.incr(self._key("list_version"))
+
+    def _after_list_change(self, list_version):
+        self.redis.publish(self.channel, f"list {list_version}")
+        with self._cache_lock:
+            self._list_version = max(self._list_version or 0, list_version)
+
+    # ---- reads ----
+    def get_ticket(self, ticket_id):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hmget(self._ticket_key(ticket_id), "closed", "created_at")
+        pipe.lrange(self._messages_key(ticket_id), 0, -1)
+        (closed, created_at), bodies = pipe.execute()
+        if created_at is None:
+            return None
+        metrics.inc("store_bytes_read_total", sum(len(b) for b in bodies), backend="redis", file="messages")
+        messages = [Message.from_dict(loads(body), seq) for seq, body in enumerate(bodies, 1)]
+        return Ticket(ticket_id, messages, closed == b"1", int(created_at))
+
+    def get_ticket_meta(self, ticket_id):
+        closed, created_at = self.redis.hmget(self._ticket_key(ticket_id), "closed", "created_at")
+        if created_at is None:
+            return None
+        return Ticket(ticket_id, [], closed == b"1", int(created_at))
+
+    def get_messages(self, ticket_id, limit=50, before=None, start=None):
+        key = self._messages_key(ticket_id)
+        lo, hi = _seq_window(self.redis.llen(key), limit, before, start)
+        bodies = self.redis.lrange(key, lo, hi - 1) if hi > lo else []
+        metrics.inc("store_bytes_read_total", sum(len(b) for b in bodies), backend="redis", file="messages")
+        return MessagePage([Message.from_dict(loads(b), lo + i + 1) for i, b in enumerate(bodies)], lo + 1, lo > 0)
+
+    def messages_since(self, ticket_id, since=0, limit=100):
+        bodies = self.redis.lrange(self._messages_key(ticket_id), since, since + limit - 1)
+        metrics.inc("store_bytes_read_total", sum(len(b) for b in bodies), backend="redis", file="messages")
+        return [Message.from_dict(loads(b), since + i + 1) for i, b in enumerate(bodies)], since + len(bodies)
+
+    def ticket_version(self, ticket_id):
+        with self._cache_lock:
+            if self._listening and ticket_id in self._versions:
+                self._versions.move_to_end(ticket_id)
+                return self._versions[ticket_id]
+        version = int(self.redis.hget(self._ticket_key(ticket_id), "version") or 0)
+        with self._cache_lock:
+            if self._listening:
+                self._remember(ticket_id, version)
+                return self._versions.get(ticket_id, version)
+        return version
+
+    def list_version(self):
+        with self._cache_lock:
+            if self._listening and self._list_version is not None:
+                return self._list_version
+        version = int(self.redis.get(self._key("list_version")) or 0)
+        with self._cache_lock:
+            if self._listening:
+                self._list_version = max(self._list_version or 0, version)
+        return version
+
+    def list_tickets(self, closed=None):
+        if closed is None:
+            rows = self.redis.zrange(self._key("open"), 0, -1, withscores=True)
+            rows += self.redis.zrange(self._key("closed"), 0, -1, withscores=True)
+            return [tid.decode() for tid, _ in sorted(rows, key=lambda r: (r[1], r[0]))]
+        return [tid.decode() for tid in self.redis.zrange(self._key("closed" if closed else "open"), 0, -1)]
+
+    def _zpage(self, key, after, limit, query, reverse):
+        # Sorted-set page after the (score, ticket_id) cursor. Ties on the
+        # cursor's score are fetched too and filtered here
+        if query:
+            rows = [(int(s), tid.decode()) for tid, s in self.redis.zrange(key, 0, -1, withscores=True)]
+            rows = [row for row in rows if query.upper() in row[1].upper()]
+            rows.sort(reverse=reverse)
+            if after is not None:
+                rows = [row for row in rows if (row < tuple(after) if reverse else row > tuple(after))]
+            return rows[:limit + 1]
+        if after is None:
+            fetched = self.redis.zrange(key, 0, limit, desc=reverse, withscores=True)
+            return [(int(s), tid.decode()) for tid, s in fetched]
+        score, cursor_id = after
+        ties = self.redis.zcount(key, score, score)
+        if reverse:
+            fetched = self.redis.zrevrangebyscore(key, score, "-inf", start=0, num=limit + 1 + ties, withscores=True)
+        else:
+            fetched = self.redis.zrangebyscore(key, score, "+inf", start=0, num=limit + 1 + ties, withscores=True)
+        rows = [(int(s), tid.decode()) for tid, s in fetched]
+        rows = [row for row in rows if (row < (score, cursor_id) if reverse else row > (score, cursor_id))]
+        return rows[:limit + 1]
+
+    def list_tickets_page(self, closed=None, after=None, limit=20, query=None):
+        if closed is None:
+            return super().list_tickets_page(closed, after, limit, query)
+        rows = self._zpage(self._key("closed" if closed else "open"), after, limit, query, reverse=False)
+        page = rows[:limit]
+        return TicketPage([tid for _, tid in page], page[-1] if len(rows) > limit else None)
+
+    def list_active_page(self, after=None, limit=20, query=None):
+        rows = self._zpage(self._key("active"), after, limit, query, reverse=True)
+        page = rows[:limit]
+        return TicketPage([tid for _, tid in page], page[-1] if len(rows) > limit else None)
+
+    def list_closed_before(self, cutoff):
+        # {p}closed is scored by created_at, which never exceeds closed_at:
+        # its head narrows the candidates, their closed_at decides
+        candidates = self.redis.zrangebyscore(self._key("closed"), "-inf", cutoff)
+        pipe = self.redis.pipeline(transaction=False)
+        for tid in candidates:
+            pipe.hget(self._ticket_key(tid.decode()), "closed_at")
+        return [
+            tid.decode() for tid, closed_at in zip(candidates, pipe.execute())
+            if closed_at is not None and int(closed_at) <= cutoff
+        ]
+
+    def ticket_counts(self):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zcard(self._key("open"))
+        pipe.zcard(self._key("closed"))
+        n_open, n_closed = pipe.execute()
+        return {"open": n_open, "closed": n_closed}
+
+    def daily_counts(self, days=14):
+        counts = {}
+        for field, value in self.redis.hgetall(self._key("daily")).items():
+            day, _, column = field.decode().partition(":")
+            counts.setdefault(day, [0, 0])[column == "closed"] += int(value)
+        rows = [DayCount(day, *c) for day, c in sorted(counts.items(), reverse=True) if c != [0, 0]]
+        return rows[:days] if days is not None else rows
+
+    def schema_version(self):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(self._key("schema_version"))
+        pipe.exists(self._key("search:docs"))
+        version, has_search = pipe.execute()
+        version = int(version or 0)
+        if version >= SEARCH_SCHEMA_VERSION and not has_search:
+            return SEARCH_SCHEMA_VERSION - 1
+        return version
+
+    # ---- writes ----
+    def _transaction(self, build, *watch):
+        """MULTI/EXEC of the commands build(pipe) queues -> their replies, or
+        None when build() returns False.
+
+        build() is called with pipe in WATCH mode (on migrate_lock and the
+        watch keys), so it can read first; it calls pipe.multi() before
+        queueing. While a migration holds the lock this waits, and it starts
+        over whenever a watched key changes before EXEC."""
+        from redis.exceptions import WatchError
+
+        lock = self._key("migrate_lock")
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(lock, *watch)
+                    if pipe.exists(lock):
+                        pipe.reset()
+                        time.sleep(MIGRATE_POLL_SECONDS)
+                        continue
+                    if build(pipe) is False:
+                        return None
+                    return pipe.execute()
+                except WatchError:
+                    metrics.inc("redis_write_retries_total")
+
+    def _ensure_ticket(self, ticket_id, created_at=None):
+        # The transaction that finds no created_at creates the ticket; only
+        # that replica indexes it
+        created_at = created_at or now_ts()
+        key = self._ticket_key(ticket_id)
+
+        def build(pipe):
+            if pipe.hexists(key, "created_at"):
+                return False
+            pipe.multi()
+            pipe.hset(key, mapping={"created_at": created_at, "closed": 0})
+            pipe.hincrby(key, "version", 1)
+            pipe.zadd(self._key("open"), {ticket_id: created_at})
+            pipe.zadd(self._key("active"), {ticket_id: created_at})
+            pipe.hincrby(self._key("daily"), f"{format_day(created_at)}:opened", 1)
+            self._bump_list(pipe)
+            self._publish(pipe, ticket_id, 1)
+
+        replies = self._transaction(build, key)
+        if replies is None:
+            return False
+        self._after_list_change(replies[-2])
+        return True
+
+    def create_ticket(self, ticket_id, created_at=None):
+        self._ensure_ticket(ticket_id, created_at)
+
+    def append_message(self, ticket_id, message):
+        self.append_messages([(ticket_id, message)])
+
+    def append_messages(self, items):
+        # One MULTI/EXEC for the whole batch; RPUSH replies are the seqs
+        for ticket_id in dict.fromkeys(tid for tid, _ in items):
+            if not self.redis.exists(self._ticket_key(ticket_id)):
+                self._ensure_ticket(ticket_id)
+        bodies = [dumps(message.to_dict()) for _, message in items]
+
+        def build(pipe):
+            pipe.multi()
+            for (ticket_id, message), body in zip(items, bodies):
+                pipe.rpush(self._messages_key(ticket_id), body)
+                pipe.hincrby(self._ticket_key(ticket_id), "version", 1)
+                pipe.zadd(self._key("active"), {ticket_id: message.ts}, xx=True, gt=True)
+
+        replies = self._transaction(build)
+        # Seqs are known only now, so messages are indexed right after they
+        # are stored; a crash in between leaves them unsearchable until the
+        # next migration
+        pipe = self.redis.pipeline(transaction=False)
+        for i, (ticket_id, message) in enumerate(items):
+            message.seq = replies[3 * i]
+            version = replies[3 * i + 1]
+            with self._cache_lock:
+                self._remember(ticket_id, version)
+            self._index_message(pipe, ticket_id, message.seq, message.text)
+            self._publish(pipe, ticket_id, version)
+        pipe.execute()
+        metrics.inc("store_bytes_written_total", sum(map(len, bodies)), backend="redis", file="messages")
+
+    def close_ticket(self, ticket_id):
+        key = self._ticket_key(ticket_id)
+        closed_at = now_ts()
+
+        def build(pipe):
+            # closed_at is set once, by whichever replica closes first
+            created_at, already_closed = pipe.hmget(key, "created_at", "closed_at")
+            if created_at is None or already_closed is not None:
+                return False
+            pipe.multi()
+            pipe.hset(key, mapping={"closed": 1, "closed_at": closed_at})
+            pipe.hincrby(key, "version", 1)
+            pipe.zrem(self._key("open"), ticket_id)
+            pipe.zrem(self._key("active"), ticket_id)
+            pipe.zadd(self._key("closed"), {ticket_id: int(created_at)})
+            pipe.hincrby(self._key("daily"), f"{format_day(closed_at)}:closed", 1)
+            self._bump_list(pipe)
+
+        replies = self._transaction(build, key)
+        if replies is None:
+            return
+        with self._cache_lock:
+            self._remember(ticket_id, replies[1])
+        pipe = self.redis.pipeline(transaction=False)
+        self._publish(pipe, ticket_id, replies[1])
+        pipe.execute()
+        self._after_list_change(replies[-1])
+
+    def delete_ticket(self, ticket_id, version=None):
+        key = self._ticket_key(ticket_id)
+
+        def build(pipe):
+            info = pipe.hgetall(key)
+            if not info or (version is not None and int(info.get(b"version", 0)) != version):
+                return False
+            bodies = pipe.lrange(self._messages_key(ticket_id), 0, -1)
+            pipe.multi()
+            for seq, body in enumerate(bodies, 1):
+                self._index_message(pipe, ticket_id, seq, loads(body).get("text", ""), remove=True)
+            pipe.delete(key, self._messages_key(ticket_id))
+            for name in ("open", "closed", "active"):
+                pipe.zrem(self._key(name), ticket_id)
+            created_at = int(info.get(b"created_at", 0))
+            pipe.hincrby(self._key("daily"), f"{format_day(created_at)}:opened", -1)
+            if info.get(b"closed") == b"1":
+                pipe.hincrby(self._key("daily"), f"{format_day(int(info.get(b'closed_at', 0)))}:closed", -1)
+            self._bump_list(pipe)
+            self._publish(pipe, ticket_id, 0)
+
+        replies = self._transaction(build, key, self._messages_key(ticket_id))
+        if replies is None:
+            return False
+        with self._cache_lock:
+            self._remember(ticket_id, 0)
+        self._after_list_change(replies[-2])
+        return True
+
+    # ---- migration ----
+    def _write_all(self, tickets):
+        # Pipeline replacing every ticket with tickets (dict form). Ticket
+        # versions keep counting up so no replica mistakes a rewrite for
+        # an unchanged ticket
+        pipe = self.redis.pipeline()
+        for ticket_id in self.list_tickets():
+            if ticket_id not in tickets:
+                pipe.delete(self._ticket_key(ticket_id))
+            pipe.delete(self._messages_key(ticket_id))
+        pipe.delete(*(self._key(name) for name in ("open", "closed", "active", "daily")))
+        old_terms = self.redis.zrange(self._key("search:terms"), 0, -1)
+        for i in range(0, len(old_terms), 1000):
+            pipe.delete(*(self._term_key(term.decode()) for term in old_terms[i:i + 1000]))
+        pipe.delete(self._key("search:terms"))
+        pipe.set(self._key("search:docs"), 0)
+        for ticket_id, info in tickets.items():
+            created_at, last_activity, closed, closed_at = ticket_summary(info)
+            messages = info.get("messages", [])
+            pipe.hdel(self._ticket_key(ticket_id), "closed_at")
+            pipe.hset(self._ticket_key(ticket_id), mapping={"created_at": created_at, "closed": int(closed)})
+            if closed:
+                pipe.hset(self._ticket_key(ticket_id), "closed_at", closed_at)
+            pipe.hincrby(self._ticket_key(ticket_id), "version", 1 + len(messages))
+            if messages:
+                pipe.rpush(self._messages_key(ticket_id), *(dumps(m) for m in messages))
+            for seq, m in enumerate(messages, 1):
+                self._index_message(pipe, ticket_id, seq, m.get("text", ""))
+            pipe.zadd(self._key("closed" if closed else "open"), {ticket_id: created_at})
+            if not closed:
+                pipe.zadd(self._key("active"), {ticket_id: last_activity})
+        for day in TicketIndex.from_tickets(tickets).daily_counts(days=None):
+            pipe.hset(self._key("daily"), mapping={f"{day.day}:opened": day.opened, f"{day.day}:closed": day.closed})
+        self._bump_list(pipe)
+        return pipe
+
+    def migrate(self, transform, schema_version):
+        lock = self._key("migrate_lock")
+        while not self.redis.set(lock, 1, nx=True, ex=MIGRATE_LOCK_SECONDS):
+            # Another replica is migrating: wait for it (its lock expires
+            # should it die), then see whether it reached schema_version
+            time.sleep(MIGRATE_POLL_SECONDS)
+        try:
+            if self.schema_version() >= schema_version:
+                return False
+            tickets = {}
+            for ticket_id in self.list_tickets():
+                tickets[ticket_id] = self.get_ticket(ticket_id).to_dict()
+                closed_at = self.redis.hget(self._ticket_key(ticket_id), "closed_at")
+                if closed_at:
+                    tickets[ticket_id]["closed_at"] = int(closed_at)
+            # One-off import of the local support_chat.json (+ event log)
+            if self.legacy_chat_file and not self.redis.exists(self._key("legacy_imported")):
+                for tid, info in TicketLog(self.legacy_chat_file).load().items():
+                    tickets.setdefault(tid, info)
+                self.redis.set(self._key("legacy_imported"), str(datetime.now()))
+            tickets = transform(tickets)
+            pipe = self._write_all(tickets)
+            pipe.set(self._key("schema_version"), schema_version)
+            pipe.publish(self.channel, "reset 0")
+            pipe.execute()
+        finally:
+            self.redis.delete(lock)
+        with self._cache_lock:
+            self._versions.clear()
+            self._list_version = None
+        return True
+
+    # ---- full-text search ----
+    def _index_message(self, pipe, ticket_id, seq, text, remove=False):
+        member = f"{ticket_id}:{seq}"
+        for term, count in Counter(ticket_search.terms(text)).items():
+            if remove:
+                # Terms left without messages stay in search:terms; they only
+                # cost a prefix expansion that finds nothing
+                pipe.zrem(self._term_key(term), member)
+            else:
+                pipe.zadd(self._term_key(term), {member: count})
+                pipe.zadd(self._key("search:terms"), {term: 0})
+        pipe.incrby(self._key("search:docs"), -1 if remove else 1)
+
+    def search_messages(self, query, closed=None, since=None, until=None, limit=20):
+        # Messages containing every exact term and some term starting with the
+        # last word, ranked by the sum of term count x idf (ZINTERSTORE
+        # weights) and filtered while paging through the ranking
+        exact, prefix = ticket_search.query_terms(query)
+        if prefix is None:
+            return []
+        expansions = self.redis.zrangebylex(
+            self._key("search:terms"), b"[" + prefix.encode(), b"[" + prefix.encode() + b"\xff",
+            start=0, num=SEARCH_PREFIX_EXPANSIONS,
+        )
+        if not expansions:
+            return []
+        tmp = self._key(f"search:tmp:{uuid.uuid4().hex}")
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(self._key("search:docs"))
+        for term in exact:
+            pipe.zcard(self._term_key(term))
+        pipe.zunionstore(tmp + ":prefix", [self._term_key(t.decode()) for t in expansions], aggregate="MAX")
+        pipe.expire(tmp + ":prefix", SEARCH_TMP_SECONDS)
+        n_docs, *counts = pipe.execute()
+        n_docs, counts = int(n_docs or 0), counts[:-1]
+        try:
+            # Some term (or every expansion of the last word) matches nothing
+            if not all(counts):
+                return []
+
+            def idf(df):
+                return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+            weights = {self._term_key(term): idf(df) for term, df in zip(exact, counts)}
+            weights[tmp + ":prefix"] = idf(counts[-1])
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zinterstore(tmp, weights)
+            pipe.expire(tmp, SEARCH_TMP_SECONDS)
+            pipe.execute()
+            return self._search_page(tmp, query, closed, since, until, limit)
+        finally:
+            self.redis.delete(tmp, tmp + ":prefix")
+
+    def _search_page(self, ranked_key, query, closed, since, until, limit):
+        hits, start, batch = [], 0, max(limit * 4, 50)
+        while len(hits) < limit:
+            ranked = self.redis.zrevrange(ranked_key, start, start + batch - 1, withscores=True)
+            if not ranked:
+                break
+            start += batch
+            pipe = self.redis.pipeline(transaction=False)
+            for member, _ in ranked:
+                ticket_id, _, seq = member.decode().rpartition(":")
+                pipe.hget(self._ticket_key(ticket_id), "closed")
+                pipe.lindex(self._messages_key(ticket_id), int(seq) - 1)
+            replies = pipe.execute()
+            for i, (member, score) in enumerate(ranked):
+                is_closed, body = replies[2 * i] == b"1", replies[2 * i + 1]
+                if body is None or (closed is not None and is_closed != bool(closed)):
+                    continue
+                m = loads(body)
+                ts = int(m.get("ts", 0) or 0)
+                if (since is not None and ts < since) or (until is not None and ts >= until):
+                    continue
+                ticket_id, _, seq = member.decode().rpartition(":")
+                hits.append(ticket_search.SearchHit(
+                    ticket_id, int(seq), ts, m.get("role", "user"),
+                    ticket_search.highlight(m.get("text", ""), query), score, is_closed,
+                ))
+                if len(hits) == limit:
+                    break
+        return hits
@@ -0,0 +1,516 @@
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+from array import array
+from collections import namedtuple
+from datetime import datetime
+
+import metrics
+import ticket_search
+from models import Message, Ticket, dumps, loads, now_ts
+from ticket_index import TicketIndex
+from ticket_log import TicketLog, _file_lock
+from ticket_store import MessagePage, TicketPage, TicketStore, _seq_window
+
+# ------------------------------
+# Per-ticket segment files
+# ------------------------------
+# TICKET_STORE=segments keeps one file per ticket under <chat file>.segments/
+# (or TICKET_SEGMENTS_DIR), so showing the last N messages of a ticket reads
+# only the end of that ticket's file:
+#   records   [u32 length][u32 crc32][u8 kind][body]   kind C created (ts),
+#             M message (JSON, seq = its position), X closed (ts)
+#   footer    [u64 offset of every M record][trailer]
+#   trailer   records end, created_at, closed_at, last_activity, messages,
+#             version (record count), crc32 of footer, magic
+# An append writes its records over the old footer and a new footer after
+# them, so files only grow in place and readers can mmap them: they read the
+# trailer, then just the offsets and records they need. A torn or missing
+# footer (crash, or a read racing a write) is detected by its crc and the
+# record frames are rescanned under the lock.
+#   changes.log   one ticket id per write; every process tails it to keep its
+#                 TicketIndex (ticket lists, counts) and search index current
+#   meta.json     schema_version, legacy_imported
+#   search.db     full-text index (ticket_search.py), shared by processes
+
+MAGIC = b"MRS1"
+FRAME = struct.Struct("<IIB")
+TRAILER = struct.Struct("<QqqqIII4s")
+TS = struct.Struct("<q")
+KIND_CREATED, KIND_MESSAGE, KIND_CLOSED = b"C"[0], b"M"[0], b"X"[0]
+CHANGES_MAX_BYTES = 1024 * 1024
+
+# offsets: array("Q") of message record offsets; end: where the footer starts
+Segment = namedtuple("Segment", "end created_at closed_at last_activity offsets version")
+
+
+def _record(kind, body):
+    return FRAME.pack(len(body), zlib.crc32(body, kind), kind) + body
+
+
+def _footer(segment):
+    offsets = segment.offsets.tobytes()
+    fields = (segment.end, segment.created_at, segment.closed_at, segment.last_activity,
+              len(segment.offsets), segment.version)
+    crc = zlib.crc32(offsets + TRAILER.pack(*fields, 0, MAGIC))
+    return offsets + TRAILER.pack(*fields, crc, MAGIC)
+
+
+def _parse_footer(buf, base=0):
+    # -> Segment, or None when buf (the file from offset base on) does not
+    # end in an intact footer
+    size = base + len(buf)
+    if len(buf) < TRAILER.size:
+        return None
+    *fields, crc, magic = TRAILER.unpack_from(buf, len(buf) - TRAILER.size)
+    end, count = fields[0], fields[4]
+    if magic != MAGIC or end < base or end + 8 * count + TRAILER.size != size:
+        return None
+    offsets = bytes(buf[end - base:end - base + 8 * count])
+    if zlib.crc32(offsets + TRAILER.pack(*fields, 0, MAGIC)) != crc:
+        return None
+    return Segment(end, fields[1], fields[2], fields[3], array("Q", offsets), fields[5])
+
+
+def _scan(buf):
+    # Rebuilds the footer from the record frames, up to the first bad one
+    pos, created_at, closed_at, last_activity, offsets, version = 0, 0, 0, 0, array("Q"), 0
+    while pos + FRAME.size <= len(buf):
+        length, crc, kind = FRAME.unpack_from(buf, pos)
+        body = bytes(buf[pos + FRAME.size:pos + FRAME.size + length])
+        if len(body) != length or zlib.crc32(body, kind) != crc:
+            break
+        if kind == KIND_CREATED:
+            created_at = TS.unpack(body)[0]
+        elif kind == KIND_CLOSED:
+            closed_at = TS.unpack(body)[0]
+        elif kind == KIND_MESSAGE:
+            offsets.append(pos)
+            last_activity = max(last_activity, int(loads(body).get("ts", 0) or 0))
+        else:
+            break
+        version += 1
+        pos += FRAME.size + length
+    return Segment(pos, created_at, closed_at, last_activity, offsets, version)
+
+
+def _message(buf, offset, seq):
+    length = FRAME.unpack_from(buf, offset)[0]
+    start = offset + FRAME.size
+    return Message.from_dict(loads(bytes(buf[start:start + length])), seq)
+
+
+def _ticket_dict(buf, segment):
+    # Stored-ticket dict (what migrations transform) of a mapped segment
+    info = {
+        "messages": [_message(buf, offset, seq).to_dict() for seq, offset in enumerate(segment.offsets, 1)],
+        "closed": bool(segment.closed_at),
+        "created_at": segment.created_at,
+    }
+    if segment.closed_at:
+        info["closed_at"] = segment.closed_at
+    return info
+
+
+def _summary(segment):
+    # The ticket dict TicketIndex.update() needs, without the messages
+    return {
+        "created_at": segment.created_at,
+        "closed": bool(segment.closed_at),
+        "closed_at": segment.closed_at,
+        "messages": [{"ts": segment.last_activity}] if segment.offsets else [],
+    }
+
+
+class SegmentTicketStore(TicketStore):
+    """Ticket store with one append-only, footer-indexed file per ticket."""
+
+    def __init__(self, root, legacy_chat_file=None):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.lock_path = os.path.join(root, ".lock")
+        self.changes_path = os.path.join(root, "changes.log")
+        self.meta_path = os.path.join(root, "meta.json")
+        self.legacy_chat_file = legacy_chat_file
+        self._index_state = TicketIndex()
+        self._changes_key = None  # (inode, offset read up to)
+        self._index_lock = threading.Lock()
+        self.search_path = os.path.join(root, "search.db")
+        self._search_local = threading.local()
+        self._search_dirty = set()
+        self._search_stale = True
+
+    def _path(self, ticket_id):
+        if not ticket_id or os.sep in ticket_id or "/" in ticket_id or ticket_id.startswith("."):
+            raise ValueError(f"Invalid ticket id: {ticket_id!r}")
+        return os.path.join(self.root, ticket_id + ".seg")
+
+    # ---- segment reads ----
+    def _try_read(self, ticket_id, fn, recover):
+        try:
+            f = open(self._path(ticket_id), "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                segment = _parse_footer(buf)
+                if segment is None:
+                    if not recover:
+                        return _torn
+                    segment = _scan(buf)
+                return fn(buf, segment)
+
+    def _read(self, ticket_id, fn):
+        """fn(mapped file, Segment) for the ticket, or None if it does not exist."""
+        result = self._try_read(ticket_id, fn, recover=False)
+        if result is _torn:
+            # Mid-write (wait for the writer) or a crashed append (rescan)
+            with _file_lock(self.lock_path):
+                result = self._try_read(ticket_id, fn, recover=True)
+        return result
+
+    def _segment(self, ticket_id):
+        return self._read(ticket_id, lambda buf, segment: segment)
+
+    def _read_messages(self, ticket_id, lo, hi):
+        # Messages with seq lo+1 .. hi (clamped), decoding only those records
+        def read(buf, segment):
+            offsets = segment.offsets
+            picked = [_message(buf, offsets[i], i + 1) for i in range(max(lo, 0), min(hi, len(offsets)))]
+            return segment, picked
+
+        return self._read(ticket_id, read) or (None, [])
+
+    def get_ticket(self, ticket_id):
+        segment, messages = self._read_messages(ticket_id, 0, 1 << 62)
+        if segment is None:
+            return None
+        return Ticket(ticket_id, messages, bool(segment.closed_at), segment.created_at)
+
+    def get_ticket_meta(self, ticket_id):
+        segment = self._segment(ticket_id)
+        if segment is None:
+            return None
+        return Ticket(ticket_id, [], bool(segment.closed_at), segment.created_at)
+
+    def get_messages(self, ticket_id, limit=50, before=None, start=None):
+        def read(buf, segment):
+            lo, hi = _seq_window(len(segment.offsets), limit, before, start)
+            return MessagePage([_message(buf, segment.offsets[i], i + 1) for i in range(lo, hi)], lo + 1, lo > 0)
+
+        return self._read(ticket_id, read) or MessagePage([], 1, False)
+
+    def messages_since(self, ticket_id, since=0, limit=100):
+        _, messages = self._read_messages(ticket_id, since, since + limit)
+        return messages, since + len(messages)
+
+    def ticket_version(self, ticket_id):
+        # Polled every couple of seconds: one read of the trailer
+        try:
+            with open(self._path(ticket_id), "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size >= TRAILER.size:
+                    f.seek(size - TRAILER.size)
+                    end, *_, count, version, _, magic = TRAILER.unpack(f.read(TRAILER.size))
+                    if magic == MAGIC and end + 8 * count + TRAILER.size == size:
+                        return version
+        except FileNotFoundError:
+            return 0
+        segment = self._segment(ticket_id)
+        return segment.version if segment else 0
+
+    # ---- ticket index (lists, counts) ----
+    def _refresh(self):
+        # Tails changes.log and re-reads the footers of the tickets it names;
+        # a replaced or truncated changes.log means a full rescan
+        with self._index_lock:
+            data = None
+            try:
+                with open(self.changes_path, "rb") as changes:
+                    st = os.fstat(changes.fileno())
+                    key = (st.st_ino, st.st_size)
+                    if key == self._changes_key:
+                        return self._index_state
+                    if self._changes_key is not None and key[0] == self._changes_key[0] \
+                            and key[1] > self._changes_key[1]:
+                        changes.seek(self._changes_key[1])
+                        data = changes.read(key[1] - self._changes_key[1])
+            except FileNotFoundError:
+                key = (None, 0)
+                if key == self._changes_key:
+                    return self._index_state
+            if data is None:
+                index = TicketIndex()
+                for name in os.listdir(self.root):
+                    if name.endswith(".seg"):
+                        segment = self._segment(name[:-4])
+                        if segment is not None:
+                            index.update(name[:-4], _summary(segment))
+                self._index_state, self._changes_key = index, key
+                self._search_stale = True
+                return index
+            data = data[:data.rfind(b"\n") + 1]
+            for ticket_id in dict.fromkeys(data.decode("utf-8").split()):
+                segment = self._segment(ticket_id)
+                self._index_state.update(ticket_id, _summary(segment) if segment else None)
+                self._search_dirty.add(ticket_id)
+            self._changes_key = (key[0], self._changes_key[1] + len(data))
+            return self._index_state
+
+    def _index(self):
+        return self._refresh()
+
+    def list_tickets(self, closed=None):
+        return self._index().list_tickets(closed)
+
+    def list_tickets_page(self, closed=None, after=None, limit=20, query=None):
+        if closed is None:
+            return super().list_tickets_page(closed, after, limit, query)
+        return TicketPage(*self._index().tickets_page(closed, after, limit, query))
+
+    def list_version(self):
+        counts = self._index().counts()
+        return (counts["open"] + counts["closed"], counts["closed"])
+
+    # ---- writes ----
+    def _changed(self, ticket_ids):
+        with open(self.changes_path, "ab") as f:
+            f.write("".join(f"{tid}\n" for tid in ticket_ids).encode("utf-8"))
+            size = f.tell()
+        if size >= CHANGES_MAX_BYTES:
+            # Readers see a new file and rescan the footers once
+            self._reset_changes()
+
+    def _reset_changes(self):
+        tmp_path = self.changes_path + ".tmp"
+        open(tmp_path, "wb").close()
+        os.replace(tmp_path, self.changes_path)
+
+    def _segment_locked(self, path):
+        # Footer of an existing segment file (None if missing or empty); a
+        # crashed append is repaired first
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return None
+            if size >= TRAILER.size:
+                f.seek(size - TRAILER.size)
+                end, *_, count, _, _, magic = TRAILER.unpack(f.read(TRAILER.size))
+                if magic == MAGIC and end + 8 * count + TRAILER.size == size:
+                    f.seek(end)
+                    segment = _parse_footer(f.read(), end)
+                    if segment is not None:
+                        return segment
+            f.seek(0)
+            data = f.read()
+        # Keep the intact records in a new file; never shrink one in place,
+        # readers may have it mapped
+        segment = _scan(data)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data[:segment.end] + _footer(segment))
+        os.replace(tmp_path, path)
+        return segment
+
+    def _append_locked(self, ticket_id, records, created_at=None):
+        # records: [(kind, body)]. A missing ticket is created when created_at
+        # is given (else None is returned). Returns the new messages' seqs
+        path = self._path(ticket_id)
+        segment = self._segment_locked(path)
+        if segment is None:
+            if created_at is None:
+                return None
+            segment = Segment(0, 0, 0, 0, array("Q"), 0)
+            records = [(KIND_CREATED, TS.pack(created_at))] + records
+        pos = segment.end
+        offsets = array("Q", segment.offsets)
+        created, closed_at, last_activity, seqs = segment.created_at, segment.closed_at, segment.last_activity, []
+        chunks = []
+        for kind, body in records:
+            if kind == KIND_MESSAGE:
+                offsets.append(pos)
+                seqs.append(len(offsets))
+                last_activity = max(last_activity, int(loads(body).get("ts", 0) or 0))
+            elif kind == KIND_CREATED:
+                created = TS.unpack(body)[0]
+            elif kind == KIND_CLOSED:
+                closed_at = TS.unpack(body)[0]
+            chunk = _record(kind, body)
+            chunks.append(chunk)
+            pos += len(chunk)
+        new = Segment(pos, created, closed_at, last_activity, offsets, segment.version + len(records))
+        data = b"".join(chunks) + _footer(new)
+        with open(path, "r+b" if segment.end else "wb") as f:
+            f.seek(segment.end)
+            f.write(data)
+        metrics.inc("store_bytes_written_total", len(data), backend="segments", file="segment")
+        return seqs
+
+    def create_ticket(self, ticket_id, created_at=None):
+        with _file_lock(self.lock_path):
+            if not os.path.exists(self._path(ticket_id)):
+                self._append_locked(ticket_id, [], created_at or now_ts())
+                self._changed([ticket_id])
+
+    def append_message(self, ticket_id, message):
+        self.append_messages([(ticket_id, message)])
+
+    def append_messages(self, items):
+        # One lock and one footer rewrite per ticket for the whole batch
+        grouped = {}
+        for ticket_id, message in items:
+            grouped.setdefault(ticket_id, []).append(message)
+        with _file_lock(self.lock_path):
+            for ticket_id, messages in grouped.items():
+                records = [(KIND_MESSAGE, dumps({k: v for k, v in m.to_dict().items() if k != "seq"}))
+                           for m in messages]
+                seqs = self._append_locked(ticket_id, records, now_ts())
+                for message, seq in zip(messages, seqs):
+                    message.seq = seq
+            self._changed(grouped)
+
+    def close_ticket(self, ticket_id):
+        with _file_lock(self.lock_path):
+            segment = self._try_read(ticket_id, lambda buf, segment: segment, recover=True)
+            if segment is None or segment.closed_at:
+                return
+            self._append_locked(ticket_id, [(KIND_CLOSED, TS.pack(now_ts()))])
+            self._changed([ticket_id])
+
+    def delete_ticket(self, ticket_id, version=None):
+        with _file_lock(self.lock_path):
+            if version is not None:
+                segment = self._try_read(ticket_id, lambda buf, segment: segment, recover=True)
+                if segment is None or segment.version != version:
+                    return False
+            try:
+                os.remove(self._path(ticket_id))
+            except FileNotFoundError:
+                return False
+            self._changed([ticket_id])
+        return True
+
+    # ---- schema / migration ----
+    def _meta(self):
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def schema_version(self):
+        return int(self._meta().get("schema_version", 0))
+
+    def _write_ticket(self, ticket_id, info):
+        # Whole segment file for a stored ticket dict, swapped in atomically
+        created_at = int(info.get("created_at", 0) or 0)
+        records = [_record(KIND_CREATED, TS.pack(created_at))]
+        offsets, pos, last_activity = array("Q"), len(records[0]), created_at
+        for m in info.get("messages", []):
+            offsets.append(pos)
+            records.append(_record(KIND_MESSAGE, dumps({k: v for k, v in m.items() if k != "seq"})))
+            pos += len(records[-1])
+            last_activity = max(last_activity, int(m.get("ts", 0) or 0))
+        closed_at = 0
+        if info.get("closed"):
+            closed_at = int(info.get("closed_at", 0) or last_activity)
+            records.append(_record(KIND_CLOSED, TS.pack(closed_at)))
+            pos += len(records[-1])
+        segment = Segment(pos, created_at, closed_at, last_activity, offsets, len(records))
+        tmp_path = self._path(ticket_id) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(records) + _footer(segment))
+        os.replace(tmp_path, self._path(ticket_id))
+
+    def migrate(self, transform, schema_version):
+        with _file_lock(self.lock_path):
+            meta = self._meta()
+            if int(meta.get("schema_version", 0)) >= schema_version:
+                return False
+            tickets = {}
+            for name in os.listdir(self.root):
+                if not name.endswith(".seg"):
+                    continue
+                info = self._try_read(name[:-4], _ticket_dict, recover=True)
+                if info is not None:
+                    tickets[name[:-4]] = info
+            # One-off copy of support_chat.json (+ its event log)
+            if self.legacy_chat_file and "legacy_imported" not in meta:
+                for tid, info in TicketLog(self.legacy_chat_file).load().items():
+                    tickets.setdefault(tid, info)
+                meta["legacy_imported"] = str(datetime.now())
+            tickets = transform(tickets)
+            for ticket_id, info in tickets.items():
+                self._write_ticket(ticket_id, info)
+            for name in os.listdir(self.root):
+                if name.endswith(".seg") and name[:-4] not in tickets:
+                    os.remove(os.path.join(self.root, name))
+            meta["schema_version"] = schema_version
+            tmp_path = self.meta_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self.meta_path)
+            self._reset_changes()
+        return True
+
+    # ---- full-text search ----
+    def _search_conn(self):
+        conn = getattr(self._search_local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.search_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                ticket_search.create_schema(conn)
+                conn.execute(ticket_search.STATUS_SCHEMA)
+            self._search_local.conn = conn
+        return conn
+
+    def search_messages(self, query, closed=None, since=None, until=None, limit=20):
+        # Catches up only the tickets changed since the last search; rows are
+        # keyed on (ticket_id, seq), so processes can share search.db
+        index = self._refresh()
+        conn = self._search_conn()
+        with self._index_lock:
+            if self._search_stale:
+                dirty = set(index.list_tickets())
+                dirty.update(tid for (tid,) in conn.execute("SELECT ticket_id FROM tickets"))
+            else:
+                dirty = self._search_dirty
+            self._search_stale, self._search_dirty = False, set()
+        with conn:
+            for ticket_id in dirty:
+                self._index_ticket(conn, ticket_id)
+        return ticket_search.search(conn, query, closed, since, until, limit)
+
+    def _index_ticket(self, conn, ticket_id):
+        segment = self._segment(ticket_id)
+        if segment is None:
+            ticket_search.delete_ticket(conn, ticket_id)
+            conn.execute("DELETE FROM tickets WHERE ticket_id = ?", (ticket_id,))
+            return
+        conn.execute(
+            "INSERT INTO tickets (ticket_id, closed) VALUES (?, ?) "
+            "ON CONFLICT (ticket_id) DO UPDATE SET closed = excluded.closed",
+            (ticket_id, int(bool(segment.closed_at))),
+        )
+        since = conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM search_docs WHERE ticket_id = ?", (ticket_id,)
+        ).fetchone()[0]
+        if since < len(segment.offsets):
+            new, _ = self.messages_since(ticket_id, since, len(segment.offsets) - since)
+            ticket_search.index_messages(conn, [(ticket_id, m.seq, m.ts, m.role.value, m.text) for m in new])
+
+
+# Marks a read that found no intact footer
+_torn = object()
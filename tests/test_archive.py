@@ -0,0 +1,69 @@
+import pytest
+
+import archive
+import segment_store
+import ticket_log
+import ticket_store
+from models import Message, Role
+
+DAY = 86400
+NOW = 1760000000
+
+
+def _set_clock(monkeypatch, ts):
+    for module in (ticket_store, ticket_log, segment_store):
+        monkeypatch.setattr(module, "now_ts", lambda: ts)
+
+
+@pytest.fixture(params=["log", "sqlite", "segments"])
+def store(request, tmp_path, monkeypatch):
+    monkeypatch.delenv("TICKET_DB", raising=False)
+    monkeypatch.delenv("TICKET_SEGMENTS_DIR", raising=False)
+    _set_clock(monkeypatch, NOW - 40 * DAY)
+    store = ticket_store.get_ticket_store(str(tmp_path / "support_chat.json"), backend=request.param)
+    # Closed 40 days ago, still open, closed 5 days ago
+    store.create_ticket("TCKT-20250101-OLD001", created_at=NOW - 50 * DAY)
+    store.append_message("TCKT-20250101-OLD001", Message(Role.USER, "old", NOW - 45 * DAY))
+    store.close_ticket("TCKT-20250101-OLD001")
+    store.create_ticket("TCKT-20250101-OPEN01", created_at=NOW - 50 * DAY)
+    _set_clock(monkeypatch, NOW - 5 * DAY)
+    store.create_ticket("TCKT-20250101-NEW001", created_at=NOW - 50 * DAY)
+    store.close_ticket("TCKT-20250101-NEW001")
+    return store
+
+
+def test_list_closed_before(store):
+    assert store.list_closed_before(NOW - 30 * DAY) == ["TCKT-20250101-OLD001"]
+    assert sorted(store.list_closed_before(NOW)) == ["TCKT-20250101-NEW001", "TCKT-20250101-OLD001"]
+
+
+def test_archive_closed_moves_only_due_tickets(store, tmp_path):
+    ticket_archive = archive.TicketArchive(str(tmp_path / "support_chat.json"))
+    assert ticket_archive.archive_closed(store, max_age_days=30, now=NOW) == ["TCKT-20250101-OLD001"]
+    assert store.get_ticket("TCKT-20250101-OLD001") is None
+    assert [m.text for m in ticket_archive.get_ticket("TCKT-20250101-OLD001").messages] == ["old"]
+    assert sorted(store.list_tickets()) == ["TCKT-20250101-NEW001", "TCKT-20250101-OPEN01"]
+
+
+def test_delete_ticket_is_conditional_on_version(store):
+    version = store.ticket_version("TCKT-20250101-OLD001")
+    store.append_message("TCKT-20250101-OLD001", Message(Role.USER, "one more thing", NOW - 35 * DAY))
+    assert not store.delete_ticket("TCKT-20250101-OLD001", version=version)
+    assert [m.text for m in store.get_ticket("TCKT-20250101-OLD001").messages] == ["old", "one more thing"]
+    assert store.delete_ticket("TCKT-20250101-OLD001", version=store.ticket_version("TCKT-20250101-OLD001"))
+    assert store.get_ticket("TCKT-20250101-OLD001") is None
+
+
+def test_archive_closed_rechecks_indexed_tickets(store, tmp_path):
+    ticket_archive = archive.TicketArchive(str(tmp_path / "support_chat.json"))
+    # A run that wrote the index but lost the delete to a late message
+    delete_ticket = store.delete_ticket
+    store.delete_ticket = lambda ticket_id, version=None: False
+    assert ticket_archive.archive_closed(store, max_age_days=30, now=NOW) == []
+    store.delete_ticket = delete_ticket
+    assert "TCKT-20250101-OLD001" in ticket_archive
+    store.append_message("TCKT-20250101-OLD001", Message(Role.USER, "one more thing", NOW - 35 * DAY))
+
+    assert ticket_archive.archive_closed(store, max_age_days=30, now=NOW) == ["TCKT-20250101-OLD001"]
+    assert store.get_ticket("TCKT-20250101-OLD001") is None
+    assert [m.text for m in ticket_archive.get_ticket("TCKT-20250101-OLD001").messages] == ["old", "one more thing"]
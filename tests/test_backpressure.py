@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+import backpressure
+from backpressure import RateLimiter, TokenBucket, WriteQueue, WriteQueueFull, allow_message, write_groups
+from models import Message, Role
+
+
+class FakeStore:
+    """Records the store calls a WriteQueue makes; gate holds them back."""
+
+    def __init__(self):
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def append_messages(self, items):
+        self.gate.wait()
+        self.calls.append(("append", [message.text for _, message in items]))
+
+    def close_ticket(self, ticket_id):
+        self.gate.wait()
+        if ticket_id == "broken":
+            raise OSError("disk full")
+        self.calls.append(("close", ticket_id))
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate=1.0, capacity=2, now=0.0)
+    assert bucket.wait(0.0) == 0.0
+    bucket.take(0.0)
+    bucket.take(0.0)
+    assert bucket.wait(0.0) == pytest.approx(1.0)
+    assert bucket.wait(0.25) == pytest.approx(0.75)
+    assert bucket.wait(1.0) == 0.0
+    # Never more than capacity, however long it sat idle
+    assert bucket.wait(100.0) == 0.0 and bucket.tokens == 2
+
+
+def test_rate_limiter_keeps_a_bucket_per_key_and_drops_the_oldest():
+    limiter = RateLimiter("test", per_minute=60, burst=1, max_keys=2)
+    limiter.take("a", now=0.0)
+    assert limiter.wait("a", now=0.0) == pytest.approx(1.0)
+    assert limiter.wait("b", now=0.0) == 0.0
+    limiter.take("b", now=0.0)
+    limiter.wait("a", now=0.0)
+    limiter.take("c", now=0.0)
+    # "b" was least recently used, so it starts over with a full bucket
+    assert list(limiter._buckets) == ["a", "c"]
+    assert limiter.wait("b", now=0.0) == 0.0
+
+
+def test_allow_message_counts_only_accepted_messages(monkeypatch):
+    monkeypatch.setattr(backpressure, "ticket_limiter", RateLimiter("ticket", 60, burst=2))
+    monkeypatch.setattr(backpressure, "session_limiter", RateLimiter("session", 60, burst=1))
+    assert allow_message("T1", "s1") == 0.0
+    # The session is out of tokens; the refusal must not use up the ticket's
+    assert allow_message("T1", "s1") > 0
+    assert allow_message("T1", "s2") == 0.0
+    assert allow_message("T1", "s3") > 0
+
+
+def test_write_groups_keep_closes_in_order():
+    batch = [("append", "A", 1), ("append", "B", 2), ("close", "A", None), ("close", "B", None), ("append", "A", 3)]
+    assert [[item[2] for item in group] for group in write_groups(batch)] == [[1, 2], [None], [None], [3]]
+
+
+def _submit_all(write_queue, writes):
+    results, threads = {}, []
+
+    def submit(name, op, ticket_id, text):
+        try:
+            message = Message(Role.USER, text) if text else None
+            results[name] = write_queue.submit(op, ticket_id, message, result_timeout=5)
+        except Exception as e:
+            results[name] = e
+
+    for name, op, ticket_id, text in writes:
+        threads.append(threading.Thread(target=submit, args=(name, op, ticket_id, text)))
+        threads[-1].start()
+        time.sleep(0.02)
+    return results, threads
+
+
+def test_write_queue_batches_and_fails_only_the_failing_group():
+    store = FakeStore()
+    write_queue = WriteQueue(store)
+    # The first write holds the writer, so the rest queue up behind it
+    store.gate.clear()
+    results, threads = _submit_all(write_queue, [
+        ("first", "append", "T1", "m0"),
+        ("a1", "append", "T1", "m1"),
+        ("a2", "append", "T2", "m2"),
+        ("broken", "close", "broken", None),
+        ("a3", "append", "T1", "m3"),
+    ])
+    store.gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert store.calls == [("append", ["m0"]), ("append", ["m1", "m2"]), ("append", ["m3"])]
+    assert isinstance(results.pop("broken"), OSError)
+    assert results == {"first": True, "a1": True, "a2": True, "a3": True}
+
+
+def test_write_queue_withdraws_writes_that_time_out():
+    store = FakeStore()
+    write_queue = WriteQueue(store)
+    store.gate.clear()
+    results, threads = _submit_all(write_queue, [("first", "append", "T1", "m0")])
+    with pytest.raises(WriteQueueFull):
+        write_queue.submit("append", "T1", Message(Role.USER, "late"), result_timeout=0.1)
+    store.gate.set()
+    threads[0].join(5)
+    write_queue.submit("close", "T1")
+
+    # The timed-out message was never stored, so resending it is safe
+    assert results == {"first": True}
+    assert store.calls == [("append", ["m0"]), ("close", "T1")]
+
+
+def test_write_queue_refuses_when_full():
+    store = FakeStore()
+    write_queue = WriteQueue(store, max_size=1)
+    store.gate.clear()
+    _, threads = _submit_all(write_queue, [("first", "append", "T1", "m0"), ("queued", "append", "T1", "m1")])
+    with pytest.raises(WriteQueueFull):
+        write_queue.submit("append", "T1", Message(Role.USER, "m2"), timeout=0.05)
+    store.gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert store.calls == [("append", ["m0"]), ("append", ["m1"])]
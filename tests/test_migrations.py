@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from ticket_store import get_ticket_store
+
+# support_chat.json as the baseline app.py and admin.py left it: app.py's
+# {"tickets": {...}} wrapper, read back by admin.py as a pseudo-ticket named
+# "tickets", with app.py adding tickets inside it and admin.py keeping its own
+# flat TCKT-* entries next to it
+BASELINE_CHAT = {
+    "tickets": {
+        "messages": [
+            {
+                "role": "user",
+                "text": "{'messages': [{'sender': 'user', 'text': 'printer is offline', 'timestamp': 1735720000}]}",
+                "time": "",
+            }
+        ],
+        "closed": False,
+        "created_at": "2025-01-01 10:00:00.000000",
+        "TCKT-20250103-CCCCCC": {
+            "messages": [{"sender": "user", "text": "vpn drops", "timestamp": 1735950000}]
+        },
+        "TCKT-20250102-BBBBBB": {
+            "messages": [{"sender": "user", "text": "thanks, it works", "timestamp": 1735900000}]
+        },
+    },
+    "TCKT-20250102-BBBBBB": {
+        "messages": [{"role": "admin", "text": "hello from support", "time": "2025-01-02 09:00:00.000000"}],
+        "closed": False,
+        "created_at": "2025-01-02 08:59:00.000000",
+    },
+    "TCKT-20250101-DDDDDD": {
+        "messages": [{"role": "user", "text": "password reset", "time": "2025-01-01 12:00:00.000000"}],
+        "closed": True,
+        "created_at": "2025-01-01 11:59:00.000000",
+    },
+}
+
+
+@pytest.mark.parametrize("backend", ["log", "sqlite", "segments"])
+def test_migrate_baseline_chat_file(tmp_path, monkeypatch, backend):
+    monkeypatch.delenv("TICKET_DB", raising=False)
+    monkeypatch.delenv("TICKET_SEGMENTS_DIR", raising=False)
+    chat_file = tmp_path / "support_chat.json"
+    chat_file.write_text(json.dumps(BASELINE_CHAT, indent=2), encoding="utf-8")
+
+    store = get_ticket_store(str(chat_file), backend=backend)
+
+    tickets = store.all_tickets()
+    assert sorted(tickets) == ["TCKT-20250101-DDDDDD", "TCKT-20250102-BBBBBB", "TCKT-20250103-CCCCCC"]
+    merged = tickets["TCKT-20250102-BBBBBB"]
+    assert [(m.role, m.text) for m in merged.messages] == [
+        ("admin", "hello from support"),
+        ("user", "thanks, it works"),
+    ]
+    assert [m.seq for m in merged.messages] == [1, 2]
+    assert [m.text for m in tickets["TCKT-20250103-CCCCCC"].messages] == ["vpn drops"]
+    assert tickets["TCKT-20250101-DDDDDD"].closed
+    assert not merged.closed
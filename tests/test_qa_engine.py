@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import kb_cache
+import qa_engine
+from kb_index import IndexBuilder, MappedQAIndex
+from qa_engine import SEARCH_JS, AnswerCache, QAIndex, get_bot_response
+
+RECORDS = [
+    {"question": "How do I apply?", "answer": "Use the careers page."},
+    {"question": "How do I reset my password?", "answer": "Click 'Forgot password'."},
+    {"question": "Where is the office?", "answer": "Hyderabad."},
+]
+SUGGEST_RECORDS = RECORDS + [
+    {"question": "How does billing work?", "answer": "Monthly."},
+    {"question": "how do I apply", "answer": "Duplicate question, different case."},
+    {"question": "Où est le café ?", "answer": "Au coin."},
+    {"question": "???", "answer": "Nothing to normalize."},
+]
+SUGGEST_QUERIES = ["how", "How do", "how do ", "how do i a", "HOW DOES", "ou", "où est", "o", " ", "", "zzz", "where "]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(qa_engine.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_answer_cache_expires_entries(clock):
+    cache, index = AnswerCache(max_size=10, ttl=60), QAIndex(RECORDS)
+    cache.put(index, "apply", "careers")
+    clock[0] += 59
+    assert cache.get(index, "apply") == (True, "careers")
+    clock[0] += 2
+    assert cache.get(index, "apply") == (False, None)
+    assert len(cache) == 0
+
+
+def test_answer_cache_evicts_least_recently_used(clock):
+    cache, index = AnswerCache(max_size=2, ttl=60), QAIndex(RECORDS)
+    cache.put(index, "a", 1)
+    cache.put(index, "b", 2)
+    assert cache.get(index, "a") == (True, 1)
+    cache.put(index, "c", 3)
+    assert cache.get(index, "b") == (False, None)
+    assert cache.get(index, "a") == (True, 1)
+    assert cache.get(index, "c") == (True, 3)
+    assert cache.hits == 3 and cache.misses == 1
+
+
+def test_answer_cache_is_cleared_when_the_kb_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(qa_engine, "answer_cache", AnswerCache(max_size=10, ttl=60))
+    csv_path = tmp_path / "kb.csv"
+    index_path = str(tmp_path / "kb_index.bin")
+    csv_path.write_text("question,answer\nWhere is the office?,Hyderabad.\n", encoding="utf-8")
+    kb = kb_cache.load_knowledge_base(str(csv_path), index_path)
+    assert get_bot_response("where is the office", kb.index) == "Hyderabad."
+
+    csv_path.write_text("question,answer\nWhere is the office?,Bengaluru now.\n", encoding="utf-8")
+    os.utime(csv_path, ns=(0, os.stat(csv_path).st_mtime_ns + 10 ** 9))
+    kb = kb_cache.load_knowledge_base(str(csv_path), index_path)
+    assert get_bot_response("Where is the office?", kb.index) == "Bengaluru now."
+
+
+def test_suggest_prefixes():
+    index = QAIndex(SUGGEST_RECORDS)
+    assert index.suggest("how do") == ["How do I apply?", "How do I reset my password?", "How does billing work?"]
+    # A trailing space ends the word: "how do " is not a prefix of "how does"
+    assert index.suggest("How do ") == ["How do I apply?", "How do I reset my password?"]
+    assert index.suggest("how do i apply?!") == ["How do I apply?"]
+    assert index.suggest("où") == ["Où est le café ?"]
+    assert index.suggest("how", limit=1) == ["How do I apply?"]
+    assert index.suggest("") == index.suggest("  ") == index.suggest("?") == []
+
+
+def test_mapped_index_suggests_the_same(tmp_path):
+    builder = IndexBuilder(spool_dir=str(tmp_path))
+    for record in SUGGEST_RECORDS:
+        builder.add(record["question"], record["answer"])
+    builder.finish(str(tmp_path / "kb_index.bin"))
+    mapped, index = MappedQAIndex(str(tmp_path / "kb_index.bin")), QAIndex(SUGGEST_RECORDS)
+    for query in SUGGEST_QUERIES:
+        assert mapped.suggest(query) == index.suggest(query), query
+    assert mapped.to_payload()["suggest"] == index.to_payload()["suggest"]
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_search_js_matches_python():
+    index = QAIndex(SUGGEST_RECORDS)
+    lookups = [r["question"] for r in SUGGEST_RECORDS] + ["reset password", "office location", "billing", "nothing"]
+    script = SEARCH_JS + f"""
+const index = {json.dumps(index.to_payload())};
+const out = {{
+  suggest: {json.dumps(SUGGEST_QUERIES)}.map(q => qaSuggest(index, q, {qa_engine.SUGGEST_LIMIT})),
+  lookup: {json.dumps(lookups)}.map(q => qaLookup(index, q)),
+}};
+process.stdout.write(JSON.stringify(out));
+"""
+    result = json.loads(subprocess.run(["node", "-e", script], capture_output=True, check=True, text=True).stdout)
+    assert result["suggest"] == [index.suggest(q) for q in SUGGEST_QUERIES]
+    assert result["lookup"] == [index.lookup(q) for q in lookups]
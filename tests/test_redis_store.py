@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import migrations
+import redis_store
+from models import Message, Role
+from redis_store import RedisTicketStore
+from test_migrations import BASELINE_CHAT
+
+TID = "TCKT-20250101-AAAAAA"
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def _store(server, **kwargs):
+    return RedisTicketStore(fakeredis.FakeRedis(server=server), **kwargs)
+
+
+def _eventually(check, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_append_list_close_delete(server):
+    store = _store(server, listen=False)
+    store.append_message(TID, Message(Role.USER, "printer is offline", 1735720000))
+    store.append_message(TID, Message(Role.ADMIN, "restart it", 1735720060))
+
+    ticket = store.get_ticket(TID)
+    assert [(m.seq, m.role, m.text) for m in ticket.messages] == [
+        (1, "user", "printer is offline"),
+        (2, "admin", "restart it"),
+    ]
+    assert store.list_tickets(closed=False) == [TID]
+    assert store.ticket_version(TID) == 3
+
+    store.close_ticket(TID)
+    store.close_ticket(TID)
+    assert store.get_ticket_meta(TID).closed
+    assert store.list_tickets(closed=False) == []
+    assert store.list_tickets(closed=True) == [TID]
+    assert store.ticket_counts() == {"open": 0, "closed": 1}
+    assert store.ticket_version(TID) == 4
+
+    store.delete_ticket(TID)
+    assert store.get_ticket(TID) is None
+    assert store.list_tickets() == []
+    assert store.ticket_version(TID) == 0
+    assert store.search_messages("printer") == []
+
+
+def test_versions_follow_other_replicas(server):
+    writer, reader = _store(server), _store(server)
+    writer.append_message(TID, Message(Role.USER, "vpn drops", 1735720000))
+    assert reader.ticket_version(TID) == 2
+    list_version = reader.list_version()
+
+    # reader answers from its pub/sub cache, which writer's changes update
+    writer.append_message(TID, Message(Role.ADMIN, "which client?", 1735720060))
+    _eventually(lambda: reader.ticket_version(TID) == 3)
+    writer.close_ticket(TID)
+    _eventually(lambda: reader.list_version() > list_version)
+    writer.delete_ticket(TID)
+    _eventually(lambda: reader.ticket_version(TID) == 0)
+
+    writer.append_message(TID, Message(Role.USER, "vpn drops again", 1735720120))
+    _eventually(lambda: reader.ticket_version(TID) == 2)
+
+
+def test_delete_tombstone_ignores_late_versions(server):
+    store = _store(server, listen=False)
+    store._remember(TID, 5)
+    store._remember(TID, 0)
+    store._remember(TID, 6)
+    store._remember(TID, 1)
+    assert store._versions[TID] == 0
+    # The recreated ticket's creation message
+    store._remember(TID, 1, from_feed=True)
+    store._remember(TID, 2)
+    assert store._versions[TID] == 2
+
+
+def test_version_cache_is_bounded(server):
+    store = _store(server, listen=False, max_versions=2)
+    for i, tid in enumerate(["A", "B", "A", "C"], 1):
+        store._remember(tid, i)
+    assert list(store._versions.items()) == [("A", 3), ("C", 4)]
+
+
+def test_migrate_imports_legacy_chat_file(server, tmp_path):
+    chat_file = tmp_path / "support_chat.json"
+    chat_file.write_text(json.dumps(BASELINE_CHAT), encoding="utf-8")
+    store = _store(server, legacy_chat_file=str(chat_file))
+
+    assert migrations.migrate(store, str(chat_file))
+    assert store.schema_version() == migrations.SCHEMA_VERSION
+    assert not migrations.migrate(store, str(chat_file))
+
+    tickets = store.all_tickets()
+    assert sorted(tickets) == ["TCKT-20250101-DDDDDD", "TCKT-20250102-BBBBBB", "TCKT-20250103-CCCCCC"]
+    assert [m.text for m in tickets["TCKT-20250102-BBBBBB"].messages] == ["hello from support", "thanks, it works"]
+    assert tickets["TCKT-20250101-DDDDDD"].closed
+    assert [hit.ticket_id for hit in store.search_messages("vpn")] == ["TCKT-20250103-CCCCCC"]
+
+
+def test_migrate_waits_for_other_replica(server, monkeypatch):
+    monkeypatch.setattr(redis_store, "MIGRATE_POLL_SECONDS", 0.01)
+    store = _store(server, listen=False)
+    store.append_message(TID, Message(Role.USER, "vpn drops", 1735720000))
+    # Another replica is mid-migration
+    store.redis.set(store._key("migrate_lock"), 1)
+
+    results = []
+    migrating = threading.Thread(target=lambda: results.append(store.migrate(lambda t: t, 99)))
+    writing = threading.Thread(
+        target=lambda: store.append_message(TID, Message(Role.USER, "still down", 1735720060))
+    )
+    migrating.start()
+    writing.start()
+    time.sleep(0.1)
+    assert migrating.is_alive() and writing.is_alive()
+    assert len(store.get_ticket(TID).messages) == 1
+
+    # The other replica finishes
+    store.redis.set(store._key("schema_version"), 99)
+    store.redis.delete(store._key("migrate_lock"))
+    migrating.join(5)
+    writing.join(5)
+    assert results == [False]
+    assert [m.text for m in store.get_ticket(TID).messages] == ["vpn drops", "still down"]
+
+
+def test_search_messages(server):
+    store = _store(server, listen=False)
+    store.append_message(TID, Message(Role.USER, "VPN drops every hour", 1735720000))
+    store.append_message(TID, Message(Role.ADMIN, "Which VPN client do you use?", 1735720060))
+    store.append_message("TCKT-20250101-BBBBBB", Message(Role.USER, "printer offline", 1735800000))
+    store.close_ticket("TCKT-20250101-BBBBBB")
+
+    hits = store.search_messages("vpn dro")
+    assert [(h.ticket_id, h.seq, h.role) for h in hits] == [(TID, 1, "user")]
+    assert hits[0].snippet == "<mark>VPN</mark> <mark>drops</mark> every hour"
+    assert {h.seq for h in store.search_messages("vpn")} == {1, 2}
+    # The last word matches as a prefix, the others exactly
+    assert store.search_messages("print") != []
+    assert store.search_messages("print offline") == []
+
+    assert [h.ticket_id for h in store.search_messages("printer", closed=True)] == ["TCKT-20250101-BBBBBB"]
+    assert store.search_messages("printer", closed=False) == []
+    assert [h.seq for h in store.search_messages("vpn", since=1735720030)] == [2]
+    assert [h.seq for h in store.search_messages("vpn", until=1735720030)] == [1]
+
+    store.delete_ticket(TID)
+    assert store.search_messages("vpn") == []
+    assert int(store.redis.get(store._key("search:docs"))) == 1
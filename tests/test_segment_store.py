@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+import ticket_store
+from models import Message, Role
+
+TID = "TCKT-20250101-AAAAAA"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.delenv("TICKET_SEGMENTS_DIR", raising=False)
+    store = ticket_store.get_ticket_store(str(tmp_path / "support_chat.json"), backend="segments")
+    store.append_messages([(TID, Message(Role.USER, f"message {i}", 1735720000 + i)) for i in range(1, 31)])
+    return store
+
+
+def test_tail_reads(store):
+    page = store.get_messages(TID, limit=5)
+    assert [m.seq for m in page.messages] == [26, 27, 28, 29, 30]
+    assert [m.text for m in page.messages][-1] == "message 30"
+    assert page.has_older
+
+    older = store.get_messages(TID, limit=5, before=26)
+    assert [m.seq for m in older.messages] == [21, 22, 23, 24, 25]
+    first = store.get_messages(TID, limit=5, before=3)
+    assert [m.seq for m in first.messages] == [1, 2] and not first.has_older
+
+    messages, cursor = store.messages_since(TID, 27)
+    assert [m.seq for m in messages] == [28, 29, 30] and cursor == 30
+    assert store.messages_since(TID, 30) == ([], 30)
+    assert store.ticket_version(TID) == 31
+
+
+def test_torn_footer_is_recovered(store):
+    path = store._path(TID)
+    # A crash mid-append: the new record is half written and there is no footer
+    with open(path, "r+b") as f:
+        f.seek(store._segment(TID).end)
+        f.write(b"\x40\x00\x00\x00garbage")
+        f.truncate()
+
+    ticket = store.get_ticket(TID)
+    assert [m.seq for m in ticket.messages] == list(range(1, 31))
+    assert [m.seq for m in store.get_messages(TID, limit=2).messages] == [29, 30]
+
+    store.append_message(TID, Message(Role.ADMIN, "after the crash", 1735720100))
+    assert [(m.seq, m.text) for m in store.get_messages(TID, limit=2).messages] == [
+        (30, "message 30"),
+        (31, "after the crash"),
+    ]
+    assert store.ticket_version(TID) == 32
+
+
+def test_torn_record_is_dropped(store):
+    path = store._path(TID)
+    end = store._segment(TID).end
+    # The last message record is cut short along with the footer
+    with open(path, "r+b") as f:
+        f.truncate(end - 3)
+    assert os.path.getsize(path) == end - 3
+
+    assert [m.seq for m in store.get_ticket(TID).messages] == list(range(1, 30))
+    store.append_message(TID, Message(Role.USER, "resent", 1735720100))
+    assert [(m.seq, m.text) for m in store.get_messages(TID, limit=1).messages] == [(30, "resent")]
@@ -0,0 +1,26 @@
+import shutil
+
+from ticket_log import TicketLog
+
+
+def _texts(tickets, ticket_id):
+    return [m["text"] for m in tickets[ticket_id]["messages"]]
+
+
+def test_crash_between_snapshot_and_log_reset(tmp_path):
+    log = TicketLog(str(tmp_path / "support_chat.json"))
+    log.create_ticket("TCKT-20250101-AAAAAA", created_at=1)
+    log.append_message("TCKT-20250101-AAAAAA", {"role": "user", "text": "before", "ts": 2})
+
+    # Compaction wrote the snapshot but died before starting a new log
+    saved_log = tmp_path / "saved.log.jsonl"
+    shutil.copy(log.log_path, saved_log)
+    log.compact()
+    shutil.copy(saved_log, log.log_path)
+
+    log.append_message("TCKT-20250101-AAAAAA", {"role": "user", "text": "after", "ts": 3})
+    assert _texts(log.load(), "TCKT-20250101-AAAAAA") == ["before", "after"]
+
+    log.compact()
+    log.append_message("TCKT-20250101-AAAAAA", {"role": "admin", "text": "reply", "ts": 4})
+    assert _texts(log.load(), "TCKT-20250101-AAAAAA") == ["before", "after", "reply"]
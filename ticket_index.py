@@ -0,0 +1,135 @@
+import bisect
+from collections import namedtuple
+
+from models import format_day
+
+# ------------------------------
+# In-memory ticket indexes
+# ------------------------------
+# What the admin ticket lists need, kept up to date one ticket at a time
+# instead of being recomputed from every ticket on every refresh:
+#   open tickets    sorted by (last_activity, ticket_id), newest read first
+#   by status       sorted by (created_at, ticket_id), open and closed apart
+#   per-day counts  tickets opened / closed on each local calendar day
+# LogTicketStore calls update() for each ticket an event touched; SQLite keeps
+# the same information in indexed columns and a daily_counts table.
+
+DayCount = namedtuple("DayCount", "day opened closed")
+
+
+def ticket_summary(info):
+    # (created_at, last_activity, closed, closed_at) of a stored ticket dict
+    created_at = int(info.get("created_at", 0) or 0)
+    messages = info.get("messages") or []
+    last_activity = max(created_at, int(messages[-1].get("ts", 0) or 0)) if messages else created_at
+    closed = bool(info.get("closed"))
+    closed_at = int(info.get("closed_at", 0) or last_activity) if closed else 0
+    return created_at, last_activity, closed, closed_at
+
+
+def _page(rows, start, limit, query, step):
+    # Walks rows from start in direction step, keeping query matches, until
+    # limit + 1 have been seen
+    out = []
+    i = start
+    query = query.upper() if query else None
+    while 0 <= i < len(rows) and len(out) <= limit:
+        if query is None or query in rows[i][1].upper():
+            out.append(rows[i])
+        i += step
+    return out
+
+
+class TicketIndex:
+    def __init__(self):
+        self._summary = {}                     # ticket_id -> ticket_summary()
+        self._activity = []                    # open tickets: (last_activity, ticket_id)
+        self._created = {False: [], True: []}  # closed -> [(created_at, ticket_id)]
+        self._days = {}                        # "YYYY-MM-DD" -> [opened, closed]
+
+    @classmethod
+    def from_tickets(cls, tickets):
+        index = cls()
+        for ticket_id, info in tickets.items():
+            index.update(ticket_id, info)
+        return index
+
+    def __len__(self):
+        return len(self._summary)
+
+    def __contains__(self, ticket_id):
+        return ticket_id in self._summary
+
+    # ---- maintenance ----
+    def _count(self, ts, column, delta):
+        day = format_day(ts)
+        counts = self._days.setdefault(day, [0, 0])
+        counts[column] += delta
+        if counts == [0, 0]:
+            del self._days[day]
+
+    def _remove(self, ticket_id, summary):
+        created_at, last_activity, closed, closed_at = summary
+        rows = self._created[closed]
+        del rows[bisect.bisect_left(rows, (created_at, ticket_id))]
+        if not closed:
+            del self._activity[bisect.bisect_left(self._activity, (last_activity, ticket_id))]
+        self._count(created_at, 0, -1)
+        if closed:
+            self._count(closed_at, 1, -1)
+
+    def _add(self, ticket_id, summary):
+        created_at, last_activity, closed, closed_at = summary
+        bisect.insort(self._created[closed], (created_at, ticket_id))
+        if not closed:
+            bisect.insort(self._activity, (last_activity, ticket_id))
+        self._count(created_at, 0, 1)
+        if closed:
+            self._count(closed_at, 1, 1)
+
+    def update(self, ticket_id, info):
+        """Re-index one ticket from its stored dict; info=None removes it."""
+        old = self._summary.get(ticket_id)
+        new = ticket_summary(info) if isinstance(info, dict) else None
+        if old == new:
+            return
+        if old is not None:
+            self._remove(ticket_id, old)
+            del self._summary[ticket_id]
+        if new is not None:
+            self._add(ticket_id, new)
+            self._summary[ticket_id] = new
+
+    # ---- queries ----
+    def counts(self):
+        closed = len(self._created[True])
+        return {"open": len(self._summary) - closed, "closed": closed}
+
+    def list_tickets(self, closed=None):
+        if closed is None:
+            return [tid for _, tid in sorted(self._created[False] + self._created[True])]
+        return [tid for _, tid in self._created[bool(closed)]]
+
+    def tickets_page(self, closed, after=None, limit=20, query=None):
+        # Same contract as TicketStore.list_tickets_page, for one status
+        rows = self._created[bool(closed)]
+        start = bisect.bisect_right(rows, tuple(after)) if after is not None else 0
+        page = _page(rows, start, limit, query, 1)
+        return [tid for _, tid in page[:limit]], (page[limit - 1] if len(page) > limit else None)
+
+    def closed_before(self, cutoff):
+        # A ticket is created before it is closed, so only the closed rows
+        # created by the cutoff can qualify
+        rows = self._created[True]
+        candidates = rows[:bisect.bisect_right(rows, (cutoff, "\uffff"))]
+        return [tid for _, tid in candidates if self._summary[tid][3] <= cutoff]
+
+    def active_page(self, after=None, limit=20, query=None):
+        # Open tickets, most recently active first; cursor is (last_activity, ticket_id)
+        rows = self._activity
+        start = bisect.bisect_left(rows, tuple(after)) - 1 if after is not None else len(rows) - 1
+        page = _page(rows, start, limit, query, -1)
+        return [tid for _, tid in page[:limit]], (page[limit - 1] if len(page) > limit else None)
+
+    def daily_counts(self, days=14):
+        return [DayCount(day, *self._days[day]) for day in sorted(self._days, reverse=True)[:days]]
@@ -0,0 +1,239 @@
+import os
+import uuid
+from contextlib import contextmanager
+
+import metrics
+from models import dumps, loads, now_ts
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# ------------------------------
+# Append-only ticket event log
+# ------------------------------
+# support_chat.json is the snapshot; every change since the last snapshot
+# lives in support_chat.log.jsonl as one JSON event per line:
+#   {"type": "ticket_created", "ticket_id": ..., "created_at": ...}
+#   {"type": "message_appended", "ticket_id": ..., "message": {...}}
+#   {"type": "ticket_closed", "ticket_id": ..., "ts": ...}
+#   {"type": "ticket_deleted", "ticket_id": ...}   (moved to the archive)
+# The log starts with a "log_started" header carrying a random log_id. A
+# snapshot records the log_id and byte offset it has folded in, so a crash
+# between writing the snapshot and resetting the log never applies the same
+# events twice, and events appended to that log afterwards are still read.
+
+COMPACT_THRESHOLD_BYTES = 256 * 1024
+
+
+@contextmanager
+def _file_lock(lock_path):
+    with open(lock_path, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _encode(event):
+    return dumps(event) + b"\n"
+
+
+def apply_event(tickets, event):
+    ticket_id = event.get("ticket_id")
+    if not ticket_id:
+        return
+    kind = event.get("type")
+    if kind == "ticket_created":
+        tickets.setdefault(ticket_id, {
+            "messages": [],
+            "closed": False,
+            "created_at": event.get("created_at", 0),
+        })
+    elif kind == "message_appended":
+        ticket = tickets.setdefault(ticket_id, {
+            "messages": [],
+            "closed": False,
+            "created_at": event.get("message", {}).get("ts", 0),
+        })
+        messages = ticket.setdefault("messages", [])
+        messages.append(dict(event.get("message", {}), seq=len(messages) + 1))
+    elif kind == "ticket_closed":
+        ticket = tickets.get(ticket_id)
+        if ticket is not None and not ticket.get("closed"):
+            ticket["closed"] = True
+            if event.get("ts"):
+                ticket["closed_at"] = event["ts"]
+    elif kind == "ticket_deleted":
+        # Conditional deletes carry the version they were issued against
+        ticket = tickets.get(ticket_id)
+        if "version" not in event or (ticket is not None and ticket_version(ticket) == event["version"]):
+            tickets.pop(ticket_id, None)
+
+
+def ticket_version(ticket):
+    # LogTicketStore.ticket_version() of a stored ticket dict
+    return 1 + 2 * len(ticket.get("messages", [])) + int(bool(ticket.get("closed")))
+
+
+class TicketLog:
+    def __init__(self, snapshot_path, log_path=None, compact_threshold=COMPACT_THRESHOLD_BYTES):
+        self.snapshot_path = snapshot_path
+        base, _ = os.path.splitext(snapshot_path)
+        self.log_path = log_path or base + ".log.jsonl"
+        self.lock_path = self.log_path + ".lock"
+        self.compact_threshold = compact_threshold
+
+    # ---- reads ----
+    def _read_snapshot(self):
+        # -> (tickets, (log_id, offset) folded into the snapshot, schema_version)
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                data = f.read()
+            metrics.inc("store_bytes_read_total", len(data), backend="log", file="snapshot")
+            raw = loads(data)
+        except (FileNotFoundError, ValueError):
+            return {}, (None, None), 0
+        if not isinstance(raw, dict):
+            return {}, (None, None), 0
+        if isinstance(raw.get("tickets"), dict) and ("log_id" in raw or "schema_version" in raw):
+            folded = (raw.get("log_id"), raw.get("log_offset"))
+            return raw["tickets"], folded, int(raw.get("schema_version", 0))
+        # Anything else is a legacy layout (older app.py/admin.py also used a
+        # "tickets" key); migrations.normalize_legacy sorts it out
+        return raw, (None, None), 0
+
+    def schema_version(self):
+        return self._read_snapshot()[2]
+
+    def read_events(self, offset=0):
+        """Events in the log after byte offset -> (log_id or None, events, end offset).
+        A torn trailing line is left unread, so the next call picks it up once complete."""
+        log_id, events = None, []
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return None, [], 0
+        data = data[:data.rfind(b"\n") + 1]
+        metrics.inc("store_bytes_read_total", len(data), backend="log", file="log")
+        for line in data.splitlines():
+            try:
+                event = loads(line)
+            except ValueError:
+                # Damaged line; everything around it is intact
+                continue
+            if event.get("type") == "log_started":
+                log_id = event.get("log_id")
+            else:
+                events.append(event)
+        return log_id, events, offset + len(data)
+
+    def _replay(self, tickets, folded):
+        # Applies the log events the snapshot does not cover -> (log_id, end offset)
+        log_id, events, offset = self.read_events()
+        folded_log_id, folded_offset = folded
+        if log_id is not None and log_id == folded_log_id:
+            # Compaction stopped between writing the snapshot and resetting
+            # the log: only what was appended after the snapshot is new
+            # (snapshots without log_offset covered the whole log)
+            events = []
+            if folded_offset is not None:
+                _, events, offset = self.read_events(folded_offset)
+        for event in events:
+            apply_event(tickets, event)
+        return log_id, offset
+
+    def load_state(self):
+        """-> (tickets, log offset the state covers)."""
+        tickets, folded, _ = self._read_snapshot()
+        _, offset = self._replay(tickets, folded)
+        return tickets, offset
+
+    def load(self):
+        return self.load_state()[0]
+
+    # ---- writes ----
+    def append(self, event):
+        self.append_many([event])
+
+    def append_many(self, events):
+        # One lock acquisition and one write() for the whole batch
+        with _file_lock(self.lock_path):
+            fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size == 0:
+                    os.write(fd, _encode({"type": "log_started", "log_id": uuid.uuid4().hex}))
+                data = b"".join(_encode(event) for event in events)
+                os.write(fd, data)
+                metrics.inc("store_bytes_written_total", len(data), backend="log", file="log")
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            if size >= self.compact_threshold:
+                self._compact_locked()
+
+    def create_ticket(self, ticket_id, created_at=None):
+        self.append({
+            "type": "ticket_created",
+            "ticket_id": ticket_id,
+            "created_at": created_at or now_ts(),
+        })
+
+    def append_message(self, ticket_id, message):
+        self.append({"type": "message_appended", "ticket_id": ticket_id, "message": message})
+
+    def close_ticket(self, ticket_id):
+        self.append({"type": "ticket_closed", "ticket_id": ticket_id, "ts": now_ts()})
+
+    def delete_ticket(self, ticket_id, version=None):
+        event = {"type": "ticket_deleted", "ticket_id": ticket_id}
+        if version is not None:
+            event["version"] = version
+        self.append(event)
+
+    def compact(self, transform=None, schema_version=None):
+        # transform(tickets) -> tickets lets a migration rewrite the state in
+        # the same locked step that folds the log into the snapshot
+        with _file_lock(self.lock_path):
+            self._compact_locked(transform, schema_version)
+
+    def _compact_locked(self, transform=None, schema_version=None):
+        tickets, folded, current_version = self._read_snapshot()
+        if schema_version is not None and current_version >= schema_version:
+            # Another process finished the migration first
+            transform, schema_version = None, current_version
+        log_id, offset = self._replay(tickets, folded)
+        if transform is not None:
+            tickets = transform(tickets)
+        snapshot = {
+            "schema_version": current_version if schema_version is None else schema_version,
+            "log_id": log_id,
+            "log_offset": offset,
+            "tickets": tickets,
+        }
+
+        tmp_path = self.snapshot_path + ".tmp"
+        data = dumps(snapshot)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        metrics.inc("store_bytes_written_total", len(data), backend="log", file="snapshot")
+
+        # The snapshot now covers this log; start a fresh one
+        with open(self.log_path, "wb") as f:
+            f.write(_encode({"type": "log_started", "log_id": uuid.uuid4().hex}))
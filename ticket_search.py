@@ -0,0 +1,172 @@
+import html
+import re
+import unicodedata
+from collections import namedtuple
+
+# ------------------------------
+# Full-text search over ticket messages
+# ------------------------------
+# An SQLite FTS5 inverted index over every message's text. SqliteTicketStore
+# keeps these tables in its own database and fills them in the same
+# transaction as each append; LogTicketStore keeps them in a separate
+# <chat file>.search.db that it catches up from the event log before a search.
+#   search_docs  one row per message: ticket_id, seq, ts, role, text
+#   search_fts   external-content FTS5 index over search_docs.text, kept in
+#                step by triggers
+# Ranking is FTS5's bm25(); filters (open/closed via the tickets table, date
+# range via search_docs.ts) are applied inside the same query.
+# Stores without SQLite (redis_store.py) keep their own inverted index and use
+# terms() / query_terms() / highlight() for the same tokens and snippets.
+
+# snippet is HTML: the escaped message text around the matches, which are
+# wrapped in <mark>
+SearchHit = namedtuple("SearchHit", "ticket_id seq ts role snippet score closed")
+
+SNIPPET_TOKENS = 12
+
+# Statements are run one by one (triggers contain ';'), so migrations can
+# create them inside an open transaction
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS search_docs (
+        id        INTEGER PRIMARY KEY,
+        ticket_id TEXT NOT NULL,
+        seq       INTEGER NOT NULL,
+        ts        INTEGER NOT NULL DEFAULT 0,
+        role      TEXT NOT NULL DEFAULT 'user',
+        text      TEXT NOT NULL,
+        UNIQUE (ticket_id, seq)
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+        text, content='search_docs', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS search_docs_insert AFTER INSERT ON search_docs BEGIN
+        INSERT INTO search_fts (rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_docs_delete AFTER DELETE ON search_docs BEGIN
+        INSERT INTO search_fts (search_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+]
+# Ticket status for the open/closed filter, for databases without a tickets table
+STATUS_SCHEMA = """CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id TEXT PRIMARY KEY,
+    closed    INTEGER NOT NULL DEFAULT 0
+)"""
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def create_schema(conn):
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+
+def drop_schema(conn):
+    conn.execute("DROP TABLE IF EXISTS search_fts")
+    conn.execute("DROP TABLE IF EXISTS search_docs")
+
+
+def index_messages(conn, rows):
+    """rows: (ticket_id, seq, ts, role, text); already indexed (ticket_id, seq) are skipped."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO search_docs (ticket_id, seq, ts, role, text) VALUES (?, ?, ?, ?, ?)", rows
+    )
+
+
+def message_rows(ticket_id, messages):
+    # Stored message dicts -> index_messages() rows
+    return [
+        (ticket_id, m.get("seq") or seq, int(m.get("ts", 0) or 0), m.get("role", "user"), m.get("text", ""))
+        for seq, m in enumerate(messages, 1)
+    ]
+
+
+def delete_ticket(conn, ticket_id):
+    conn.execute("DELETE FROM search_docs WHERE ticket_id = ?", (ticket_id,))
+
+
+def _fold(word):
+    # What FTS5's unicode61 tokenizer (remove_diacritics) indexes for a word
+    return "".join(c for c in unicodedata.normalize("NFKD", word.lower()) if not unicodedata.combining(c))
+
+
+def terms(text):
+    return [_fold(word) for word in _WORD.findall(text)]
+
+
+def query_terms(text):
+    # -> (terms that must match exactly, term that must match as a prefix),
+    # the same reading of the search box as fts_query()
+    words = terms(text)
+    return (words[:-1], words[-1]) if words else ([], None)
+
+
+def highlight(text, query):
+    """FTS5-style snippet of text for query: escaped HTML, matches in <mark>."""
+    exact, prefix = query_terms(query)
+    exact = set(exact)
+    words = list(_WORD.finditer(text))
+    if not words:
+        return html.escape(text)
+
+    def is_match(word):
+        term = _fold(word)
+        return term in exact or (prefix is not None and term.startswith(prefix))
+
+    first = next((i for i, w in enumerate(words) if is_match(w.group())), 0)
+    lo = max(0, min(first - SNIPPET_TOKENS // 4, len(words) - SNIPPET_TOKENS))
+    hi = min(len(words), lo + SNIPPET_TOKENS)
+    out = ["…" if lo > 0 else html.escape(text[:words[0].start()])]
+    for i in range(lo, hi):
+        if i > lo:
+            out.append(html.escape(text[words[i - 1].end():words[i].start()]))
+        word = words[i].group()
+        out.append(f"<mark>{html.escape(word)}</mark>" if is_match(word) else html.escape(word))
+    out.append(html.escape(text[words[-1].end():]) if hi == len(words) else "…")
+    return "".join(out)
+
+
+def fts_query(text):
+    # Free text -> FTS5 query: every word must match, the last one as a
+    # prefix so results follow the search box as it is typed
+    words = _WORD.findall(text)
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(conn, query, closed=None, since=None, until=None, limit=20):
+    """Best-ranked messages matching query -> [SearchHit]; since/until are epoch bounds."""
+    match = fts_query(query)
+    if match is None:
+        return []
+    clauses, params = ["search_fts MATCH ?"], [match]
+    if closed is not None:
+        clauses.append("COALESCE(t.closed, 0) = ?")
+        params.append(int(closed))
+    if since is not None:
+        clauses.append("d.ts >= ?")
+        params.append(int(since))
+    if until is not None:
+        clauses.append("d.ts < ?")
+        params.append(int(until))
+    rows = conn.execute(
+        "SELECT d.ticket_id, d.seq, d.ts, d.role, "
+        f"snippet(search_fts, 0, char(2), char(3), '…', {SNIPPET_TOKENS}), "
+        "bm25(search_fts), COALESCE(t.closed, 0) "
+        "FROM search_fts JOIN search_docs d ON d.id = search_fts.rowid "
+        "LEFT JOIN tickets t ON t.ticket_id = d.ticket_id "
+        f"WHERE {' AND '.join(clauses)} ORDER BY bm25(search_fts) LIMIT ?",
+        (*params, limit),
+    ).fetchall()
+    # bm25() is lower-is-better; flip it so higher scores rank first
+    return [
+        SearchHit(tid, seq, ts, role, _snippet_html(snippet), -score, bool(c))
+        for tid, seq, ts, role, snippet, score, c in rows
+    ]
+
+
+def _snippet_html(snippet):
+    # Matches come back between \x02 and \x03, which survive html.escape()
+    return html.escape(snippet or "").replace("\x02", "<mark>").replace("\x03", "</mark>")
@@ -0,0 +1,770 @@
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+import metrics
+import ticket_search
+from migrations import migrate
+from models import Message, Ticket, dumps, format_day, loads, now_ts
+from ticket_index import DayCount, TicketIndex, ticket_summary
+from ticket_log import TicketLog, apply_event, ticket_version
+
+# ------------------------------
+# Pluggable ticket store
+# ------------------------------
+# Both app.py and admin.py talk to the store through this interface:
+#   get_ticket(ticket_id)            -> models.Ticket or None
+#   list_tickets(closed=None)        -> [ticket_id, ...] oldest first
+#   create_ticket(ticket_id, created_at=None)
+#   append_message(ticket_id, message: models.Message)
+#   append_messages([(ticket_id, message), ...])   (one batched write)
+#   close_ticket(ticket_id)
+#   delete_ticket(ticket_id, version=None) -> whether it deleted; with version,
+#                                    only if ticket_version() still equals it
+#                                    (archive.py, once a ticket is archived)
+#   all_tickets()                    -> {ticket_id: models.Ticket}
+#   ticket_version(ticket_id)        -> int, bumped on every change to the ticket
+#   list_version()                   -> changes whenever a ticket is created or closed
+#   schema_version() / migrate(transform, version)  -> see migrations.py
+#   get_ticket_meta(ticket_id)       -> Ticket without its messages, or None
+#   get_messages(ticket_id, limit=, before=) / get_messages(ticket_id, start=)
+#                                    -> MessagePage (cursor-based range reads)
+#   list_tickets_page(closed, after=None, limit=, query=None) -> TicketPage
+#   messages_since(ticket_id, since=0, limit=)  -> ([Message with seq > since], last seq)
+#   list_active_page(after=None, limit=, query=None) -> TicketPage of open tickets,
+#                                    most recently active first
+#   list_closed_before(cutoff)       -> [ticket_id] closed at or before cutoff (epoch)
+#   ticket_counts()                  -> {"open": n, "closed": n}
+#   daily_counts(days=14)            -> [DayCount(day, opened, closed)], newest day first
+#   search_messages(query, closed=None, since=None, until=None, limit=20)
+#                                    -> [ticket_search.SearchHit], best match first
+# Select the backend with TICKET_STORE=sqlite (default), TICKET_STORE=log,
+# TICKET_STORE=segments for one tail-readable file per ticket (segment_store.py),
+# or TICKET_STORE=redis for several replicas sharing one store (redis_store.py).
+
+# Every message has a per-ticket sequence number (Message.seq: 1, 2, 3, ...).
+# messages: ascending; cursor: seq of messages[0] (pass it as `before` for the
+# previous page or `start` to re-read from there); has_older: whether
+# anything precedes messages[0]
+MessagePage = namedtuple("MessagePage", "messages cursor has_older")
+# ticket_ids in (created_at, ticket_id) order, or (last_activity, ticket_id)
+# descending for list_active_page; next_cursor is None on the last page
+TicketPage = namedtuple("TicketPage", "ticket_ids next_cursor")
+
+
+def _seq_window(count, limit, before, start):
+    # List slice [lo, hi) for a seq-based page when seq == index + 1
+    if start is not None:
+        return min(max(start - 1, 0), count), count
+    hi = count if before is None else min(max(before - 1, 0), count)
+    return max(0, hi - limit), hi
+
+
+class TicketStore:
+    def get_ticket(self, ticket_id):
+        raise NotImplementedError
+
+    def list_tickets(self, closed=None):
+        raise NotImplementedError
+
+    def create_ticket(self, ticket_id, created_at=None):
+        raise NotImplementedError
+
+    def append_message(self, ticket_id, message):
+        raise NotImplementedError
+
+    def append_messages(self, items):
+        for ticket_id, message in items:
+            self.append_message(ticket_id, message)
+
+    def close_ticket(self, ticket_id):
+        raise NotImplementedError
+
+    def delete_ticket(self, ticket_id, version=None):
+        raise NotImplementedError
+
+    def all_tickets(self):
+        return {tid: self.get_ticket(tid) for tid in self.list_tickets()}
+
+    def ticket_version(self, ticket_id):
+        raise NotImplementedError
+
+    def list_version(self):
+        raise NotImplementedError
+
+    def schema_version(self):
+        raise NotImplementedError
+
+    def migrate(self, transform, schema_version):
+        raise NotImplementedError
+
+    # Generic range reads over get_ticket(); backends override these with
+    # storage-level queries where they can
+    def get_ticket_meta(self, ticket_id):
+        ticket = self.get_ticket(ticket_id)
+        if ticket is None:
+            return None
+        return Ticket(ticket.ticket_id, [], ticket.closed, ticket.created_at)
+
+    def get_messages(self, ticket_id, limit=50, before=None, start=None):
+        ticket = self.get_ticket(ticket_id)
+        messages = ticket.messages if ticket else []
+        lo, hi = _seq_window(len(messages), limit, before, start)
+        return MessagePage(messages[lo:hi], lo + 1, lo > 0)
+
+    def messages_since(self, ticket_id, since=0, limit=100):
+        # Delta read: only what came after the caller's last seen seq
+        ticket = self.get_ticket(ticket_id)
+        messages = ticket.messages[since:since + limit] if ticket else []
+        return messages, since + len(messages)
+
+    def list_tickets_page(self, closed=None, after=None, limit=20, query=None):
+        rows = []
+        for tid in self.list_tickets(closed):
+            if query and query.upper() not in tid.upper():
+                continue
+            meta = self.get_ticket_meta(tid)
+            rows.append((meta.created_at, tid))
+        rows.sort()
+        if after is not None:
+            rows = [row for row in rows if row > tuple(after)]
+        page = rows[:limit]
+        next_cursor = page[-1] if len(rows) > limit else None
+        return TicketPage([tid for _, tid in page], next_cursor)
+
+    # Generic ticket-list views, built from every ticket on each call;
+    # backends keep these incrementally
+    def _index(self):
+        return TicketIndex.from_tickets({tid: t.to_dict() for tid, t in self.all_tickets().items()})
+
+    def list_active_page(self, after=None, limit=20, query=None):
+        return TicketPage(*self._index().active_page(after, limit, query))
+
+    def list_closed_before(self, cutoff):
+        return self._index().closed_before(cutoff)
+
+    def ticket_counts(self):
+        return self._index().counts()
+
+    def daily_counts(self, days=14):
+        return self._index().daily_counts(days)
+
+    def search_messages(self, query, closed=None, since=None, until=None, limit=20):
+        raise NotImplementedError
+
+
+# Events the search index of a LogTicketStore may lag behind by before it is
+# rebuilt from the full state instead
+SEARCH_PENDING_MAX = 10000
+
+
+class LogTicketStore(TicketStore):
+    """Ticket store backed by the JSON snapshot + append-only event log."""
+
+    def __init__(self, chat_file):
+        self.log = TicketLog(chat_file)
+        self._state_key = None
+        self._state = {}
+        self._state_index = TicketIndex()
+        self._log_offset = 0
+        self._state_lock = threading.Lock()
+        # Full-text index in <chat file>.search.db, caught up lazily on search
+        self.search_path = os.path.splitext(chat_file)[0] + ".search.db"
+        self._search_local = threading.local()
+        self._search_pending = []
+        self._search_stale = True
+
+    def _file_key(self):
+        key = []
+        for path in (self.log.snapshot_path, self.log.log_path):
+            try:
+                st = os.stat(path)
+                key.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                key.append(None)
+        return tuple(key)
+
+    def _refresh(self):
+        # A new snapshot (compaction, migration) means a full replay; a log
+        # that only grew is read from where the last refresh stopped, and
+        # only the tickets its events touched are re-indexed
+        key = self._file_key()
+        with self._state_lock:
+            if key == self._state_key:
+                return
+            if self._state_key is not None and key[0] == self._state_key[0] and key[1] is not None:
+                log_id, events, self._log_offset = self.log.read_events(self._log_offset)
+                if log_id is not None:
+                    # The log was started over without a new snapshot
+                    self._refresh_locked_full(key)
+                    return
+                for event in events:
+                    apply_event(self._state, event)
+                    ticket_id = event.get("ticket_id")
+                    if ticket_id:
+                        info = self._state.get(ticket_id)
+                        self._state_index.update(ticket_id, info)
+                        if not self._search_stale:
+                            self._search_pending.append(self._search_change(event, ticket_id, info))
+                if len(self._search_pending) > SEARCH_PENDING_MAX:
+                    self._search_stale, self._search_pending = True, []
+            else:
+                self._refresh_locked_full(key)
+            self._state_key = key
+
+    def _refresh_locked_full(self, key):
+        self._state, self._log_offset = self.log.load_state()
+        self._state_index = TicketIndex.from_tickets(self._state)
+        self._state_key = key
+        self._search_stale, self._search_pending = True, []
+
+    def _tickets(self):
+        self._refresh()
+        return self._state
+
+    def _index(self):
+        self._refresh()
+        return self._state_index
+
+    def get_ticket(self, ticket_id):
+        info = self._tickets().get(ticket_id)
+        return Ticket.from_dict(ticket_id, info) if isinstance(info, dict) else None
+
+    def list_tickets(self, closed=None):
+        return self._index().list_tickets(closed)
+
+    def list_tickets_page(self, closed=None, after=None, limit=20, query=None):
+        if closed is None:
+            return super().list_tickets_page(closed, after, limit, query)
+        return TicketPage(*self._index().tickets_page(closed, after, limit, query))
+
+    def all_tickets(self):
+        return {
+            tid: Ticket.from_dict(tid, info) for tid, info in self._tickets().items() if isinstance(info, dict)
+        }
+
+    def get_ticket_meta(self, ticket_id):
+        info = self._tickets().get(ticket_id)
+        if not isinstance(info, dict):
+            return None
+        return Ticket(ticket_id, [], bool(info.get("closed")), int(info.get("created_at", 0)))
+
+    def get_messages(self, ticket_id, limit=50, before=None, start=None):
+        # Slices the cached state and only decodes the requested page
+        info = self._tickets().get(ticket_id)
+        raw = info.get("messages", []) if isinstance(info, dict) else []
+        lo, hi = _seq_window(len(raw), limit, before, start)
+        return MessagePage([Message.from_dict(m, lo + i + 1) for i, m in enumerate(raw[lo:hi])], lo + 1, lo > 0)
+
+    def messages_since(self, ticket_id, since=0, limit=100):
+        # Messages are stored in seq order, so the delta is a list slice
+        info = self._tickets().get(ticket_id)
+        raw = info.get("messages", [])[since:since + limit] if isinstance(info, dict) else []
+        return [Message.from_dict(m, since + i + 1) for i, m in enumerate(raw)], since + len(raw)
+
+    def ticket_version(self, ticket_id):
+        info = self._tickets().get(ticket_id)
+        return ticket_version(info) if isinstance(info, dict) else 0
+
+    def list_version(self):
+        counts = self._index().counts()
+        return (counts["open"] + counts["closed"], counts["closed"])
+
+    def schema_version(self):
+        return self.log.schema_version()
+
+    def migrate(self, transform, schema_version):
+        if self.log.schema_version() >= schema_version:
+            return False
+        self.log.compact(transform, schema_version)
+        return True
+
+    def create_ticket(self, ticket_id, created_at=None):
+        self.log.create_ticket(ticket_id, created_at)
+
+    def append_message(self, ticket_id, message):
+        self.log.append_message(ticket_id, message.to_dict())
+
+    def append_messages(self, items):
+        self.log.append_many([
+            {"type": "message_appended", "ticket_id": ticket_id, "message": message.to_dict()}
+            for ticket_id, message in items
+        ])
+
+    def close_ticket(self, ticket_id):
+        self.log.close_ticket(ticket_id)
+
+    def delete_ticket(self, ticket_id, version=None):
+        if ticket_id not in self._tickets():
+            return False
+        # A versioned delete event is skipped on replay unless the ticket is
+        # still at that version, so a message appended in between wins
+        self.log.delete_ticket(ticket_id, version)
+        return ticket_id not in self._tickets()
+
+    @staticmethod
+    def _search_change(event, ticket_id, info):
+        # (ticket_id, closed or None if deleted, rows to index), captured as
+        # the event is applied; apply_event has just numbered a new message
+        if info is None:
+            return ticket_id, None, []
+        rows = []
+        if event.get("type") == "message_appended" and info["messages"]:
+            rows = ticket_search.message_rows(ticket_id, info["messages"][-1:])
+        return ticket_id, bool(info.get("closed")), rows
+
+    def _search_conn(self):
+        conn = getattr(self._search_local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.search_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                ticket_search.create_schema(conn)
+                conn.execute(ticket_search.STATUS_SCHEMA)
+            self._search_local.conn = conn
+        return conn
+
+    def _sync_search(self, conn):
+        # Brings the search database up to the in-memory state. Rows are
+        # keyed on (ticket_id, seq), so processes sharing the file can replay
+        # the same events without duplicating anything
+        with self._state_lock:
+            stale, pending = self._search_stale, self._search_pending
+            self._search_stale, self._search_pending = False, []
+            tickets = self._state
+            if stale:
+                rows = [
+                    row for tid, info in tickets.items() for row in ticket_search.message_rows(tid, info["messages"])
+                ]
+                statuses = [(tid, int(bool(info.get("closed")))) for tid, info in tickets.items()]
+        with conn:
+            if stale:
+                ticket_search.index_messages(conn, rows)
+                conn.executemany(
+                    "INSERT INTO tickets (ticket_id, closed) VALUES (?, ?) "
+                    "ON CONFLICT (ticket_id) DO UPDATE SET closed = excluded.closed",
+                    statuses,
+                )
+                for (tid,) in conn.execute("SELECT ticket_id FROM tickets").fetchall():
+                    if tid not in tickets:
+                        ticket_search.delete_ticket(conn, tid)
+                        conn.execute("DELETE FROM tickets WHERE ticket_id = ?", (tid,))
+                return
+            for tid, closed, rows in pending:
+                if closed is None:
+                    ticket_search.delete_ticket(conn, tid)
+                    conn.execute("DELETE FROM tickets WHERE ticket_id = ?", (tid,))
+                    continue
+                conn.execute(
+                    "INSERT INTO tickets (ticket_id, closed) VALUES (?, ?) "
+                    "ON CONFLICT (ticket_id) DO UPDATE SET closed = excluded.closed",
+                    (tid, int(closed)),
+                )
+                ticket_search.index_messages(conn, rows)
+
+    def search_messages(self, query, closed=None, since=None, until=None, limit=20):
+        self._refresh()
+        conn = self._search_conn()
+        self._sync_search(conn)
+        return ticket_search.search(conn, query, closed, since, until, limit)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id     TEXT PRIMARY KEY,
+    closed        INTEGER NOT NULL DEFAULT 0,
+    created_at    INTEGER NOT NULL DEFAULT 0,
+    version       INTEGER NOT NULL DEFAULT 0,
+    last_activity INTEGER NOT NULL DEFAULT 0,
+    closed_at     INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket_id TEXT NOT NULL,
+    seq       INTEGER NOT NULL DEFAULT 0,
+    body      BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_counts (
+    day    TEXT PRIMARY KEY,
+    opened INTEGER NOT NULL DEFAULT 0,
+    closed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_closed_page ON tickets (closed, created_at, ticket_id);
+CREATE INDEX IF NOT EXISTS idx_tickets_activity ON tickets (closed, last_activity, ticket_id);
+CREATE INDEX IF NOT EXISTS idx_tickets_created_at ON tickets (created_at);
+CREATE INDEX IF NOT EXISTS idx_messages_seq ON messages (ticket_id, seq);
+"""
+
+
+def _like_pattern(query):
+    # Substring match with LIKE's own wildcards escaped
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class SqliteTicketStore(TicketStore):
+    """Ticket store in an embedded SQLite database (WAL mode)."""
+
+    def __init__(self, db_path, legacy_chat_file=None):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connect() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(messages)")]
+            if columns and "seq" not in columns:
+                # Pre-seq database; migrations.upgrade_to_seq numbers the rows
+                conn.execute("ALTER TABLE messages ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(tickets)")]
+            if columns and "last_activity" not in columns:
+                # Filled in by the schema 4 migration (migrations.upgrade_to_activity)
+                conn.execute("ALTER TABLE tickets ADD COLUMN last_activity INTEGER NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE tickets ADD COLUMN closed_at INTEGER NOT NULL DEFAULT 0")
+            conn.executescript(SCHEMA)
+            ticket_search.create_schema(conn)
+            # Superseded by idx_tickets_closed_page / idx_messages_seq
+            conn.execute("DROP INDEX IF EXISTS idx_tickets_closed")
+            conn.execute("DROP INDEX IF EXISTS idx_messages_ticket")
+        self.legacy_chat_file = legacy_chat_file
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _meta(self, conn, key):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def schema_version(self):
+        return int(self._meta(self._connect(), "schema_version") or 0)
+
+    def migrate(self, transform, schema_version):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if int(self._meta(conn, "schema_version") or 0) >= schema_version:
+                return False
+            tickets = {}
+            for tid, closed, created_at, closed_at in conn.execute(
+                "SELECT ticket_id, closed, created_at, closed_at FROM tickets"
+            ):
+                tickets[tid] = {"messages": [], "closed": bool(closed), "created_at": created_at}
+                if closed_at:
+                    tickets[tid]["closed_at"] = closed_at
+            for tid, body in conn.execute("SELECT ticket_id, body FROM messages ORDER BY ticket_id, seq, id"):
+                tickets.setdefault(tid, {"messages": [], "closed": False, "created_at": ""})["messages"].append(
+                    loads(body)
+                )
+            # One-off copy of support_chat.json (+ its event log) into the database
+            if self.legacy_chat_file and self._meta(conn, "legacy_imported") is None:
+                for tid, info in TicketLog(self.legacy_chat_file).load().items():
+                    tickets.setdefault(tid, info)
+                conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_imported', ?)", (str(datetime.now()),))
+
+            tickets = transform(tickets)
+            # Rebuild the tables so column types follow the current SCHEMA
+            conn.execute("DROP TABLE messages")
+            conn.execute("DROP TABLE tickets")
+            conn.execute("DROP TABLE daily_counts")
+            ticket_search.drop_schema(conn)
+            for statement in SCHEMA.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            ticket_search.create_schema(conn)
+            for tid, info in tickets.items():
+                messages = info.get("messages", [])
+                created_at, last_activity, closed, closed_at = ticket_summary(info)
+                conn.execute(
+                    "INSERT INTO tickets (ticket_id, closed, created_at, version, last_activity, closed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (tid, int(closed), created_at, 1 + len(messages), last_activity, closed_at),
+                )
+                conn.executemany(
+                    "INSERT INTO messages (ticket_id, seq, body) VALUES (?, ?, ?)",
+                    [(tid, seq, dumps(m)) for seq, m in enumerate(messages, 1)],
+                )
+                ticket_search.index_messages(conn, ticket_search.message_rows(tid, messages))
+            conn.executemany(
+                "INSERT INTO daily_counts (day, opened, closed) VALUES (?, ?, ?)",
+                [tuple(row) for row in TicketIndex.from_tickets(tickets).daily_counts(days=None)],
+            )
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('schema_version', ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (str(schema_version),),
+            )
+            self._bump_list_version(conn)
+        return True
+
+    def get_ticket(self, ticket_id):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT closed, created_at FROM tickets WHERE ticket_id = ?", (ticket_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        rows = conn.execute(
+            "SELECT seq, body FROM messages WHERE ticket_id = ? ORDER BY seq", (ticket_id,)
+        ).fetchall()
+        metrics.inc("store_bytes_read_total", sum(len(body) for _, body in rows), backend="sqlite", file="db")
+        return Ticket(ticket_id, [Message.from_dict(loads(body), seq) for seq, body in rows], bool(row[0]), row[1])
+
+    def get_ticket_meta(self, ticket_id):
+        row = self._connect().execute(
+            "SELECT closed, created_at FROM tickets WHERE ticket_id = ?", (ticket_id,)
+        ).fetchone()
+        return Ticket(ticket_id, [], bool(row[0]), row[1]) if row else None
+
+    def get_messages(self, ticket_id, limit=50, before=None, start=None):
+        # Cursors are seqs; every query walks idx_messages_seq
+        conn = self._connect()
+        if start is not None:
+            rows = conn.execute(
+                "SELECT seq, body FROM messages WHERE ticket_id = ? AND seq >= ? ORDER BY seq", (ticket_id, start)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT seq, body FROM messages WHERE ticket_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (ticket_id, before if before is not None else 2 ** 63 - 1, limit),
+            ).fetchall()
+            rows.reverse()
+        if not rows:
+            return MessagePage([], start if start is not None else before, False)
+        metrics.inc("store_bytes_read_total", sum(len(body) for _, body in rows), backend="sqlite", file="db")
+        # Seqs are dense from 1, so anything older exists iff the first seq > 1
+        cursor = rows[0][0]
+        return MessagePage([Message.from_dict(loads(body), seq) for seq, body in rows], cursor, cursor > 1)
+
+    def messages_since(self, ticket_id, since=0, limit=100):
+        rows = self._connect().execute(
+            "SELECT seq, body FROM messages WHERE ticket_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (ticket_id, since, limit),
+        ).fetchall()
+        metrics.inc("store_bytes_read_total", sum(len(body) for _, body in rows), backend="sqlite", file="db")
+        return [Message.from_dict(loads(body), seq) for seq, body in rows], (rows[-1][0] if rows else since)
+
+    def list_tickets_page(self, closed=None, after=None, limit=20, query=None):
+        clauses, params = [], []
+        if closed is not None:
+            clauses.append("closed = ?")
+            params.append(int(closed))
+        if after is not None:
+            clauses.append("(created_at, ticket_id) > (?, ?)")
+            params.extend(after)
+        if query:
+            clauses.append("ticket_id LIKE ? ESCAPE '\\'")
+            params.append(_like_pattern(query))
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT created_at, ticket_id FROM tickets {where} ORDER BY created_at, ticket_id LIMIT ?",
+            (*params, limit + 1),
+        ).fetchall()
+        page = rows[:limit]
+        next_cursor = tuple(page[-1]) if len(rows) > limit else None
+        return TicketPage([tid for _, tid in page], next_cursor)
+
+    def list_active_page(self, after=None, limit=20, query=None):
+        # Walks idx_tickets_activity backwards from the cursor
+        clauses, params = ["closed = 0"], []
+        if after is not None:
+            clauses.append("(last_activity, ticket_id) < (?, ?)")
+            params.extend(after)
+        if query:
+            clauses.append("ticket_id LIKE ? ESCAPE '\\'")
+            params.append(_like_pattern(query))
+        rows = self._connect().execute(
+            f"SELECT last_activity, ticket_id FROM tickets WHERE {' AND '.join(clauses)} "
+            "ORDER BY last_activity DESC, ticket_id DESC LIMIT ?",
+            (*params, limit + 1),
+        ).fetchall()
+        page = rows[:limit]
+        next_cursor = tuple(page[-1]) if len(rows) > limit else None
+        return TicketPage([tid for _, tid in page], next_cursor)
+
+    def list_closed_before(self, cutoff):
+        # Range scan on idx_tickets_activity; closed_at >= last_activity
+        rows = self._connect().execute(
+            "SELECT ticket_id FROM tickets WHERE closed = 1 AND last_activity <= ? AND closed_at <= ?",
+            (cutoff, cutoff),
+        ).fetchall()
+        return [tid for (tid,) in rows]
+
+    def ticket_counts(self):
+        # daily_counts is small (one row per day), so this never touches tickets
+        opened, closed = self._connect().execute(
+            "SELECT COALESCE(SUM(opened), 0), COALESCE(SUM(closed), 0) FROM daily_counts"
+        ).fetchone()
+        return {"open": opened - closed, "closed": closed}
+
+    def daily_counts(self, days=14):
+        rows = self._connect().execute(
+            "SELECT day, opened, closed FROM daily_counts WHERE opened != 0 OR closed != 0 "
+            "ORDER BY day DESC LIMIT ?",
+            (days if days is not None else -1,),
+        ).fetchall()
+        return [DayCount(*row) for row in rows]
+
+    def search_messages(self, query, closed=None, since=None, until=None, limit=20):
+        return ticket_search.search(self._connect(), query, closed, since, until, limit)
+
+    def list_tickets(self, closed=None):
+        conn = self._connect()
+        if closed is None:
+            rows = conn.execute("SELECT ticket_id FROM tickets ORDER BY created_at").fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT ticket_id FROM tickets WHERE closed = ? ORDER BY created_at", (int(closed),)
+            ).fetchall()
+        return [tid for (tid,) in rows]
+
+    def _bump_list_version(self, conn):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('list_version', '1') "
+            "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def _count_day(self, conn, ts, column, delta):
+        # column is "opened" or "closed"
+        conn.execute(
+            f"INSERT INTO daily_counts (day, {column}) VALUES (?, ?) "
+            f"ON CONFLICT (day) DO UPDATE SET {column} = {column} + excluded.{column}",
+            (format_day(ts), delta),
+        )
+
+    def _insert_ticket(self, conn, ticket_id, created_at):
+        created_at = created_at or now_ts()
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO tickets (ticket_id, closed, created_at, version, last_activity) "
+            "VALUES (?, 0, ?, 1, ?)",
+            (ticket_id, created_at, created_at),
+        )
+        if cur.rowcount:
+            self._bump_list_version(conn)
+            self._count_day(conn, created_at, "opened", 1)
+
+    def create_ticket(self, ticket_id, created_at=None):
+        conn = self._connect()
+        with conn:
+            self._insert_ticket(conn, ticket_id, created_at)
+
+    def append_message(self, ticket_id, message):
+        self.append_messages([(ticket_id, message)])
+
+    def append_messages(self, items):
+        # One transaction (one WAL commit) for the whole batch
+        conn = self._connect()
+        with conn:
+            last_seq = {}
+            for ticket_id, _ in items:
+                if ticket_id not in last_seq:
+                    # The INSERT takes the write lock, so the MAX(seq) below
+                    # cannot race another writer
+                    self._insert_ticket(conn, ticket_id, None)
+                    last_seq[ticket_id] = conn.execute(
+                        "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE ticket_id = ?", (ticket_id,)
+                    ).fetchone()[0]
+            rows, touched, search_rows = [], [], []
+            for ticket_id, message in items:
+                last_seq[ticket_id] += 1
+                message.seq = last_seq[ticket_id]
+                rows.append((ticket_id, message.seq, dumps(message.to_dict())))
+                touched.append((message.ts, ticket_id))
+                search_rows.append((ticket_id, message.seq, message.ts, message.role.value, message.text))
+            conn.executemany("INSERT INTO messages (ticket_id, seq, body) VALUES (?, ?, ?)", rows)
+            ticket_search.index_messages(conn, search_rows)
+            conn.executemany(
+                "UPDATE tickets SET version = version + 1, last_activity = MAX(last_activity, ?) WHERE ticket_id = ?",
+                touched,
+            )
+        metrics.inc("store_bytes_written_total", sum(len(body) for _, _, body in rows), backend="sqlite", file="db")
+
+    def close_ticket(self, ticket_id):
+        conn = self._connect()
+        closed_at = now_ts()
+        with conn:
+            cur = conn.execute(
+                "UPDATE tickets SET closed = 1, closed_at = ?, version = version + 1 "
+                "WHERE ticket_id = ? AND closed = 0",
+                (closed_at, ticket_id),
+            )
+            if cur.rowcount:
+                self._bump_list_version(conn)
+                self._count_day(conn, closed_at, "closed", 1)
+
+    def delete_ticket(self, ticket_id, version=None):
+        conn = self._connect()
+        with conn:
+            # Write lock first, so the version cannot change after the check
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT created_at, closed, closed_at, version FROM tickets WHERE ticket_id = ?", (ticket_id,)
+            ).fetchone()
+            if version is not None and (row is None or row[3] != version):
+                return False
+            conn.execute("DELETE FROM messages WHERE ticket_id = ?", (ticket_id,))
+            ticket_search.delete_ticket(conn, ticket_id)
+            cur = conn.execute("DELETE FROM tickets WHERE ticket_id = ?", (ticket_id,))
+            if cur.rowcount:
+                self._bump_list_version(conn)
+                created_at, closed, closed_at, _ = row
+                self._count_day(conn, created_at, "opened", -1)
+                if closed:
+                    self._count_day(conn, closed_at, "closed", -1)
+            return bool(cur.rowcount)
+
+    def ticket_version(self, ticket_id):
+        row = self._connect().execute(
+            "SELECT version FROM tickets WHERE ticket_id = ?", (ticket_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def list_version(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'list_version'").fetchone()
+        return int(row[0]) if row else 0
+
+
+# ------------------------------
+# Process-wide store registry
+# ------------------------------
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_ticket_store(chat_file, backend=None, auto_migrate=True):
+    backend = (backend or os.getenv("TICKET_STORE", "sqlite")).lower()
+    chat_file = os.path.abspath(chat_file)
+    key = (backend, chat_file)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            if backend == "log":
+                store = LogTicketStore(chat_file)
+            elif backend == "sqlite":
+                db_path = os.getenv("TICKET_DB") or os.path.splitext(chat_file)[0] + ".db"
+                store = SqliteTicketStore(db_path, legacy_chat_file=chat_file)
+            elif backend == "segments":
+                from segment_store import SegmentTicketStore
+
+                root = os.getenv("TICKET_SEGMENTS_DIR") or os.path.splitext(chat_file)[0] + ".segments"
+                store = SegmentTicketStore(root, legacy_chat_file=chat_file)
+            elif backend == "redis":
+                from redis_store import RedisTicketStore
+
+                store = RedisTicketStore.from_url(legacy_chat_file=chat_file)
+            else:
+                raise ValueError(f"Unknown TICKET_STORE backend: {backend}")
+            if auto_migrate:
+                # One-time upgrade; afterwards this is a single meta read per process
+                migrate(store, chat_file)
+            _stores[key] = store
+        return store
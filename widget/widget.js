@@ -0,0 +1,269 @@
+// Chat widget, served as a Streamlit component (see assets.build_widget).
+// Streamlit passes a small config on every rerun:
+//   {kb_url, kb_gz_url, fallback_kb_url, fallback_kb_gz_url, category,
+//    support_url, api_url, support_rate: {per_minute, burst}}
+// The knowledge base itself is a content-hashed static JSON file that the
+// browser fetches (and caches) once per KB version. With a category selected,
+// kb_url is that category's index and fallback_kb_url the global one, which
+// is fetched only the first time a question misses. The same payloads drive
+// the type-ahead suggestions under the chat input (qaSuggest).
+
+function sendToStreamlit(type, data) {
+  window.parent.postMessage(Object.assign({isStreamlitMessage: true, type: type}, data), "*");
+}
+
+function setComponentValue(value) {
+  sendToStreamlit("streamlit:setComponentValue", {value: value, dataType: "json"});
+}
+
+let config = {};
+// url -> promise of the parsed payload
+const kbLoading = new Map();
+
+async function fetchKnowledgeBase(url, gzUrl) {
+  // Prefer the pre-compressed copy when the browser can inflate it
+  if (gzUrl && typeof DecompressionStream !== "undefined") {
+    try {
+      const res = await fetch(gzUrl);
+      if (res.ok) {
+        const stream = res.body.pipeThrough(new DecompressionStream("gzip"));
+        return await new Response(stream).json();
+      }
+    } catch (e) {
+      // fall through to the plain file
+    }
+  }
+  const res = await fetch(url);
+  return await res.json();
+}
+
+function loadKnowledgeBase(url, gzUrl) {
+  if (!url) return Promise.resolve(null);
+  if (!kbLoading.has(url)) {
+    const promise = fetchKnowledgeBase(url, gzUrl).catch(() => {
+      kbLoading.delete(url);
+      return null;
+    });
+    kbLoading.set(url, promise);
+  }
+  return kbLoading.get(url);
+}
+
+window.addEventListener("message", event => {
+  if (!event.data || event.data.type !== "streamlit:render") return;
+  config = event.data.args || {};
+  loadKnowledgeBase(config.kb_url, config.kb_gz_url);
+});
+
+const botBtn = document.getElementById('bot-button');
+const chatBox = document.getElementById('chat-box');
+const supportBox = document.getElementById('support-box');
+const chatLog = document.getElementById('chat-log');
+const chatInput = document.getElementById('chat-input');
+const chatSend = document.getElementById('chat-send');
+const chatSuggest = document.getElementById('chat-suggest');
+const techBtn = document.getElementById('tech-btn');
+const supportLog = document.getElementById('support-log');
+const supportInput = document.getElementById('support-input');
+const supportSend = document.getElementById('support-send');
+const backBtn = document.getElementById('back-btn');
+const robot = document.getElementById('robot');
+const greeting = document.getElementById('greeting');
+
+async function findAnswer(query) {
+  const cfg = config;
+  const qa = await loadKnowledgeBase(cfg.kb_url, cfg.kb_gz_url);
+  const answer = qa ? qaLookup(qa, query) : null;
+  if (answer !== null || !cfg.fallback_kb_url) return answer;
+  const all = await loadKnowledgeBase(cfg.fallback_kb_url, cfg.fallback_kb_gz_url);
+  return all ? qaLookup(all, query) : null;
+}
+
+const SUGGEST_LIMIT = 8;  // qa_engine.SUGGEST_LIMIT
+const SUGGEST_MIN_CHARS = 2;
+let suggestActive = -1;
+let suggestSeq = 0;
+
+async function findSuggestions(text) {
+  const cfg = config;
+  const qa = await loadKnowledgeBase(cfg.kb_url, cfg.kb_gz_url);
+  const found = qa ? qaSuggest(qa, text, SUGGEST_LIMIT) : [];
+  if (found.length || !cfg.fallback_kb_url) return found;
+  const all = await loadKnowledgeBase(cfg.fallback_kb_url, cfg.fallback_kb_gz_url);
+  return all ? qaSuggest(all, text, SUGGEST_LIMIT) : [];
+}
+
+function renderSuggestions(questions) {
+  chatSuggest.innerHTML = '';
+  suggestActive = -1;
+  for (const question of questions) {
+    const item = document.createElement('div');
+    item.className = 'suggestion';
+    item.setAttribute('role', 'option');
+    item.textContent = question;
+    // mousedown fires before the input loses focus
+    item.addEventListener('mousedown', e => {
+      e.preventDefault();
+      pickSuggestion(question);
+    });
+    chatSuggest.appendChild(item);
+  }
+  chatSuggest.style.display = questions.length ? 'block' : 'none';
+}
+
+function moveSuggestion(step) {
+  const items = chatSuggest.children;
+  if (!items.length) return;
+  if (suggestActive >= 0) items[suggestActive].classList.remove('active');
+  suggestActive = (suggestActive + step + items.length + 1) % (items.length + 1) - 1;
+  if (suggestActive >= 0) items[suggestActive].classList.add('active');
+}
+
+function pickSuggestion(question) {
+  chatInput.value = question;
+  handleSend();
+}
+
+chatInput.addEventListener('input', async () => {
+  // Answers can arrive out of order while a KB payload loads; keep the newest
+  const seq = ++suggestSeq;
+  const text = chatInput.value;
+  const found = text.trim().length >= SUGGEST_MIN_CHARS ? await findSuggestions(text) : [];
+  if (seq === suggestSeq) renderSuggestions(found);
+});
+
+async function fetchAnswer(query) {
+  // With api_url set, answers come from api_server.py; the local index is
+  // the fallback when the API is unreachable
+  if (config.api_url) {
+    try {
+      let url = config.api_url.replace(/\/$/, "") + "/answer?q=" + encodeURIComponent(query);
+      if (config.category) url += "&category=" + encodeURIComponent(config.category);
+      const res = await fetch(url);
+      if (res.ok) {
+        const data = await res.json();
+        return data.hit ? data.answer : null;
+      }
+    } catch (e) {
+      // fall back to the browser-side lookup
+    }
+  }
+  return await findAnswer(query);
+}
+
+function showGreetingOnce() {
+  // show greeting bubble briefly
+  greeting.style.display = 'block';
+  setTimeout(() => { greeting.style.display = 'none'; }, 1800);
+}
+
+function doWaveOnce() {
+  // add class that triggers the animation once, then remove it
+  robot.classList.add('wave-once');
+  // ensure it'll be removable after animation ends
+  setTimeout(() => { robot.classList.remove('wave-once'); }, 1400);
+}
+
+// initial friendly wave + greeting when the page loads
+window.addEventListener('load', () => {
+  // short delay so animation is noticeable
+  setTimeout(() => {
+    showGreetingOnce();
+    doWaveOnce();
+  }, 700);
+});
+
+botBtn.addEventListener('click', () => {
+  // wave on click and toggle chat
+  doWaveOnce();
+  if (chatBox.style.display === 'none' || chatBox.style.display === '') {
+    chatBox.style.display = 'flex';
+    chatLog.innerHTML = '<div class="chat-message bot"><b>Bot:</b> Hi, how can I help you?</div>';
+  } else {
+    chatBox.style.display = 'none';
+  }
+});
+
+async function handleSend() {
+  const text = chatInput.value.trim();
+  suggestSeq++;
+  renderSuggestions([]);
+  if (!text) return;
+  chatLog.innerHTML += '<div class="chat-message"><b>You:</b> ' + text + '</div>';
+  chatInput.value = '';
+  const answer = await fetchAnswer(text);
+  const reply = answer ? answer : "Sorry, I don’t have an answer for this.";
+  chatLog.innerHTML += '<div class="chat-message bot"><b>Bot:</b> ' + reply + '</div>';
+  chatLog.scrollTop = chatLog.scrollHeight;
+  if (reply.includes("Sorry")) {
+    techBtn.style.display = 'block';
+  }
+}
+
+techBtn.addEventListener('click', () => {
+  if (config.support_url) window.open(config.support_url);
+});
+
+chatSend.addEventListener('click', handleSend);
+chatInput.addEventListener('keydown', e => {
+  if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+    e.preventDefault();
+    moveSuggestion(e.key === 'ArrowDown' ? 1 : -1);
+  } else if (e.key === 'Escape') {
+    suggestSeq++;
+    renderSuggestions([]);
+  } else if (e.key === 'Enter') {
+    if (suggestActive >= 0) pickSuggestion(chatSuggest.children[suggestActive].textContent);
+    else handleSend();
+  }
+});
+
+techBtn.addEventListener('click', () => {
+  chatBox.style.display = 'none';
+  supportBox.style.display = 'flex';
+});
+
+backBtn.addEventListener('click', () => {
+  supportBox.style.display = 'none';
+  chatBox.style.display = 'flex';
+});
+
+// Same token bucket app.py enforces per session (backpressure.py), so a
+// too-fast sender is told right away and keeps the typed text
+const supportBucket = {tokens: null, updated: 0};
+
+function supportWaitSeconds() {
+  const rate = config.support_rate;
+  if (!rate || !rate.per_minute) return 0;
+  const now = Date.now();
+  if (supportBucket.tokens === null) supportBucket.tokens = rate.burst;
+  supportBucket.tokens = Math.min(rate.burst, supportBucket.tokens + (now - supportBucket.updated) / 60000 * rate.per_minute);
+  supportBucket.updated = now;
+  if (supportBucket.tokens >= 1) {
+    supportBucket.tokens -= 1;
+    return 0;
+  }
+  return Math.ceil((1 - supportBucket.tokens) * 60 / rate.per_minute);
+}
+
+function handleSupportSend() {
+  const text = supportInput.value.trim();
+  if (!text) return;
+  const wait = supportWaitSeconds();
+  if (wait) {
+    supportLog.innerHTML += '<div class="chat-message notice">⏳ Please slow down — try again in ' + wait + 's.</div>';
+    supportLog.scrollTop = supportLog.scrollHeight;
+    return;
+  }
+  supportLog.innerHTML += '<div class="chat-message"><b>You:</b> ' + text + '</div>';
+  supportInput.value = '';
+  supportLog.scrollTop = supportLog.scrollHeight;
+  // Component values persist across reruns; the nonce lets app.py save each message once
+  setComponentValue({kind: "support", text: text, nonce: Date.now() + ":" + Math.random()});
+}
+
+supportSend.addEventListener('click', handleSupportSend);
+supportInput.addEventListener('keydown', e => { if (e.key === 'Enter') handleSupportSend(); });
+
+sendToStreamlit("streamlit:componentReady", {apiVersion: 1});
+sendToStreamlit("streamlit:setFrameHeight", {height: 700});